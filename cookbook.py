@@ -208,12 +208,20 @@ def process2site(site, siteprop, sitevalue, process1, process2, proprop, provalu
 
 # SCENARIO LIST GENERATORS
 
+def with_grid_point(scenario, point):
+    # Store the position of the scenario in the parameter grid, which
+    # runNEIS.nearest_solved uses to pick the warm start of a scenario.
+    scenario.grid_point = point
+    return scenario
+
+
 def scen_1d_paramvar(scen_param, prop, min, max, steps):
 
     scenario_list = []
 
-    for index in np.linspace(min, max, steps):
-        scenario_list.append(scen_param(prop, index))
+    for i, index in enumerate(np.linspace(min, max, steps)):
+        scenario = scen_param(prop, index)
+        scenario_list.append(with_grid_point(scenario, (i,)))
     
     return scenario_list
 
@@ -223,8 +231,9 @@ def scen_1d_log10paramvar(scen_param, prop, min, max, steps):
 
     scenario_list = []
 
-    for index in np.logspace(min, max, steps):
-        scenario_list.append(scen_param(prop, index))
+    for i, index in enumerate(np.logspace(min, max, steps)):
+        scenario = scen_param(prop, index)
+        scenario_list.append(with_grid_point(scenario, (i,)))
     
     return scenario_list
     
@@ -234,9 +243,10 @@ def scen_2d_paramvar(scen_param, prop1, min1, max1, steps1,
 
     scenario_list = []
 
-    for index2 in np.linspace(min2, max2, steps2):
-        for index1 in np.linspace(min1, max1, steps1):
-            scenario_list.append(scen_param(prop1, prop2, index1, index2))
+    for i2, index2 in enumerate(np.linspace(min2, max2, steps2)):
+        for i1, index1 in enumerate(np.linspace(min1, max1, steps1)):
+            scenario = scen_param(prop1, prop2, index1, index2)
+            scenario_list.append(with_grid_point(scenario, (i1, i2)))
     
     return scenario_list
 
@@ -247,9 +257,10 @@ def scen_2d_log10paramvar(scen_param, prop1, min1, max1, steps1,
 
     scenario_list = []
 
-    for index2 in np.logspace(min2, max2, steps2):
-        for index1 in np.logspace(min1, max1, steps1):
-            scenario_list.append(scen_param(prop1, prop2, index1, index2))
+    for i2, index2 in enumerate(np.logspace(min2, max2, steps2)):
+        for i1, index1 in enumerate(np.logspace(min1, max1, steps1)):
+            scenario = scen_param(prop1, prop2, index1, index2)
+            scenario_list.append(with_grid_point(scenario, (i1, i2)))
     
     return scenario_list
 
@@ -260,9 +271,10 @@ def scen_2d_linlog10paramvar(scen_param, prop1, min1, max1, steps1,
 
     scenario_list = []
 
-    for index2 in np.logspace(min2, max2, steps2):
-        for index1 in np.linspace(min1, max1, steps1):
-            scenario_list.append(scen_param(prop1, prop2, index1, index2))
+    for i2, index2 in enumerate(np.logspace(min2, max2, steps2)):
+        for i1, index1 in enumerate(np.linspace(min1, max1, steps1)):
+            scenario = scen_param(prop1, prop2, index1, index2)
+            scenario_list.append(with_grid_point(scenario, (i1, i2)))
     
     return scenario_list
     
\ No newline at end of file
@@ -2,9 +2,11 @@ import os
 import pandas as pd
 import pyomo.environ
 import shutil
+import time
 import urbs
 import cookbook as cb
 from datetime import datetime
+from pyomo.contrib.appsi.solvers import Highs
 from pyomo.opt.base import SolverFactory
 
 
@@ -23,7 +25,10 @@ def prepare_result_directory(result_name):
 
 def setup_solver(optim, logfile='solver.log'):
     """ """
-    if optim.name == 'gurobi':
+    if is_persistent(optim):
+        # appsi solvers have no name attribute, but a config
+        optim.config.logfile = logfile
+    elif optim.name == 'gurobi':
         # reference with list of option names
         # http://www.gurobi.com/documentation/5.6/reference-manual/parameters
         optim.set_options("logfile={}".format(logfile))
@@ -41,8 +46,142 @@ def setup_solver(optim, logfile='solver.log'):
     return optim
 
 
+def is_persistent(optim):
+    """ True for a persistent solver like 'appsi_highs' or 'appsi_gurobi',
+    which keeps the model between solves and re-optimizes from the previous
+    basis """
+    return hasattr(optim, 'update_config')
+
+
+def restrict_solver_update(optim, params_only):
+    """ restrict the model update of a persistent solver to the changed
+    values of mutable Params, i.e. objective and constraint coefficients and
+    RHS values, if the model structure is unchanged (c.f. urbs.update_model)
+    """
+    for option in ['check_for_new_or_removed_constraints',
+                   'check_for_new_or_removed_vars',
+                   'check_for_new_or_removed_params',
+                   'check_for_new_objective',
+                   'update_constraints',
+                   'update_vars',
+                   'update_named_expressions',
+                   'update_objective']:
+        setattr(optim.update_config, option, not params_only)
+    return optim
+
+
+def is_highs(optim):
+    """ True for the persistent HiGHS solver 'appsi_highs' (whose
+    SolverFactory class is a subclass of appsi's Highs), the only solver
+    whose basis and iteration count are read (c.f. get_basis) """
+    return isinstance(optim, Highs)
+
+
+def highs_model(optim):
+    """ the highspy object of a persistent HiGHS solver
+
+    appsi offers no public API for the basis and the iteration count, so
+    they are read from the private attribute _solver_model; fails loudly if
+    a Pyomo version no longer has it.
+    """
+    highs = getattr(optim, '_solver_model', None)
+    if highs is None:
+        raise AttributeError("appsi_highs solver has no _solver_model; the "
+                             "basis cannot be read or set with this Pyomo "
+                             "version")
+    return highs
+
+
+def get_basis(optim):
+    """ final simplex basis of the last solve of a persistent HiGHS solver;
+    None for other solvers (only HiGHS is supported, c.f. highs_model) """
+    if not is_highs(optim):
+        return None
+    return highs_model(optim).getBasis()
+
+
+def get_iterations(optim):
+    """ simplex iterations of the last solve of a persistent HiGHS solver;
+    None for other solvers (only HiGHS is supported, c.f. highs_model) """
+    if not is_highs(optim):
+        return None
+    return highs_model(optim).getInfo().simplex_iteration_count
+
+
+def nearest_solved(scenario, solved):
+    """ find the solved scenario that is closest to a given scenario
+
+    Distances are measured between the grid_point attributes that the sweep
+    generators in cookbook.py attach to their scenarios. Without grid points,
+    the last solved scenario is used.
+
+    Args:
+        scenario: a scenario function
+        solved: list of already solved scenario functions, in solve order
+
+    Returns:
+        the nearest solved scenario, the latest one among equally near ones;
+        None if solved is empty
+    """
+    if not solved:
+        return None
+    point = getattr(scenario, 'grid_point', None)
+    candidates = [s for s in reversed(solved)
+                  if point is not None and
+                  len(getattr(s, 'grid_point', ())) == len(point)]
+    if not candidates:
+        return solved[-1]
+    return min(candidates,
+               key=lambda s: sum((a - b) ** 2
+                                 for a, b in zip(s.grid_point, point)))
+
+
+def snake_key(point):
+    """ sort key for a grid point that runs through the grid row by row in
+    alternating direction, so consecutive points are always neighbours """
+    key = []
+    higher = 0  # sum of the outer coordinates decides the direction
+    for index in reversed(point):
+        key.append(-index if higher % 2 else index)
+        higher += index
+    return tuple(key)
+
+
+def order_scenarios(scenarios, order='nearest'):
+    """ order scenarios so that each solve can start from a similar solution
+
+    Args:
+        scenarios: list of scenario functions
+        order: 'given' keeps the list order; 'nearest' follows a greedy
+               nearest-neighbour path through the grid points (c.f.
+               nearest_solved), starting with the first scenario; 'snake'
+               runs through the grid row by row in alternating direction
+
+    Returns:
+        list of the scenario functions in solve order
+    """
+    scenarios = list(scenarios)
+    if order == 'given':
+        return scenarios
+    elif order == 'snake':
+        return sorted(scenarios,
+                      key=lambda s: snake_key(getattr(s, 'grid_point', ())))
+    elif order == 'nearest':
+        path = scenarios[:1]
+        remaining = scenarios[1:]
+        while remaining:
+            # reversed, so that ties go to the first remaining scenario
+            nearest = nearest_solved(path[-1], remaining[::-1])
+            remaining.remove(nearest)
+            path.append(nearest)
+        return path
+    else:
+        raise ValueError("Unknown scenario order '{}'".format(order))
+
+
 def run_scenario(input_file, timesteps, scenario, result_dir,
-                 plot_tuples=None, plot_periods=None, report_tuples=None):
+                 plot_tuples=None, plot_periods=None, report_tuples=None,
+                 prob=None, optim=None, basis=None, profile=False):
     """ run an urbs model for given input, time steps and scenario
 
     Args:
@@ -53,6 +192,18 @@ def run_scenario(input_file, timesteps, scenario, result_dir,
         plot_tuples: (optional) list of plot tuples (c.f. urbs.result_figures)
         plot_periods: (optional) dict of plot periods (c.f. urbs.result_figures)
         report_tuples: (optional) list of (sit, com) tuples (c.f. urbs.report)
+        prob: (optional) model instance of a previous run_scenario call; is
+              updated in place if the scenario only changes mutable
+              parameter values (c.f. urbs.update_model)
+        optim: (optional) solver to use; a persistent solver (c.f.
+               is_persistent) passed to each call keeps the model in memory
+               and only receives the changed parameter values
+        basis: (optional) simplex basis (c.f. get_basis) to start from if
+               prob is updated in place; else the persistent solver starts
+               from its last basis; only used with HiGHS (c.f. is_highs)
+        profile: (optional) set True to write the build profile of a newly
+                 created model to <scenario>-build.csv next to the solver
+                 log (c.f. urbs.build_profile)
 
     Returns:
         the urbs model instance
@@ -63,17 +214,41 @@ def run_scenario(input_file, timesteps, scenario, result_dir,
     data = urbs.read_excel(input_file)
     data = scenario(data)
 
-    # create model
-    prob = urbs.create_model(data, timesteps)
+    # update model of previous scenario or create model
+    updated = False
+    if prob is not None and list(prob.timesteps) == list(timesteps):
+        try:
+            prob = urbs.update_model(prob, data)
+            updated = True
+        except urbs.StructuralChange as change:
+            # model must be created anew, which also resets the model kept
+            # by a persistent solver
+            print("Rebuilding model for scenario '{}': {}".format(sce,
+                                                                 change))
+    if not updated:
+        prob = urbs.create_model(data, timesteps, mutable=True,
+                                 profile=profile)
 
     # refresh time stamp string and create filename for logfile
     now = prob.created
     log_filename = os.path.join(result_dir, '{}.log').format(sce)
+    if profile and not updated:
+        urbs.build_profile(
+            prob, os.path.join(result_dir, '{}-build.csv').format(sce))
 
     # solve model and read results
-    optim = SolverFactory('gurobi')  # cplex, glpk, gurobi, ...
+    if optim is None:
+        optim = SolverFactory('gurobi')  # cplex, glpk, gurobi, ...
     optim = setup_solver(optim, logfile=log_filename)
+    if is_persistent(optim):
+        optim = restrict_solver_update(optim, params_only=updated)
+        if updated and basis is not None and is_highs(optim):
+            # transfer changed values before setting the start basis
+            optim.update()
+            highs_model(optim).setBasis(basis)
+    start = time.time()
     result = optim.solve(prob, tee=True)
+    prob.solve_time = time.time() - start
 
     # copy input file to result directory
     shutil.copyfile(input_file, os.path.join(result_dir, input_file))
@@ -97,6 +272,92 @@ def run_scenario(input_file, timesteps, scenario, result_dir,
         figure_size=(24, 9))
     return prob
 
+
+def run_scenarios(input_file, timesteps, scenarios, result_dir, optim,
+                  order='nearest', measure_savings=False, **kwargs):
+    """ run a list of scenarios with warm starts of a persistent solver
+
+    Each scenario that only changes mutable parameters is solved starting
+    from the basis of the nearest already solved scenario (c.f.
+    nearest_solved), in the order given by order_scenarios. Solver
+    statistics are written to solver_stats-<order>.csv in result_dir and
+    summarized on screen.
+
+    Args:
+        input_file: filename to an Excel spreadsheet for urbs.read_excel
+        timesteps: a list of timesteps, e.g. range(0,8761)
+        scenarios: a list of scenario functions
+        result_dir: directory name for result spreadsheet and plots
+        optim: a persistent solver, e.g. SolverFactory('appsi_highs'); warm
+               starts from a basis and iteration counts need HiGHS, other
+               solvers only keep the model between solves
+        order: scenario order, 'nearest', 'snake' or 'given' (c.f.
+               order_scenarios)
+        measure_savings: set True to solve each warm started scenario a
+               second time cold, with a new HiGHS solver, to measure the
+               iterations saved by the warm start (doubles the solve time)
+        kwargs: plot_tuples, plot_periods, report_tuples, profile (c.f.
+                run_scenario)
+
+    Returns:
+        DataFrame of solve time and simplex iterations per scenario in solve
+        order, the scenario whose basis was used as warm start, the
+        iterations of a cold solve of the same scenario and the iterations
+        saved by the warm start (only with measure_savings) and the
+        objective value
+    """
+    scenarios = order_scenarios(scenarios, order)
+    prob = None
+    bases = {}  # solved scenario -> final basis, for the current prob
+    stats = []
+    for scenario in scenarios:
+        neighbour = nearest_solved(scenario, list(bases))
+        previous = prob
+        prob = run_scenario(input_file, timesteps, scenario, result_dir,
+                            prob=prob, optim=optim,
+                            basis=bases.get(neighbour), **kwargs)
+        if prob is not previous:
+            # new model instance: solved cold, old bases do not fit
+            bases = {}
+            neighbour = None
+
+        iterations = get_iterations(optim)
+        bases[scenario] = get_basis(optim)
+        objective = pyomo.environ.value(prob.obj)
+        cold_iterations = saved = None
+        if neighbour is None:
+            cold_iterations = iterations
+        elif measure_savings and is_highs(optim):
+            # same scenario from scratch; optim keeps its own model copy
+            cold = SolverFactory('appsi_highs')
+            cold.solve(prob)
+            cold_iterations = get_iterations(cold)
+            saved = cold_iterations - iterations
+        stats.append((scenario.__name__,
+                      neighbour.__name__ if neighbour else None,
+                      prob.solve_time, iterations, cold_iterations, saved,
+                      objective))
+
+    stats = pd.DataFrame(stats, columns=['scenario', 'warm start',
+                                         'solve time', 'iterations',
+                                         'cold iterations',
+                                         'iterations saved', 'objective'])
+    stats = stats.set_index('scenario')
+    stats.to_csv(os.path.join(result_dir,
+                              'solver_stats-{}.csv'.format(order)))
+    warm = stats['warm start'].notnull()
+    print("Order '{}': {} scenarios solved in {:.1f} s (max {:.1f} s), "
+          "{} iterations ({} warm, {} cold)".format(
+              order, len(stats), stats['solve time'].sum(),
+              stats['solve time'].max(), stats['iterations'].sum(),
+              stats['iterations'][warm].sum(),
+              stats['iterations'][~warm].sum()))
+    if measure_savings and warm.any():
+        print("Warm starts saved {} of {} cold iterations".format(
+            stats['iterations saved'][warm].sum(),
+            stats['cold iterations'][warm].sum()))
+    return stats
+
 if __name__ == '__main__':
     input_file = 'NEIS.xlsx'
     result_name = os.path.splitext(input_file)[0]  # cut away file extension
@@ -134,13 +395,18 @@ if __name__ == '__main__':
         urbs.COLORS[country] = color
 
     # select scenarios to be run
-    scenarios = {
+    scenarios = [
         cb.scenario_base
-    }
+    ]
 
 
-    for scenario in scenarios:
-        prob = run_scenario(input_file, timesteps, scenario, result_dir,
-                            plot_tuples=plot_tuples,
-                            plot_periods=plot_periods,
-                            report_tuples=report_tuples)
+    # persistent solver, kept alive for all scenarios
+    optim = SolverFactory('appsi_highs')  # appsi_gurobi, or: glpk, gurobi
+
+    # solve order of scenarios: 'nearest', 'snake' or 'given'
+    stats = run_scenarios(input_file, timesteps, scenarios, result_dir, optim,
+                          order='nearest',
+                          plot_tuples=plot_tuples,
+                          plot_periods=plot_periods,
+                          report_tuples=report_tuples)
+    print(stats)
@@ -10,11 +10,19 @@ commodities.
 
 """
 
+from .admm import admm_decomposition
+from .aggregation import (aggregate_timeseries, disaggregate_result,
+                          period_calendar)
+from .benders import benders_decomposition
 from .data import COLORS
-from .model import create_model
+from .model import create_model, update_model, StructuralChange
 from .input import read_excel, get_input
+from .modelsize import model_size
 from .output import get_constants, get_timeseries
 from .plot import plot, result_figures, to_color
+from .profiler import build_profile
 from .pyomoio import get_entity, get_entities, list_entities
 from .report import report
+from .rolling import fix_capacities, rolling_horizon
 from .saveload import load, save
+from .sparse import compare_backends, create_sparse_model, SparseModel
@@ -0,0 +1,427 @@
+"""Spatial decomposition into one subproblem per site by ADMM."""
+import math
+import numpy as np
+import pandas as pd
+import pyomo.core as pyomo
+from .model import create_model
+from .modelhelper import (check_optimal, commodity_balance,
+                          timestep_durations, timestep_weights)
+from .parallel import SubproblemPool
+from .saveload import create_result_cache, ResultContainer
+
+# site level of the input tables that are split by site
+SITE_TABLES = [('commodity', 'Site'), ('process', 'Site'),
+               ('storage', 'Site'), ('dsm', 'Site')]
+
+# transmission costs that are split between the subproblems of both sites
+TRANSMISSION_COSTS = ['inv-cost', 'fix-cost', 'var-cost']
+
+# commodity constraints and source terms of a site, indexed by (..., site,
+# commodity, commodity type); a subproblem drops them for the neighbours
+COMMODITY_CONSTRAINTS = ['res_vertex', 'res_stock_step', 'res_stock_total',
+                         'res_sell_step', 'res_sell_total', 'res_buy_step',
+                         'res_buy_total', 'res_env_step', 'res_env_total']
+COMMODITY_VARIABLES = ['e_co_stock', 'e_co_sell', 'e_co_buy']
+
+
+def admm_decomposition(data, timesteps, solver, processes=None, rho=1.0,
+                       co2_rho=None, tolerance=1e-3, max_iterations=200,
+                       **kwargs):
+    """ Solve a multi-site urbs model by ADMM over its sites.
+
+    The penalty parameters are adapted by residual balancing: they are
+    doubled whenever the primal residual exceeds ten times the dual
+    residual, and halved in the opposite case.
+
+    Args:
+        data: input data dict as returned by read_excel
+        timesteps: list of timesteps; the first one is only the initial
+            timestep, like in create_model
+        solver: name of a solver for SolverFactory that supports quadratic
+            objectives, e.g. 'highs' or 'gurobi'
+        processes: number of worker processes for the subproblems; default:
+            number of CPUs; 0 or 1 solve them in the calling process
+        rho: initial penalty (EUR/MWh per MW) on the deviation of
+            transmission flows (weighted by their annual hours) and
+            capacities from their consensus
+        co2_rho: initial penalty (EUR/t per t/a) on the deviation of a
+            site's annual CO2 output from its allocation; default: rho
+            times the number of sites per CO2 limit
+        tolerance: relative primal and dual residual at which the iterations
+            stop
+        max_iterations: maximum number of iterations
+        **kwargs: optional keyword arguments for create_model, e.g. dt
+
+    Returns:
+        a (result, convergence) tuple: a ResultContainer with the results of
+        all sites (transmissions as modelled by their Site In) and the sum of
+        their costs, and a DataFrame of costs, primal and dual residual,
+        penalty, CO2 output and CO2 price per iteration
+    """
+    timesteps = list(timesteps)
+    sites = data['site'].index.tolist()
+    co2_limit = global_co2_limit(data)
+    has_co2 = not math.isinf(co2_limit)
+    if co2_rho is None:
+        co2_rho = rho * len(sites) / max(abs(co2_limit), 1) if has_co2 else 0
+
+    kwargs['dt'] = timestep_durations(
+        timesteps[1:], kwargs.get('dt', data.get('dt', 1)))
+
+    # transmission flows and capacities, and their copies by site
+    keys, weights = coupling_keys(data, timesteps, kwargs.get('weights'),
+                                  kwargs['dt'])
+    position = dict((key, k) for k, key in enumerate(keys))
+    lines = [site_transmissions(data, site) for site in sites]
+    copies = [np.array([position[key] for key in site_keys(line, timesteps)],
+                       dtype=int)
+              for line in lines]
+    counts = np.bincount(np.concatenate(copies + [np.array([], dtype=int)]),
+                         minlength=len(keys))
+
+    pool = SubproblemPool(
+        create_site_subproblem, solve_site_subproblem,
+        [(site_data(data, site), timesteps, site, line, has_co2, kwargs)
+         for site, line in zip(sites, lines)],
+        solver, processes)
+
+    z = np.zeros(len(keys))
+    u = [np.zeros(len(c)) for c in copies]
+    co2_z = np.zeros(len(sites))
+    co2_u = np.zeros(len(sites))
+    convergence = []
+    try:
+        for iteration in range(max_iterations):
+            results = pool.solve(
+                [(z[c] - u_s, rho, co2_z[s] - co2_u[s], co2_rho, False)
+                 for s, (c, u_s) in enumerate(zip(copies, u))])
+            x = [np.array(values) for _, values, _, _ in results]
+            co2 = np.array([site_co2 for _, _, site_co2, _ in results])
+
+            # consensus of transmission copies: mean of copy plus price
+            z_old = z
+            sums = np.zeros(len(keys))
+            for c, x_s, u_s in zip(copies, x, u):
+                np.add.at(sums, c, x_s + u_s)
+            z = sums / np.maximum(counts, 1)
+            u = [u_s + x_s - z[c] for c, x_s, u_s in zip(copies, x, u)]
+            residuals = transmission_residuals(copies, x, z, z_old, u,
+                                               weights, rho)
+
+            # CO2 allocations: projection onto sum(allocations) <= limit
+            if has_co2:
+                co2_z_old = co2_z
+                co2_z = co2 + co2_u
+                if co2_z.sum() > co2_limit:
+                    co2_z = co2_z - (co2_z.sum() - co2_limit) / len(sites)
+                co2_u = co2_u + co2 - co2_z
+                co2_residuals = (
+                    np.linalg.norm(co2 - co2_z),
+                    co2_rho * np.linalg.norm(co2_z - co2_z_old),
+                    max(np.linalg.norm(co2), np.linalg.norm(co2_z), 1),
+                    max(co2_rho * np.linalg.norm(co2_u), 1))
+            else:
+                co2_residuals = (0, 0, 1, 1)
+
+            convergence.append((
+                iteration, sum(costs for costs, _, _, _ in results),
+                residuals[0], residuals[1], rho, co2.sum(),
+                co2_rho * co2_u.mean()))
+            if all(primal <= tolerance * primal_scale and
+                   dual <= tolerance * dual_scale
+                   for primal, dual, primal_scale, dual_scale
+                   in (residuals, co2_residuals)):
+                break
+
+            # residual balancing; the scaled prices keep their value
+            rho, factor = balanced_penalty(rho, residuals[0], residuals[1])
+            u = [u_s / factor for u_s in u]
+            if has_co2:
+                co2_rho, factor = balanced_penalty(
+                    co2_rho, co2_residuals[0], co2_residuals[1])
+                co2_u = co2_u / factor
+
+        # results of the last iterates
+        results = pool.solve(
+            [(z[c] - u_s, rho, co2_z[s] - co2_u[s], co2_rho, True)
+             for s, (c, u_s) in enumerate(zip(copies, u))])
+    finally:
+        pool.close()
+
+    result = stitch_sites(sites, [site_result
+                                  for _, _, _, site_result in results])
+    convergence = pd.DataFrame(
+        convergence, columns=['iteration', 'costs', 'primal_residual',
+                              'dual_residual', 'rho', 'co2', 'co2_price'])
+    convergence = convergence.set_index('iteration')
+    return ResultContainer(data, result), convergence
+
+
+def global_co2_limit(data):
+    """ Return the global CO2 limit of the hacks, or inf if there is none. """
+    try:
+        return float(data['hacks'].loc['Global CO2 limit', 'Value'])
+    except KeyError:
+        return float('inf')
+
+
+def site_transmissions(data, site):
+    """ Return the transmissions from and to a site. """
+    index = data['transmission'].index
+    return [tra for tra in index if site in tra[:2]]
+
+
+def coupling_keys(data, timesteps, weights=None, dt=1):
+    """ Return the coupled transmission quantities and their weights.
+
+    Args:
+        data: input data dict as returned by read_excel
+        timesteps: list of timesteps including the initial one
+        weights: optional timestep weights, like in create_model
+        dt: optional timestep durations, like in create_model
+
+    Returns:
+        a (keys, weights) tuple: a list of ('cap', transmission) and
+        ('flow', timestep, transmission) keys for all transmissions, and an
+        array of their weights in the penalty terms (1 for capacities, the
+        annual hours of the timestep for flows)
+    """
+    duration = timestep_durations(timesteps[1:], dt)
+    hours = dict((t, w * duration[t]) for t, w in
+                 timestep_weights(timesteps[1:], weights).items())
+    scale = float(8760) / sum(hours.values())
+    keys = site_keys(data['transmission'].index.tolist(), timesteps)
+    return keys, np.array([1 if key[0] == 'cap' else scale * hours[key[1]]
+                           for key in keys])
+
+
+def site_keys(transmissions, timesteps):
+    """ Return the coupling keys of some transmissions in a fixed order. """
+    keys = []
+    for tra in transmissions:
+        keys.append(('cap', tra))
+        keys.extend(('flow', t, tra) for t in timesteps[1:])
+    return keys
+
+
+def site_data(data, site):
+    """ Return the input data of a site's subproblem.
+
+    The subproblem contains the site's commodities, processes, storage, DSM
+    and timeseries, and all transmissions from and to the site with half of
+    their costs. The other ends of these transmissions keep their site rows
+    (without area) and the rows of the transmitted commodities, whose
+    constraints create_site_subproblem removes again. The global CO2 limit
+    is left out.
+
+    Args:
+        data: input data dict as returned by read_excel
+        site: name of the site
+
+    Returns:
+        an input data dict for create_model
+    """
+    data = dict(data)
+    commodity = data['commodity']
+    for table, level in SITE_TABLES:
+        df = data[table]
+        data[table] = df[df.index.get_level_values(level) == site]
+    for name in ('demand', 'supim'):
+        df = data[name]
+        data[name] = df.loc[:, df.columns.get_level_values(0) == site]
+
+    transmission = data['transmission'].loc[
+        site_transmissions(data, site)].copy()
+    for column in TRANSMISSION_COSTS:
+        transmission[column] = transmission[column] / 2
+    data['transmission'] = transmission
+
+    neighbours = set(tra[0] for tra in transmission.index) | set(
+        tra[1] for tra in transmission.index)
+    neighbours.discard(site)
+    transmitted = set(tra[3] for tra in transmission.index)
+    data['commodity'] = pd.concat([data['commodity'], commodity[
+        commodity.index.get_level_values('Site').isin(neighbours) &
+        commodity.index.get_level_values('Commodity').isin(transmitted)]])
+    data['commodity'].sort_index(inplace=True)
+    site_table = data['site'].loc[
+        [s for s in data['site'].index if s == site or s in neighbours]]
+    site_table = site_table.copy()
+    site_table.loc[site_table.index != site, 'area'] = np.nan
+    data['site'] = site_table
+
+    if 'hacks' in data:
+        data['hacks'] = data['hacks'].drop('Global CO2 limit',
+                                           errors='ignore')
+    return data
+
+
+def create_site_subproblem(data, timesteps, site, transmissions, has_co2,
+                           kwargs):
+    """ Create the subproblem of one site.
+
+    Args:
+        data: input data of the site as returned by site_data
+        timesteps: list of timesteps
+        site: name of the site
+        transmissions: list of the transmissions from and to the site
+        has_co2: set True to coordinate the site's annual CO2 output
+        kwargs: dict of keyword arguments for create_model
+
+    Returns:
+        a pyomo ConcreteModel object
+    """
+    m = create_model(data, timesteps, **kwargs)
+    m.admm_site = site
+
+    # neighbours are only ends of transmissions: no balance, no sources
+    for name in COMMODITY_CONSTRAINTS:
+        for index, constraint in getattr(m, name, {}).items():
+            if index[-3] != site:
+                constraint.deactivate()
+    for name in COMMODITY_VARIABLES:
+        for index, var in getattr(m, name).items():
+            if index[-3] != site:
+                var.fix(0)
+    m.admm_values = []
+    m.admm_weights = []
+    for tra in transmissions:
+        m.admm_values.append(m.cap_tra[tra])
+        m.admm_weights.append(1)
+        for tm in m.tm:
+            m.admm_values.append(m.e_tra_in[(tm,) + tra])
+            m.admm_weights.append(pyomo.value(m.weight) * m.dt[tm] *
+                                  m.timestep_weight[tm])
+
+    m.admm_coupling = pyomo.Set(
+        initialize=range(len(m.admm_values)),
+        ordered=True,
+        doc='Set of transmission flows and capacities coupled to other sites')
+    m.admm_target = pyomo.Param(
+        m.admm_coupling,
+        initialize=0,
+        mutable=True,
+        doc='Consensus minus scaled price of coupled quantity')
+    m.admm_rho = pyomo.Param(
+        initialize=0,
+        mutable=True,
+        doc='Penalty on deviation from consensus')
+    if has_co2:
+        m.admm_co2_target = pyomo.Param(
+            initialize=0,
+            mutable=True,
+            doc='CO2 allocation minus scaled CO2 price (t/a)')
+        m.admm_co2_rho = pyomo.Param(
+            initialize=0,
+            mutable=True,
+            doc='Penalty on deviation from CO2 allocation')
+        m.admm_co2 = pyomo.Expression(
+            rule=admm_co2_rule,
+            doc='Annual CO2 output of site (t/a)')
+
+    m.obj.deactivate()
+    m.obj_admm = pyomo.Objective(
+        expr=pyomo.summation(m.costs) +
+        m.admm_rho / 2 * sum(
+            m.admm_weights[c] * (m.admm_values[c] - m.admm_target[c]) ** 2
+            for c in m.admm_coupling) +
+        (m.admm_co2_rho / 2 * (m.admm_co2 - m.admm_co2_target) ** 2
+         if has_co2 else 0),
+        sense=pyomo.minimize,
+        doc='minimize(costs + penalties on deviation from consensus)')
+    return m
+
+
+# annual CO2 output of a site's subproblem (cf. res_global_co2_limit_rule)
+def admm_co2_rule(m):
+    return sum(- commodity_balance(m, tm, m.admm_site, 'CO2') *
+               m.dt[tm] * m.timestep_weight[tm]
+               for tm in m.tm) * m.weight
+
+
+def solve_site_subproblem(m, optim, targets, rho, co2_target, co2_rho,
+                          with_result):
+    """ Solve the subproblem of one site for given consensus and prices.
+
+    Args:
+        m: subproblem created by create_site_subproblem
+        optim: a solver object
+        targets: list of consensus minus scaled price of coupled quantities
+        rho: penalty on deviations from the targets
+        co2_target: CO2 allocation minus scaled CO2 price
+        co2_rho: penalty on deviation from co2_target
+        with_result: set True to return the result cache
+
+    Returns:
+        a (costs, values, co2, result) tuple with the site's costs, the
+        values of its coupled quantities, its annual CO2 output and the
+        result cache (or None)
+    """
+    for c, target in enumerate(targets):
+        m.admm_target[c] = target
+    m.admm_rho = rho
+    if hasattr(m, 'admm_co2'):
+        m.admm_co2_target = co2_target
+        m.admm_co2_rho = co2_rho
+    check_optimal(optim.solve(m), "site '{}'".format(m.admm_site))
+    values = [pyomo.value(value) for value in m.admm_values]
+    co2 = pyomo.value(m.admm_co2) if hasattr(m, 'admm_co2') else 0
+    result = create_result_cache(m) if with_result else None
+    return pyomo.value(pyomo.summation(m.costs)), values, co2, result
+
+
+def transmission_residuals(copies, x, z, z_old, u, weights, rho):
+    """ Return the residuals of the transmission consensus.
+
+    Returns:
+        a (primal, dual, primal scale, dual scale) tuple: the weighted norms
+        of the copies' deviation from the consensus and of the consensus
+        change times rho, and the norms they are compared with
+    """
+    def norm(values):
+        return math.sqrt(sum((weights[c] * v ** 2).sum()
+                             for c, v in zip(copies, values)))
+    primal = norm([x_s - z[c] for c, x_s in zip(copies, x)])
+    dual = rho * norm([(z - z_old)[c] for c in copies])
+    primal_scale = max(norm(x), norm([z[c] for c in copies]), 1)
+    dual_scale = max(rho * norm(u), 1)
+    return primal, dual, primal_scale, dual_scale
+
+
+def balanced_penalty(rho, primal, dual, mu=10, tau=2):
+    """ Return the new penalty and its change factor by residual balancing.
+    """
+    if primal > mu * dual:
+        return rho * tau, tau
+    if dual > mu * primal:
+        return rho / tau, 1.0 / tau
+    return rho, 1
+
+
+def stitch_sites(sites, results):
+    """ Combine the result caches of all sites into one.
+
+    Args:
+        sites: list of site names
+        results: list of the sites' result caches
+
+    Returns:
+        a result cache with the entries of each site's own entities, in
+        which transmissions belong to their Site In, the sum of the sites'
+        costs and the other entities (e.g. timesteps) of the first site
+    """
+    result = {}
+    for site, site_result in zip(sites, results):
+        for name, entity in site_result.items():
+            if name.startswith('admm_'):
+                continue
+            if 'sit' in entity.index.names:
+                entity = entity[entity.index.get_level_values('sit') == site]
+                result.setdefault(name, []).append(entity)
+            elif name not in result:
+                result[name] = entity
+    for name, entity in result.items():
+        if isinstance(entity, list):
+            result[name] = pd.concat(entity).sort_index()
+    result['costs'] = sum(site_result['costs'] for site_result in results)
+    return result
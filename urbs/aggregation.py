@@ -0,0 +1,280 @@
+"""Time series aggregation to representative periods."""
+import numpy as np
+import pandas as pd
+from .saveload import create_result_cache, ResultContainer
+
+
+def aggregate_timeseries(data, timesteps, n_periods, period_length=24,
+                         method='kmeans', extremes=True, seed=0):
+    """ Aggregate the input timeseries to representative periods.
+
+    The modelled timesteps (timesteps[1:]) are split into consecutive periods
+    of period_length timesteps, which are clustered by their normalized
+    demand, supim and buy/sell price profiles. If the number of modelled
+    timesteps is not a multiple of period_length, the incomplete last period
+    is assigned to the representative period closest to it.
+
+    Args:
+        data: input data dict as returned by read_excel
+        timesteps: list of timesteps; timesteps[0] is only the initial
+            timestep, like in create_model
+        n_periods: number of clusters
+        period_length: number of timesteps per period, e.g. 24 or 168
+        method: 'kmeans' (cluster means as representatives) or 'kmedoids'
+            (the most central period of each cluster)
+        extremes: set True to keep the period with the peak of each demand
+            timeseries as a representative of its own; default: True
+        seed: seed of the random cluster initialisation
+
+    Returns:
+        a (data, timesteps, weights, mapping) tuple: a copy of data with the
+        representative periods as timeseries, their timesteps, a Series of
+        the number of periods each modelled timestep represents and a Series
+        that maps each original timestep to its representative timestep
+    """
+    if method not in ('kmeans', 'kmedoids'):
+        raise ValueError("Unknown aggregation method '{}'; use 'kmeans' or "
+                         "'kmedoids'".format(method))
+    if n_periods < 1:
+        raise ValueError("n_periods must be at least 1")
+    if 'dt' in data and data['dt'].nunique() > 1:
+        raise ValueError("Aggregation requires uniform timestep durations")
+
+    modelled = list(timesteps)[1:]
+    n_full = len(modelled) // period_length
+    n_rest = len(modelled) - n_full * period_length
+    if n_full == 0:
+        raise ValueError("Less than one period of {} timesteps".format(
+            period_length))
+
+    # all timeseries side by side (timesteps x columns); empty timeseries,
+    # e.g. buy_sell_price without Buy/Sell commodities, are left out
+    names = [name for name in ('demand', 'supim', 'buy_sell_price')
+             if len(data[name].columns) > 0]
+    profiles = np.hstack([data[name].loc[modelled].values.astype(float)
+                          for name in names])
+    scale = np.abs(profiles).max(axis=0)
+    scale[scale == 0] = 1
+    features = profiles / scale
+
+    n_cols = profiles.shape[1]
+    periods = profiles[:n_full * period_length].reshape(
+        n_full, period_length, n_cols)
+    points = features[:n_full * period_length].reshape(
+        n_full, period_length * n_cols)
+
+    # cluster label of each period; extreme periods get labels of their own
+    labels = np.full(n_full, -1)
+    extreme = []
+    if extremes:
+        n_demand = len(data['demand'].columns)
+        peaks = periods[:, :, :n_demand].max(axis=1).argmax(axis=0)
+        extreme = sorted(set(peaks.tolist()))
+    ordinary = np.array([p for p in range(n_full) if p not in extreme])
+
+    representatives = []
+    if len(ordinary) > 0:
+        k = min(n_periods, len(ordinary))
+        if method == 'kmeans':
+            ordinary_labels, _ = _kmeans(points[ordinary], k, seed)
+        else:
+            ordinary_labels, medoids = _kmedoids(points[ordinary], k, seed)
+        for label in np.unique(ordinary_labels):
+            members = ordinary[ordinary_labels == label]
+            labels[members] = len(representatives)
+            if method == 'kmeans':
+                representatives.append(periods[members].mean(axis=0))
+            else:
+                representatives.append(periods[ordinary[medoids[label]]])
+    for period in extreme:
+        labels[period] = len(representatives)
+        representatives.append(periods[period])
+
+    # number representative periods by their first occurrence in the year
+    order = pd.unique(labels).tolist()
+    representatives = [representatives[label] for label in order]
+    labels = np.array([order.index(label) for label in labels])
+    counts = np.bincount(labels, minlength=len(representatives)).astype(float)
+
+    # incomplete last period: closest representative over its timesteps
+    if n_rest:
+        rest = features[n_full * period_length:].ravel()
+        distances = [((rest - (r[:n_rest] / scale).ravel()) ** 2).sum()
+                     for r in representatives]
+        labels = np.append(labels, int(np.argmin(distances)))
+        counts[labels[-1]] += float(n_rest) / period_length
+
+    # representative timeseries, preceded by the initial timestep
+    n_steps = len(representatives) * period_length
+    new_timesteps = list(range(n_steps + 1))
+    values = np.vstack(representatives)
+    aggregated = dict(data)
+    if 'dt' in data:
+        aggregated['dt'] = pd.Series(data['dt'].iloc[0], index=new_timesteps,
+                                     name='dt')
+    col = 0
+    for name in names:
+        df = data[name]
+        width = len(df.columns)
+        initial = df.loc[[list(timesteps)[0]]].values.astype(float)
+        aggregated[name] = pd.DataFrame(
+            np.vstack([initial, values[:, col:col + width]]),
+            index=pd.Index(new_timesteps, name=df.index.name),
+            columns=df.columns)
+        col += width
+
+    weights = pd.Series(np.repeat(counts, period_length),
+                        index=new_timesteps[1:], name='weight')
+    position = np.arange(len(modelled))
+    mapping = pd.Series(
+        [new_timesteps[0]] +
+        (1 + labels[position // period_length] * period_length +
+         position % period_length).tolist(),
+        index=pd.Index(list(timesteps), name='t'), name='representative')
+    return aggregated, new_timesteps, weights, mapping
+
+
+def disaggregate_result(prob, mapping, data):
+    """ Expand the result of an aggregated model to the original timesteps.
+
+    Every result entity with a timestep level 't' is repeated for all
+    original timesteps its representative timestep stands for, capacities
+    and costs are kept unchanged. The result is an approximation of the full
+    dispatch, as it repeats the representative periods; in particular, the
+    storage content restarts in every period. For models with a calendar
+    (seasonal storage), the storage content is the content at the start of
+    the calendar period plus the change within its representative period.
+
+    Args:
+        prob: a solved model created from aggregate_timeseries output
+        mapping: Series of representative timesteps as returned by
+            aggregate_timeseries
+        data: original (not aggregated) input data dict
+
+    Returns:
+        a ResultContainer with data and the expanded result cache, which can
+        be used with get_timeseries, report, plot and save
+    """
+    if hasattr(prob, '_result'):
+        result = prob._result
+    else:
+        result = create_result_cache(prob)
+
+    timesteps = pd.DataFrame({'t': mapping.values, 't_orig': mapping.index})
+
+    expanded = {}
+    for name, entity in result.items():
+        if 't' not in entity.index.names:
+            expanded[name] = entity
+            continue
+        frame = entity.reset_index().merge(timesteps, on='t')
+        frame['t'] = frame['t_orig']
+        frame = frame.set_index(list(entity.index.names)).sort_index()
+        expanded[name] = frame[entity.name]
+
+    if 'e_sto_inter' in result and not result['e_sto_inter'].empty:
+        expanded['e_sto_con'] = _seasonal_storage_content(
+            expanded['e_sto_con'], result['e_sto_inter'], mapping,
+            prob.period_length)
+    return ResultContainer(data, expanded)
+
+
+def period_calendar(mapping, period_length):
+    """ Return the representative period of each calendar period.
+
+    Args:
+        mapping: Series of representative timesteps as returned by
+            aggregate_timeseries
+        period_length: number of timesteps per period
+
+    Returns:
+        a list of representative periods (0-based), one per calendar period,
+        for create_model(..., calendar=...)
+    """
+    starts = mapping.values[1::period_length]
+    return [int(t - 1) // period_length for t in starts]
+
+
+def _seasonal_storage_content(content, inter, mapping, period_length):
+    """ Add the content at the start of each calendar period to the
+    content change within its representative period. """
+    # calendar period of each original timestep; the initial timestep
+    # is the start of the first calendar period
+    position = np.arange(len(mapping)) - 1
+    calendar = pd.Series(np.maximum(position, 0) // period_length,
+                         index=mapping.index)
+
+    frame = content.reset_index()
+    frame.loc[frame['t'] == mapping.index[0], content.name] = 0
+    frame['cal'] = calendar.reindex(frame['t']).values
+    frame = frame.merge(inter.rename('start').reset_index(),
+                        on=['cal'] + list(inter.index.names[1:]))
+    frame[content.name] = frame[content.name].fillna(0) + frame['start']
+    frame = frame.set_index(list(content.index.names)).sort_index()
+    return frame[content.name]
+
+
+def _initial_centers(points, k, random):
+    """ Choose k initial cluster centers by k-means++ seeding. """
+    centers = [random.randint(len(points))]
+    distances = ((points - points[centers[0]]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        if distances.sum() > 0:
+            center = random.choice(len(points), p=distances / distances.sum())
+        else:
+            center = random.randint(len(points))
+        centers.append(center)
+        distances = np.minimum(
+            distances, ((points - points[center]) ** 2).sum(axis=1))
+    return centers
+
+
+def _kmeans(points, k, seed, max_iter=100):
+    """ Cluster points by k-means.
+
+    Returns:
+        a (labels, centers) tuple with the cluster of each point and the
+        cluster means
+    """
+    random = np.random.RandomState(seed)
+    centers = points[_initial_centers(points, k, random)]
+    labels = None
+    for _ in range(max_iter):
+        distances = ((points[:, np.newaxis, :] -
+                      centers[np.newaxis, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if labels is not None and (new_labels == labels).all():
+            break
+        labels = new_labels
+        centers = np.array([points[labels == c].mean(axis=0)
+                            if (labels == c).any() else centers[c]
+                            for c in range(k)])
+    return labels, centers
+
+
+def _kmedoids(points, k, seed, max_iter=100):
+    """ Cluster points by k-medoids (alternating assignment and update).
+
+    Returns:
+        a (labels, medoids) tuple with the cluster of each point and a dict
+        of the position of each cluster's medoid within points
+    """
+    random = np.random.RandomState(seed)
+    distances = ((points[:, np.newaxis, :] -
+                  points[np.newaxis, :, :]) ** 2).sum(axis=2)
+    medoids = _initial_centers(points, k, random)
+    for _ in range(max_iter):
+        labels = distances[:, medoids].argmin(axis=1)
+        new_medoids = []
+        for c, medoid in enumerate(medoids):
+            members = np.flatnonzero(labels == c)
+            if len(members) == 0:
+                new_medoids.append(medoid)
+                continue
+            within = distances[np.ix_(members, members)].sum(axis=1)
+            new_medoids.append(members[within.argmin()])
+        if new_medoids == medoids:
+            break
+        medoids = new_medoids
+    labels = distances[:, medoids].argmin(axis=1)
+    return labels, dict(enumerate(medoids))
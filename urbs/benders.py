@@ -0,0 +1,347 @@
+"""Benders decomposition into investment and operation subproblems."""
+import math
+import warnings
+import pandas as pd
+import pyomo.core as pyomo
+from pyomo.opt import SolverFactory
+from .model import create_model
+from .modelhelper import (check_optimal, timestep_durations,
+                          timestep_weights)
+from .parallel import SubproblemPool
+from .saveload import create_result_cache, ResultContainer
+
+# constraints of the master problem, i.e. the ones on capacities only
+MASTER_CONSTRAINTS = [
+    'def_process_capacity', 'def_transmission_capacity',
+    'def_storage_power', 'def_storage_capacity', 'res_process_capacity',
+    'res_transmission_capacity', 'res_transmission_symmetry',
+    'res_storage_power', 'res_storage_capacity', 'res_area',
+    'res_sell_buy_symmetry']
+
+# cost types of the master problem; the others are operation costs
+MASTER_COST_TYPES = ['Invest', 'Fixed']
+
+# create_model options that change the names or the form of the capacity
+# constraints in MASTER_CONSTRAINTS
+UNSUPPORTED_OPTIONS = ['var_bounds', 'reduced', 'undirected_transmission']
+
+
+def benders_decomposition(data, timesteps, solver, block_length=730,
+                          processes=None, penalty=None, tolerance=1e-4,
+                          max_iterations=50, **kwargs):
+    """ Solve a urbs model by Benders decomposition.
+
+    Args:
+        data: input data dict as returned by read_excel
+        timesteps: list of timesteps; the first one is only the initial
+            timestep, like in create_model
+        solver: name of the solver for SolverFactory, e.g. 'glpk'
+        block_length: number of modelled timesteps per operation subproblem
+        processes: number of worker processes for the subproblems; default:
+            number of CPUs; 0 or 1 solve them in the calling process
+        penalty: cost (EUR/a) per unit of capacity beyond the master's
+            capacities in the subproblems; default: 10 times the highest
+            annual invest plus fixed costs of a unit of capacity
+        tolerance: relative gap between lower and upper bound at which the
+            iterations stop
+        max_iterations: maximum number of iterations
+        **kwargs: optional keyword arguments for create_model, e.g. dt;
+            except UNSUPPORTED_OPTIONS
+
+    Returns:
+        a (result, convergence) tuple: a ResultContainer with the capacities
+        and costs of the best solution found and the stitched operation of
+        all blocks, and a DataFrame of lower bound, upper bound and relative
+        gap per iteration; warns if the operation of the best solution still
+        needs capacity beyond the master problem's limits (penalized excess)
+    """
+    if max_iterations < 1:
+        raise ValueError("max_iterations must be at least 1")
+    unsupported = [name for name in UNSUPPORTED_OPTIONS if kwargs.get(name)]
+    if unsupported:
+        raise ValueError("benders_decomposition does not support {}".format(
+            ', '.join(unsupported)))
+    timesteps = list(timesteps)
+    modelled = timesteps[1:]
+    blocks = [[timesteps[start]] + modelled[start:start + block_length]
+              for start in range(0, len(modelled), block_length)]
+    kwargs['dt'] = timestep_durations(
+        modelled, kwargs.get('dt', data.get('dt', 1)))
+    hours = dict((t, w * kwargs['dt'][t]) for t, w in
+                 timestep_weights(modelled, kwargs.get('weights')).items())
+    shares = [sum(hours[t] for t in block[1:]) / sum(hours.values())
+              for block in blocks]
+
+    master = create_master(data, timesteps, len(blocks), **kwargs)
+    if penalty is None:
+        penalty = 10 * max(unit_capacity_costs(master), 1)
+    capacities = capacity_variables(master)
+
+    optim = SolverFactory(solver)
+    pool = SubproblemPool(
+        create_subproblem, solve_subproblem,
+        [(data, block, kwargs) for block in blocks],
+        solver, processes)
+
+    convergence = []
+    upper, best = float('inf'), None
+    try:
+        # operation costs with unlimited (unpenalized excess) capacities
+        results = pool.solve(
+            [([0] * len(capacities), 0, False)] * len(blocks))
+        for b, (share, (objective, _, _, _)) in enumerate(
+                zip(shares, results)):
+            master.benders_block_costs[b].setlb(share * objective)
+
+        for iteration in range(max_iterations):
+            check_optimal(optim.solve(master), 'Benders master problem')
+            lower = pyomo.value(master.obj_benders)
+            targets = [pyomo.value(capacity) for capacity in capacities]
+            results = pool.solve([(targets, penalty / share, False)
+                                  for share in shares])
+
+            master_costs = sum(pyomo.value(master.costs[cost_type])
+                               for cost_type in MASTER_COST_TYPES)
+            total = master_costs + sum(
+                share * objective
+                for share, (objective, _, _, _) in zip(shares, results))
+            if total < upper:
+                upper, best = total, targets
+
+            for b, (share, (objective, duals, _, _)) in enumerate(
+                    zip(shares, results)):
+                master.benders_cuts.add(
+                    master.benders_block_costs[b] >= share * (
+                        objective +
+                        sum(dual * (capacity - target)
+                            for dual, capacity, target
+                            in zip(duals, capacities, targets))))
+
+            gap = (upper - lower) / max(abs(upper), 1)
+            convergence.append((iteration, lower, upper, gap))
+            if gap <= tolerance:
+                break
+
+        if best is None:
+            raise ValueError("No finite upper bound found; check the "
+                             "operation subproblems")
+
+        # operation and costs of the best capacities
+        results = pool.solve([(best, penalty / share, True)
+                              for share in shares])
+    finally:
+        pool.close()
+
+    for capacity, target in zip(capacities, best):
+        capacity.fix(target)
+    check_optimal(optim.solve(master), 'Benders master problem')
+    result = stitch_blocks(master, results, shares, blocks)
+    convergence = pd.DataFrame(
+        convergence, columns=['iteration', 'lower', 'upper', 'gap'])
+    convergence = convergence.set_index('iteration')
+
+    excess = sum(share * result_excess
+                 for share, (_, _, _, result_excess) in zip(shares, results))
+    if excess > 1e-6:
+        warnings.warn("The operation requires capacities beyond the master "
+                      "problem's limits ({:g} in total); increase penalty "
+                      "or max_iterations".format(excess))
+    return ResultContainer(data, result), convergence
+
+
+def create_master(data, timesteps, n_blocks, **kwargs):
+    """ Create the master problem of the Benders decomposition.
+
+    The master problem is a model of the first modelled timestep, of which
+    only the capacity constraints (MASTER_CONSTRAINTS) and the invest and
+    fixed costs are kept. Its objective adds one variable per block for the
+    operation costs, which are bounded by cuts.
+
+    Args:
+        data: input data dict as returned by read_excel
+        timesteps: list of timesteps
+        n_blocks: number of operation subproblems
+        **kwargs: optional keyword arguments for create_model
+
+    Returns:
+        a pyomo ConcreteModel object
+    """
+    m = create_model(data, timesteps[:2], **kwargs)
+    for constraint in m.component_objects(pyomo.Constraint):
+        if constraint.name not in MASTER_CONSTRAINTS + ['def_costs']:
+            constraint.deactivate()
+    for cost_type in m.cost_type:
+        if cost_type not in MASTER_COST_TYPES:
+            m.def_costs[cost_type].deactivate()
+            m.costs[cost_type].fix(0)
+
+    m.benders_block = pyomo.Set(
+        initialize=range(n_blocks),
+        ordered=True,
+        doc='Set of operation subproblems')
+    m.benders_block_costs = pyomo.Var(
+        m.benders_block,
+        within=pyomo.Reals,
+        doc='Operation costs of block (EUR/a), bounded by cuts')
+    m.benders_cuts = pyomo.ConstraintList(
+        doc='Optimality cuts on block operation costs')
+    m.obj.deactivate()
+    m.obj_benders = pyomo.Objective(
+        expr=sum(m.costs[cost_type] for cost_type in MASTER_COST_TYPES) +
+        pyomo.summation(m.benders_block_costs),
+        sense=pyomo.minimize,
+        doc='minimize(invest and fixed costs + block operation costs)')
+    return m
+
+
+def create_subproblem(data, timesteps, kwargs):
+    """ Create the operation subproblem of one block.
+
+    The subproblem is a model of the block's timesteps without invest and
+    fixed costs, in which the new capacities are limited by the (mutable)
+    capacities of the master problem plus a penalized excess.
+
+    Args:
+        data: input data dict as returned by read_excel
+        timesteps: list of timesteps of the block, including the initial one
+        kwargs: dict of keyword arguments for create_model
+
+    Returns:
+        a pyomo ConcreteModel object
+    """
+    m = create_model(data, timesteps, dual=True, **kwargs)
+    for cost_type in MASTER_COST_TYPES:
+        m.def_costs[cost_type].deactivate()
+        m.costs[cost_type].fix(0)
+
+    m.benders_capacities = capacity_variables(m)
+    m.benders_capacity = pyomo.Set(
+        initialize=range(len(m.benders_capacities)),
+        ordered=True,
+        doc='Set of new capacities of the master problem')
+    m.benders_target = pyomo.Param(
+        m.benders_capacity,
+        initialize=0,
+        mutable=True,
+        doc='New capacity of the master problem')
+    m.benders_excess = pyomo.Var(
+        m.benders_capacity,
+        within=pyomo.NonNegativeReals,
+        doc='New capacity beyond the master problem')
+    m.benders_penalty = pyomo.Param(
+        initialize=0,
+        mutable=True,
+        doc='Costs per unit of new capacity beyond the master problem')
+    m.res_benders_capacity = pyomo.Constraint(
+        m.benders_capacity,
+        rule=res_benders_capacity_rule,
+        doc='new capacity <= master capacity + excess')
+    m.obj.deactivate()
+    m.obj_benders = pyomo.Objective(
+        expr=pyomo.summation(m.costs) +
+        m.benders_penalty * pyomo.summation(m.benders_excess),
+        sense=pyomo.minimize,
+        doc='minimize(operation costs + penalty * excess capacity)')
+    return m
+
+
+# new capacity <= master capacity + excess
+def res_benders_capacity_rule(m, c):
+    return (m.benders_capacities[c] - m.benders_excess[c] <=
+            m.benders_target[c])
+
+
+def solve_subproblem(m, optim, targets, penalty, with_result):
+    """ Solve the operation subproblem of one block for given capacities.
+
+    Args:
+        m: subproblem created by create_subproblem
+        optim: a solver object
+        targets: list of new capacities of the master problem
+        penalty: costs per unit of excess capacity
+        with_result: set True to return the result cache
+
+    Returns:
+        a (objective, duals, result, excess) tuple with the subproblem
+        objective, the duals of the capacity limits (change of the objective
+        per unit of capacity), the result cache (or None) and the total
+        excess capacity
+    """
+    for c, target in enumerate(targets):
+        m.benders_target[c] = target
+    m.benders_penalty = penalty
+    check_optimal(optim.solve(m), 'block of timesteps {} to {}'
+                  .format(*m.tm_bounds))
+    duals = [m.dual[m.res_benders_capacity[c]] for c in m.benders_capacity]
+    result = create_result_cache(m) if with_result else None
+    return (pyomo.value(m.obj_benders), duals, result,
+            sum(pyomo.value(m.benders_excess[c]) for c in m.benders_capacity))
+
+
+def capacity_variables(m):
+    """ Return the new capacity variables of a model in a fixed order. """
+    if m.undirected_transmission:
+        transmissions = [m.cap_tra_pair_new[t] for t in m.tra_pair_tuples]
+    else:
+        transmissions = [m.cap_tra_new[t] for t in m.tra_tuples]
+    return ([m.cap_pro_new[p] for p in m.pro_tuples] + transmissions +
+            [m.cap_sto_c_new[s] for s in m.sto_tuples] +
+            [m.cap_sto_p_new[s] for s in m.sto_tuples])
+
+
+def unit_capacity_costs(m):
+    """ Return the highest annual invest plus fixed costs per capacity. """
+    costs = [m.process['inv-cost'] * m.process['annuity-factor'] +
+             m.process['fix-cost'],
+             m.transmission['inv-cost'] * m.transmission['annuity-factor'] +
+             m.transmission['fix-cost'],
+             m.storage['inv-cost-c'] * m.storage['annuity-factor'] +
+             m.storage['fix-cost-c'],
+             m.storage['inv-cost-p'] * m.storage['annuity-factor'] +
+             m.storage['fix-cost-p']]
+    return max([0] + [c.max() for c in costs
+                      if len(c) and not math.isnan(c.max())])
+
+
+def stitch_blocks(master, results, shares, blocks):
+    """ Combine master and block results into one result cache.
+
+    Args:
+        master: solved master problem with fixed capacities
+        results: list of solve_subproblem results with result caches
+        shares: list of the blocks' shares of the modelled hours
+        blocks: list of the blocks' timesteps
+
+    Returns:
+        a result cache with the timeseries of all blocks and the other
+        entities (e.g. capacities) of the master problem; the operation
+        costs are the sum of the blocks' costs scaled by their shares
+    """
+    parts = {}
+    operation_costs = {}
+    for b, (share, (_, _, block_result, _)) in enumerate(
+            zip(shares, results)):
+        for name, entity in block_result.items():
+            if 't' not in entity.index.names:
+                continue
+            if b > 0:
+                # the initial timestep of a block is the last modelled
+                # timestep of the previous block
+                entity = entity[entity.index.get_level_values('t') !=
+                                blocks[b][0]]
+            parts.setdefault(name, []).append(entity)
+        for cost_type in master.cost_type:
+            if cost_type not in MASTER_COST_TYPES:
+                operation_costs[cost_type] = (
+                    operation_costs.get(cost_type, 0) +
+                    share * block_result['costs'][cost_type])
+
+    result = dict((name, pd.concat(series)) for name, series in parts.items())
+    for name, entity in create_result_cache(master).items():
+        if name not in result:
+            result[name] = entity
+    costs = result['costs'].copy()
+    for cost_type, value in operation_costs.items():
+        costs[cost_type] = value
+    result['costs'] = costs
+    return result
@@ -11,6 +11,8 @@ def read_excel(filename):
     'Site.Commodity' becomes the MultiIndex column ('Site', 'Commodity').
     2. The attribute 'annuity-factor' is derived here from the columns 'wacc'
     and 'depreciation' for 'Process', 'Transmission' and 'Storage'.
+    3. The optional column 'dt' of 'Demand' (timestep durations in hours) is
+    moved to the Series data['dt'].
 
     Args:
         filename: filename to an Excel spreadsheet with the required sheets
@@ -49,6 +51,9 @@ def read_excel(filename):
             hacks = None
 
     # prepare input data
+    # optional timestep durations (hours) are no demand timeseries
+    dt = demand.pop('dt') if 'dt' in demand.columns else None
+
     # split columns by dots '.', so that 'DE.Elec' becomes the two-level
     # column index ('DE', 'Elec')
     demand.columns = split_columns(demand.columns, '.')
@@ -68,6 +73,8 @@ def read_excel(filename):
         'dsm': dsm}
     if hacks is not None:
         data['hacks'] = hacks
+    if dt is not None:
+        data['dt'] = dt
 
     # sort nested indexes to make direct assignments work
     for key in data:
@@ -2,22 +2,90 @@ import math
 import pyomo.core as pyomo
 from datetime import datetime
 from .modelhelper import *
-
-
-def create_model(data, timesteps=None, dt=1, dual=False):
+from .profiler import ProfiledModel
+
+# input columns that create_model(..., mutable=True) declares as mutable
+# Params, so that update_model can change them in an existing model; wacc and
+# depreciation enter the model through the annuity factor
+MUTABLE_PARAMS = {
+    'site': ['area'],
+    'commodity': ['price', 'max', 'maxperstep'],
+    'process': ['inst-cap', 'cap-lo', 'cap-up', 'inv-cost', 'fix-cost',
+                'var-cost', 'startup-cost', 'min-fraction', 'annuity-factor'],
+    'process_commodity': ['ratio'],
+    'transmission': ['eff', 'inst-cap', 'cap-lo', 'cap-up', 'inv-cost',
+                     'fix-cost', 'var-cost', 'annuity-factor'],
+    'storage': ['eff-in', 'eff-out', 'init', 'inst-cap-c', 'cap-lo-c',
+                'cap-up-c', 'inst-cap-p', 'cap-lo-p', 'cap-up-p',
+                'inv-cost-c', 'inv-cost-p', 'fix-cost-c', 'fix-cost-p',
+                'var-cost-c', 'var-cost-p', 'annuity-factor']}
+ANNUITY_INPUTS = ['wacc', 'depreciation']
+
+
+class StructuralChange(ValueError):
+    """ Input change that update_model cannot apply to an existing model;
+    the model must be created anew with create_model. """
+
+
+def create_model(data, timesteps=None, dt=None, dual=False,
+                 dsm_formulation=None, mutable=False, var_bounds=False,
+                 reduced=False, undirected_transmission=False, weights=None,
+                 period_length=None, calendar=None, profile=False):
     """Create a pyomo ConcreteModel URBS object from given input data.
 
     Args:
         data: a dict of 6 DataFrames with the keys 'commodity', 'process',
             'transmission', 'storage', 'demand' and 'supim'.
         timesteps: optional list of timesteps, default: demand timeseries
-        dt: timestep duration in hours (default: 1)
+        dt: timestep duration in hours; a number, or a dict, Series or list
+            (in the order of the modelled timesteps) of the duration of
+            each modelled timestep; default: optional Demand column 'dt',
+            else 1
         dual: set True to add dual variables to model (slower); default: False
+        dsm_formulation: 'pairwise' (one dsm_down variable per pair of
+            timesteps within the delay) or 'cumulative' (linear-size
+            formulation with cumulative DSM states); default: value of the
+            optional DSM sheet column 'formulation', else 'pairwise'
+        mutable: set True to declare the coefficients listed in
+            MUTABLE_PARAMS as mutable Params, which update_model can change
+            without rebuilding the model; default: False
+        var_bounds: set True to express limits on single variables (capacity
+            limits, maxperstep, DSM thresholds) as variable bounds instead of
+            constraints; cannot be combined with mutable, as bounds are not
+            refreshed by update_model; default: False
+        reduced: set True to replace the variables e_pro_in, e_pro_out,
+            e_tra_out, cap_pro, cap_tra, cap_sto_c and cap_sto_p by
+            Expressions instead of defining them by equality constraints;
+            default: False
+        undirected_transmission: set True to use one capacity variable for
+            both directions of a transmission instead of a symmetry
+            constraint; requires equal inst-cap, cap-lo and cap-up in both
+            directions; default: False
+        weights: optional dict or Series of the number of timesteps each
+            modelled timestep represents, e.g. from aggregate_timeseries;
+            scales costs and commodity totals; default: 1 for all
+        period_length: optional number of timesteps per representative
+            period; storage content, gradients and startups are then cyclic
+            within each period instead of linked over the whole horizon and
+            the storage init values are not enforced; default: None
+        calendar: optional list of the representative period (0-based) of
+            each calendar period in chronological order, e.g. from
+            period_calendar; requires period_length. Storage content is then
+            tracked over the calendar (seasonal storage) and e_sto_con is the
+            content relative to the start of the representative period;
+            default weights: number of calendar periods per representative
+            period; default: None
+        profile: set True to record the build time, indices and memory of
+            each component, c.f. build_profile; default: False
 
     Returns:
         a pyomo ConcreteModel object
     """
-    m = pyomo.ConcreteModel()
+    if mutable and var_bounds:
+        raise ValueError("var_bounds cannot be combined with mutable, as "
+                         "update_model does not refresh variable bounds")
+
+    m = ProfiledModel() if profile else pyomo.ConcreteModel()
     m.name = 'URBS'
     m.created = datetime.now().strftime('%Y%m%dT%H%M')
     m._data = data
@@ -28,11 +96,8 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 
     # Preparations
     # ============
-    # Data import. Syntax to access a value within equation definitions looks
-    # like this:
-    #
-    #     m.storage.loc[site, storage, commodity][attribute]
-    #
+    # Data import. The DataFrames are kept as model attributes for reporting;
+    # equation definitions read from the dict copies created further below.
     m.site = data['site']
     m.commodity = data['commodity']
     m.process = data['process']
@@ -44,6 +109,20 @@ def create_model(data, timesteps=None, dt=1, dual=False):
     m.buy_sell_price = data['buy_sell_price']
     m.timesteps = timesteps
     m.dsm = data['dsm']
+    m.dsm_formulation = get_dsm_formulation(m.dsm, dsm_formulation)
+    m.var_bounds = var_bounds
+    m.reduced = reduced
+    m.undirected_transmission = undirected_transmission
+    m.period_length = period_length
+    m.calendar = None if calendar is None else list(calendar)
+
+    # duration (hours) of each modelled timestep
+    if dt is None:
+        dt = data.get('dt', 1)
+    m.duration = timestep_durations(m.timesteps[1:], dt)
+
+    # first and last modelled timestep; DSM time windows are clipped to them
+    m.tm_bounds = (min(m.timesteps[1:]), max(m.timesteps[1:]))
 
     # process input/output ratios
     m.r_in = m.process_commodity.xs('In', level='Direction')['ratio']
@@ -74,6 +153,32 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         m.storage['depreciation'],
         m.storage['wacc'])
 
+    # Compiled parameter tables
+    # =========================
+    # Plain dict copies of the input DataFrames, created once so that the
+    # rules do not pay for a pandas (MultiIndex) lookup per access. Syntax to
+    # access a value within equation definitions looks like this:
+    #
+    #     m.storage_dict[attribute][site, storage, commodity]
+    #
+    m.site_dict = m.site.to_dict()
+    m.commodity_dict = m.commodity.to_dict()
+    m.process_dict = m.process.to_dict()
+    m.transmission_dict = m.transmission.to_dict()
+    m.storage_dict = m.storage.to_dict()
+    m.dsm_dict = m.dsm.to_dict()
+
+    # process_commodity ratios, accessed as m.r_in_dict[process, commodity]
+    m.r_in_dict = m.r_in.to_dict()
+    m.r_out_dict = m.r_out.to_dict()
+    m.r_in_min_fraction_dict = m.r_in_min_fraction.to_dict()
+
+    # timeseries as NumPy matrices with timestep/column position maps; read
+    # single values by timeseries_value(m.demand_ts, tm, (site, commodity))
+    m.demand_ts = timeseries_matrix(m.demand)
+    m.supim_ts = timeseries_matrix(m.supim)
+    m.buy_sell_price_ts = timeseries_matrix(m.buy_sell_price)
+
     # Sets
     # ====
     # Syntax: m.{name} = Set({domain}, initialize={values})
@@ -94,6 +199,30 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         ordered=True,
         doc='Set of modelled timesteps')
 
+    # representative periods and calendar periods (plus the end of the last
+    # one) for seasonal storage
+    if m.calendar is not None:
+        if not period_length:
+            raise ValueError("A calendar requires a period_length")
+        m.periods = representative_periods(m.timesteps, period_length)
+        unknown = set(m.calendar) - set(range(len(m.periods)))
+        if unknown:
+            raise ValueError("Calendar contains unknown representative "
+                             "periods {}".format(sorted(unknown)))
+        m.period_of = dict((t, r) for r, steps in enumerate(m.periods)
+                           for t in steps)
+        if weights is None:
+            weights = dict((t, m.calendar.count(m.period_of[t]))
+                           for t in m.period_of)
+        m.rep = pyomo.Set(
+            initialize=range(len(m.periods)),
+            ordered=True,
+            doc='Set of representative periods')
+        m.cal = pyomo.Set(
+            initialize=range(len(m.calendar) + 1),
+            ordered=True,
+            doc='Set of calendar periods and the end of the last one')
+
     # modelled Demand Side Management time steps (downshift):
     # downshift effective in tt to compensate for upshift in t
     m.tt = pyomo.Set(
@@ -153,6 +282,23 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         initialize=m.transmission.index,
         doc='Combinations of possible transmissions, e.g. '
             '(South,Mid,hvac,Elec)')
+
+    # representative direction of every transmission (c.f.
+    # transmission_pairs) for the undirected transmission representation
+    m.tra_pair = transmission_pairs(m)
+    m.tra_pair_tuples = pyomo.Set(
+        within=m.sit*m.sit*m.tra*m.com,
+        initialize=[tra for tra in m.tra_tuples if m.tra_pair[tra] == tra],
+        doc='Transmissions that represent both directions between two '
+            'sites, e.g. (South,Mid,hvac,Elec)')
+    if m.undirected_transmission:
+        for tra, pair in m.tra_pair.items():
+            for column in ['inst-cap', 'cap-lo', 'cap-up']:
+                if (m.transmission.loc[tra, column] !=
+                        m.transmission.loc[pair, column]):
+                    raise ValueError("Transmission {} and {} differ in {}"
+                                     .format(tra, pair, column))
+
     m.sto_tuples = pyomo.Set(
         within=m.sit*m.sto*m.com,
         initialize=m.storage.index,
@@ -163,11 +309,8 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         doc='Combinations of possible dsm by site, e.g. (Mid, Elec)')
     m.dsm_down_tuples = pyomo.Set(
         within=m.tm*m.tm*m.sit*m.com,
-        initialize=[(t, tt, site, commodity)
-                    for (t, tt, site, commodity)
-                    in dsm_down_time_tuples(m.timesteps[1:],
-                                            m.dsm_site_tuples,
-                                            m)],
+        initialize=[] if m.dsm_formulation != 'pairwise' else
+        dsm_down_time_tuples(m.timesteps[1:], m.dsm_site_tuples, m),
         doc='Combinations of possible dsm_down combinations, e.g. '
             '(5001,5003,Mid,Elec)')
 
@@ -177,6 +320,11 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         initialize=m.proc_area.index,
         doc='Processes and Sites with area Restriction')
 
+    # processes with area restriction grouped by site, e.g. {Mid: [PV]}
+    m.pro_area_dict = {}
+    for (sit, pro) in m.pro_area_tuples:
+        m.pro_area_dict.setdefault(sit, []).append(pro)
+
     # process input/output
     m.pro_input_tuples = pyomo.Set(
         within=m.sit*m.pro*m.com,
@@ -198,7 +346,8 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         within=m.sit*m.pro,
         initialize=[(sit, pro)
                     for (sit, pro) in m.pro_tuples
-                    if m.process.loc[sit, pro]['max-grad'] < 1.0 / dt],
+                    if m.process_dict['max-grad'][sit, pro] <
+                    1.0 / min(m.duration.values())],
         doc='Processes with maximum gradient smaller than timestep length')
 
     # process tuples for startup & partial feature
@@ -244,6 +393,60 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         initialize=commodity_subset(m.com_tuples, 'Env'),
         doc='Commodities that (might) have a maximum creation limit')
 
+    # filtered tuple sets
+    # constraints that only apply to a fraction of a tuple set are indexed
+    # over these subsets, so that their rules are only called for entries
+    # that actually produce a constraint
+    m.com_vertex_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[(sit, com, com_type)
+                    for (sit, com, com_type) in m.com_tuples
+                    if com not in m.com_env and com not in m.com_supim],
+        doc='Commodities with a vertex balance (all but SupIm and Env)')
+    m.com_stock_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples if c[1] in m.com_stock],
+        doc='Stock commodities by site, e.g. (Mid,Coal,Stock)')
+    m.com_sell_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples if c[1] in m.com_sell],
+        doc='Sell commodities by site, e.g. (Mid,Elec sell,Sell)')
+    m.com_buy_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples if c[1] in m.com_buy],
+        doc='Buy commodities by site, e.g. (Mid,Elec buy,Buy)')
+    m.com_env_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples if c[1] in m.com_env],
+        doc='Environmental commodities by site, e.g. (Mid,CO2,Env)')
+
+    # prices of sell and buy commodities per timestep (tm x com tuple);
+    # used by the Revenue and Purchase costs and by get_com_price
+    m.com_price_ts = com_price_matrix(
+        m, list(m.com_sell_tuples) + list(m.com_buy_tuples))
+    m.pro_supim_input_tuples = pyomo.Set(
+        within=m.sit*m.pro*m.com,
+        initialize=[(site, process, commodity)
+                    for (site, process, commodity) in m.pro_input_tuples
+                    if commodity in m.com_supim],
+        doc='SupIm commodities consumed by process, e.g. (Mid,PV,Solar)')
+    m.pro_buy_input_tuples = pyomo.Set(
+        within=m.sit*m.pro*m.com,
+        initialize=[(site, process, commodity)
+                    for (site, process, commodity) in m.pro_input_tuples
+                    if commodity in m.com_buy],
+        doc='Buy commodities consumed by process, e.g. (Mid,Grid,Elec buy)')
+
+    # equivalent sell process for each buy process, e.g. {Grid: Feed-in}
+    m.sell_buy_pairs = sell_buy_pairs(m)
+
+    # first and last time step, the only ones with a storage state condition
+    m.t_init_final = pyomo.Set(
+        within=m.t,
+        initialize=sorted(set([m.timesteps[0], m.timesteps[-1]])),
+        ordered=True,
+        doc='Set of first and last timestep')
+
     # Parameters
 
     # weight = length of year (hours) / length of simulation (hours)
@@ -251,17 +454,29 @@ def create_model(data, timesteps=None, dt=1, dual=False):
     # year, making comparisons among cost types (invest is annualized, fixed
     # costs are annual by default, variable costs are scaled by weight) and
     # among different simulation durations meaningful.
+    # timestep_weight = number of timesteps a modelled timestep represents,
+    # 1 unless the timeseries have been aggregated to representative periods
+    m.timestep_weight = timestep_weights(m.timesteps[1:], weights)
     m.weight = pyomo.Param(
-        initialize=float(8760) / (len(m.tm) * dt),
+        initialize=float(8760) / sum(m.timestep_weight[t] * m.duration[t]
+                                     for t in m.timestep_weight),
         doc='Pre-factor for variable costs and emissions for an annual result')
 
     # dt = spacing between timesteps. Required for storage equation that
     # converts between energy (storage content, e_sto_con) and power (all other
-    # quantities that start with "e_")
+    # quantities that start with "e_"), for gradients and for energy totals
     m.dt = pyomo.Param(
-        initialize=dt,
+        m.tm,
+        initialize=m.duration,
         doc='Time step duration (in hours), default: 1')
 
+    # predecessor of each modelled timestep; the last timestep of the same
+    # period for the first timestep of each representative period
+    m.previous_timestep = previous_timesteps(m.timesteps, period_length)
+
+    if mutable:
+        add_mutable_params(m)
+
     # Variables
 
     # costs
@@ -274,37 +489,43 @@ def create_model(data, timesteps=None, dt=1, dual=False):
     m.e_co_stock = pyomo.Var(
         m.tm, m.com_tuples,
         within=pyomo.NonNegativeReals,
+        bounds=e_co_stock_bounds_rule if m.var_bounds else None,
         doc='Use of stock commodity source (MW) per timestep')
     m.e_co_sell = pyomo.Var(
         m.tm, m.com_tuples,
         within=pyomo.NonNegativeReals,
+        bounds=e_co_sell_bounds_rule if m.var_bounds else None,
         doc='Use of sell commodity source (MW) per timestep')
     m.e_co_buy = pyomo.Var(
         m.tm, m.com_tuples,
         within=pyomo.NonNegativeReals,
+        bounds=e_co_buy_bounds_rule if m.var_bounds else None,
         doc='Use of buy commodity source (MW) per timestep')
 
     # process
-    m.cap_pro = pyomo.Var(
-        m.pro_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='Total process capacity (MW)')
+    if not m.reduced:
+        m.cap_pro = pyomo.Var(
+            m.pro_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Total process capacity (MW)')
     m.cap_pro_new = pyomo.Var(
         m.pro_tuples,
         within=pyomo.NonNegativeReals,
+        bounds=cap_pro_new_bounds_rule if m.var_bounds else None,
         doc='New process capacity (MW)')
     m.tau_pro = pyomo.Var(
         m.t, m.pro_tuples,
         within=pyomo.NonNegativeReals,
         doc='Power flow (MW) through process')
-    m.e_pro_in = pyomo.Var(
-        m.tm, m.pro_tuples, m.com,
-        within=pyomo.NonNegativeReals,
-        doc='Power flow of commodity into process (MW) per timestep')
-    m.e_pro_out = pyomo.Var(
-        m.tm, m.pro_tuples, m.com,
-        within=pyomo.NonNegativeReals,
-        doc='Power flow out of process (MW) per timestep')
+    if not m.reduced:
+        m.e_pro_in = pyomo.Var(
+            m.tm, m.pro_tuples, m.com,
+            within=pyomo.NonNegativeReals,
+            doc='Power flow of commodity into process (MW) per timestep')
+        m.e_pro_out = pyomo.Var(
+            m.tm, m.pro_tuples, m.com,
+            within=pyomo.NonNegativeReals,
+            doc='Power flow out of process (MW) per timestep')
 
     m.cap_online = pyomo.Var(
         m.t, m.pro_partial_tuples,
@@ -316,39 +537,58 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         doc='Started capacity (MW) of process per timestep')
 
     # transmission
-    m.cap_tra = pyomo.Var(
-        m.tra_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='Total transmission capacity (MW)')
-    m.cap_tra_new = pyomo.Var(
-        m.tra_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='New transmission capacity (MW)')
+    if m.undirected_transmission:
+        # cap_tra_new and cap_tra are expressions of this variable
+        m.cap_tra_pair_new = pyomo.Var(
+            m.tra_pair_tuples,
+            within=pyomo.NonNegativeReals,
+            bounds=cap_tra_new_bounds_rule if m.var_bounds else None,
+            doc='New transmission capacity (MW) in both directions')
+        m.cap_tra_new = pyomo.Expression(
+            m.tra_tuples,
+            rule=cap_tra_new_rule,
+            doc='New transmission capacity (MW)')
+    else:
+        if not m.reduced:
+            m.cap_tra = pyomo.Var(
+                m.tra_tuples,
+                within=pyomo.NonNegativeReals,
+                doc='Total transmission capacity (MW)')
+        m.cap_tra_new = pyomo.Var(
+            m.tra_tuples,
+            within=pyomo.NonNegativeReals,
+            bounds=cap_tra_new_bounds_rule if m.var_bounds else None,
+            doc='New transmission capacity (MW)')
     m.e_tra_in = pyomo.Var(
         m.tm, m.tra_tuples,
         within=pyomo.NonNegativeReals,
         doc='Power flow into transmission line (MW) per timestep')
-    m.e_tra_out = pyomo.Var(
-        m.tm, m.tra_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='Power flow out of transmission line (MW) per timestep')
+    if not m.reduced:
+        m.e_tra_out = pyomo.Var(
+            m.tm, m.tra_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Power flow out of transmission line (MW) per timestep')
 
     # storage
-    m.cap_sto_c = pyomo.Var(
-        m.sto_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='Total storage size (MWh)')
+    if not m.reduced:
+        m.cap_sto_c = pyomo.Var(
+            m.sto_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Total storage size (MWh)')
     m.cap_sto_c_new = pyomo.Var(
         m.sto_tuples,
         within=pyomo.NonNegativeReals,
+        bounds=cap_sto_c_new_bounds_rule if m.var_bounds else None,
         doc='New storage size (MWh)')
-    m.cap_sto_p = pyomo.Var(
-        m.sto_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='Total storage power (MW)')
+    if not m.reduced:
+        m.cap_sto_p = pyomo.Var(
+            m.sto_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Total storage power (MW)')
     m.cap_sto_p_new = pyomo.Var(
         m.sto_tuples,
         within=pyomo.NonNegativeReals,
+        bounds=cap_sto_p_new_bounds_rule if m.var_bounds else None,
         doc='New  storage power (MW)')
     m.e_sto_in = pyomo.Var(
         m.tm, m.sto_tuples,
@@ -360,18 +600,85 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         doc='Power flow out of storage (MW) per timestep')
     m.e_sto_con = pyomo.Var(
         m.t, m.sto_tuples,
-        within=pyomo.NonNegativeReals,
+        within=pyomo.NonNegativeReals if m.calendar is None else pyomo.Reals,
         doc='Energy content of storage (MWh) in timestep')
+    if m.calendar is not None:
+        m.e_sto_inter = pyomo.Var(
+            m.cal, m.sto_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Energy content of storage (MWh) at start of calendar period')
+        m.e_sto_intra_max = pyomo.Var(
+            m.rep, m.sto_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Maximum storage content (MWh) relative to period start')
+        m.e_sto_intra_min = pyomo.Var(
+            m.rep, m.sto_tuples,
+            within=pyomo.NonPositiveReals,
+            doc='Minimum storage content (MWh) relative to period start')
 
     # demand side management
     m.dsm_up = pyomo.Var(
         m.tm, m.dsm_site_tuples,
         within=pyomo.NonNegativeReals,
+        bounds=dsm_up_bounds_rule if m.var_bounds else None,
         doc='DSM upshift')
-    m.dsm_down = pyomo.Var(
-        m.dsm_down_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='DSM downshift')
+    if m.dsm_formulation == 'cumulative':
+        m.dsm_down = pyomo.Var(
+            m.tm, m.dsm_site_tuples,
+            within=pyomo.NonNegativeReals,
+            bounds=dsm_down_bounds_rule if m.var_bounds else None,
+            doc='DSM downshift')
+        m.dsm_up_cum = pyomo.Var(
+            m.tm, m.dsm_site_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Cumulative DSM upshift (times efficiency) until timestep')
+        m.dsm_down_cum = pyomo.Var(
+            m.tm, m.dsm_site_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Cumulative DSM downshift until timestep')
+    else:
+        m.dsm_down = pyomo.Var(
+            m.dsm_down_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='DSM downshift')
+
+    # reduced formulation: variables that are defined by an equality
+    # (c.f. the def_* rules below) become expressions of other variables
+    if m.reduced or m.undirected_transmission:
+        m.cap_tra = pyomo.Expression(
+            m.tra_tuples,
+            rule=cap_tra_rule,
+            doc='Total transmission capacity (MW)')
+    if m.reduced:
+        m.cap_pro = pyomo.Expression(
+            m.pro_tuples,
+            rule=cap_pro_rule,
+            doc='Total process capacity (MW)')
+        m.e_pro_in = pyomo.Expression(
+            m.tm, m.pro_input_tuples,
+            rule=e_pro_in_rule,
+            doc='Power flow of commodity into process (MW) per timestep')
+        m.e_pro_out = pyomo.Expression(
+            m.tm, m.pro_output_tuples,
+            rule=e_pro_out_rule,
+            doc='Power flow out of process (MW) per timestep')
+        m.e_tra_out = pyomo.Expression(
+            m.tm, m.tra_tuples,
+            rule=e_tra_out_rule,
+            doc='Power flow out of transmission line (MW) per timestep')
+        m.cap_sto_c = pyomo.Expression(
+            m.sto_tuples,
+            rule=cap_sto_c_rule,
+            doc='Total storage size (MWh)')
+        m.cap_sto_p = pyomo.Expression(
+            m.sto_tuples,
+            rule=cap_sto_p_rule,
+            doc='Total storage power (MW)')
+
+    # commodity balance incidence: lists the flows (process, transmission,
+    # storage) that enter each (site, commodity) balance; used by
+    # commodity_balance in all commodity, cost and hack rules
+    m.com_incidence = commodity_incidence(m)
 
     # Equation declarations
     # equation bodies are defined in separate functions, referred to here by
@@ -379,57 +686,61 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 
     # commodity
     m.res_vertex = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_vertex_tuples,
         rule=res_vertex_rule,
         doc='storage + transmission + process + source + buy - sell == demand')
-    m.res_stock_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
-        rule=res_stock_step_rule,
-        doc='stock commodity input per step <= commodity.maxperstep')
+    if not m.var_bounds:
+        m.res_stock_step = pyomo.Constraint(
+            m.tm, m.com_stock_tuples,
+            rule=res_stock_step_rule,
+            doc='stock commodity input per step <= commodity.maxperstep')
     m.res_stock_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_stock_tuples,
         rule=res_stock_total_rule,
         doc='total stock commodity input <= commodity.max')
-    m.res_sell_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
-        rule=res_sell_step_rule,
-        doc='sell commodity output per step <= commodity.maxperstep')
+    if not m.var_bounds:
+        m.res_sell_step = pyomo.Constraint(
+            m.tm, m.com_sell_tuples,
+            rule=res_sell_step_rule,
+            doc='sell commodity output per step <= commodity.maxperstep')
     m.res_sell_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_sell_tuples,
         rule=res_sell_total_rule,
         doc='total sell commodity output <= commodity.max')
-    m.res_buy_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
-        rule=res_buy_step_rule,
-        doc='buy commodity output per step <= commodity.maxperstep')
+    if not m.var_bounds:
+        m.res_buy_step = pyomo.Constraint(
+            m.tm, m.com_buy_tuples,
+            rule=res_buy_step_rule,
+            doc='buy commodity output per step <= commodity.maxperstep')
     m.res_buy_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_buy_tuples,
         rule=res_buy_total_rule,
         doc='total buy commodity output <= commodity.max')
     m.res_env_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_env_tuples,
         rule=res_env_step_rule,
         doc='environmental output per step <= commodity.maxperstep')
     m.res_env_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_env_tuples,
         rule=res_env_total_rule,
         doc='total environmental commodity output <= commodity.max')
 
     # process
-    m.def_process_capacity = pyomo.Constraint(
-        m.pro_tuples,
-        rule=def_process_capacity_rule,
-        doc='total process capacity = inst-cap + new capacity')
-    m.def_process_input = pyomo.Constraint(
-        m.tm, m.pro_input_tuples - m.pro_partial_input_tuples,
-        rule=def_process_input_rule,
-        doc='process input = process throughput * input ratio')
-    m.def_process_output = pyomo.Constraint(
-        m.tm, m.pro_output_tuples,
-        rule=def_process_output_rule,
-        doc='process output = process throughput * output ratio')
+    if not m.reduced:
+        m.def_process_capacity = pyomo.Constraint(
+            m.pro_tuples,
+            rule=def_process_capacity_rule,
+            doc='total process capacity = inst-cap + new capacity')
+        m.def_process_input = pyomo.Constraint(
+            m.tm, m.pro_input_tuples - m.pro_partial_input_tuples,
+            rule=def_process_input_rule,
+            doc='process input = process throughput * input ratio')
+        m.def_process_output = pyomo.Constraint(
+            m.tm, m.pro_output_tuples,
+            rule=def_process_output_rule,
+            doc='process output = process throughput * output ratio')
     m.def_intermittent_supply = pyomo.Constraint(
-        m.tm, m.pro_input_tuples,
+        m.tm, m.pro_supim_input_tuples,
         rule=def_intermittent_supply_rule,
         doc='process output = process capacity * supim timeseries')
     m.res_process_throughput_by_capacity = pyomo.Constraint(
@@ -444,10 +755,11 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         m.tm, m.pro_maxgrad_tuples,
         rule=res_process_maxgrad_upper_rule,
         doc='throughput may not increase faster than maximal gradient')
-    m.res_process_capacity = pyomo.Constraint(
-        m.pro_tuples,
-        rule=res_process_capacity_rule,
-        doc='process.cap-lo <= total process capacity <= process.cap-up')
+    if not m.var_bounds:
+        m.res_process_capacity = pyomo.Constraint(
+            m.pro_tuples,
+            rule=res_process_capacity_rule,
+            doc='process.cap-lo <= total process capacity <= process.cap-up')
 
     m.res_area = pyomo.Constraint(
         m.sit,
@@ -455,7 +767,7 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         doc='used process area <= total process area')
 
     m.res_sell_buy_symmetry = pyomo.Constraint(
-        m.pro_input_tuples,
+        m.pro_buy_input_tuples,
         rule=res_sell_buy_symmetry_rule,
         doc='power connection capacity must be symmetric in both directions')
 
@@ -467,12 +779,13 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         m.tm, m.pro_partial_tuples,
         rule=res_throughput_by_online_capacity_max_rule,
         doc='tau_pro <= cap_online')
-    m.def_partial_process_input = pyomo.Constraint(
-        m.tm, m.pro_partial_input_tuples,
-        rule=def_partial_process_input_rule,
-        doc='e_pro_in = '
-            ' cap_online * min_fraction * (r - R) / (1 - min_fraction)'
-            ' + tau_pro * (R - min_fraction * r) / (1 - min_fraction)')
+    if not m.reduced:
+        m.def_partial_process_input = pyomo.Constraint(
+            m.tm, m.pro_partial_input_tuples,
+            rule=def_partial_process_input_rule,
+            doc='e_pro_in = '
+                ' cap_online * min_fraction * (r - R) / (1 - min_fraction)'
+                ' + tau_pro * (R - min_fraction * r) / (1 - min_fraction)')
     m.res_cap_online_by_cap_pro = pyomo.Constraint(
         m.tm, m.pro_partial_tuples,
         rule=res_cap_online_by_cap_pro_rule,
@@ -483,41 +796,48 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         doc='startup_capacity[t] >= cap_online[t] - cap_online[t-1]')
 
     # transmission
-    m.def_transmission_capacity = pyomo.Constraint(
-        m.tra_tuples,
-        rule=def_transmission_capacity_rule,
-        doc='total transmission capacity = inst-cap + new capacity')
-    m.def_transmission_output = pyomo.Constraint(
-        m.tm, m.tra_tuples,
-        rule=def_transmission_output_rule,
-        doc='transmission output = transmission input * efficiency')
+    if not (m.reduced or m.undirected_transmission):
+        m.def_transmission_capacity = pyomo.Constraint(
+            m.tra_tuples,
+            rule=def_transmission_capacity_rule,
+            doc='total transmission capacity = inst-cap + new capacity')
+    if not m.reduced:
+        m.def_transmission_output = pyomo.Constraint(
+            m.tm, m.tra_tuples,
+            rule=def_transmission_output_rule,
+            doc='transmission output = transmission input * efficiency')
     m.res_transmission_input_by_capacity = pyomo.Constraint(
         m.tm, m.tra_tuples,
         rule=res_transmission_input_by_capacity_rule,
         doc='transmission input <= total transmission capacity')
-    m.res_transmission_capacity = pyomo.Constraint(
-        m.tra_tuples,
-        rule=res_transmission_capacity_rule,
-        doc='transmission.cap-lo <= total transmission capacity <= '
-            'transmission.cap-up')
-    m.res_transmission_symmetry = pyomo.Constraint(
-        m.tra_tuples,
-        rule=res_transmission_symmetry_rule,
-        doc='total transmission capacity must be symmetric in both directions')
+    if not m.var_bounds:
+        # both directions have the same limits if undirected_transmission
+        m.res_transmission_capacity = pyomo.Constraint(
+            m.tra_pair_tuples if m.undirected_transmission else m.tra_tuples,
+            rule=res_transmission_capacity_rule,
+            doc='transmission.cap-lo <= total transmission capacity <= '
+                'transmission.cap-up')
+    if not m.undirected_transmission:
+        m.res_transmission_symmetry = pyomo.Constraint(
+            m.tra_tuples,
+            rule=res_transmission_symmetry_rule,
+            doc='total transmission capacity must be symmetric in both '
+                'directions')
 
     # storage
     m.def_storage_state = pyomo.Constraint(
         m.tm, m.sto_tuples,
         rule=def_storage_state_rule,
         doc='storage[t] = storage[t-1] + input - output')
-    m.def_storage_power = pyomo.Constraint(
-        m.sto_tuples,
-        rule=def_storage_power_rule,
-        doc='storage power = inst-cap + new power')
-    m.def_storage_capacity = pyomo.Constraint(
-        m.sto_tuples,
-        rule=def_storage_capacity_rule,
-        doc='storage capacity = inst-cap + new capacity')
+    if not m.reduced:
+        m.def_storage_power = pyomo.Constraint(
+            m.sto_tuples,
+            rule=def_storage_power_rule,
+            doc='storage power = inst-cap + new power')
+        m.def_storage_capacity = pyomo.Constraint(
+            m.sto_tuples,
+            rule=def_storage_capacity_rule,
+            doc='storage capacity = inst-cap + new capacity')
     m.res_storage_input_by_power = pyomo.Constraint(
         m.tm, m.sto_tuples,
         rule=res_storage_input_by_power_rule,
@@ -526,22 +846,53 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         m.tm, m.sto_tuples,
         rule=res_storage_output_by_power_rule,
         doc='storage output <= storage power')
-    m.res_storage_state_by_capacity = pyomo.Constraint(
-        m.t, m.sto_tuples,
-        rule=res_storage_state_by_capacity_rule,
-        doc='storage content <= storage capacity')
-    m.res_storage_power = pyomo.Constraint(
-        m.sto_tuples,
-        rule=res_storage_power_rule,
-        doc='storage.cap-lo-p <= storage power <= storage.cap-up-p')
-    m.res_storage_capacity = pyomo.Constraint(
-        m.sto_tuples,
-        rule=res_storage_capacity_rule,
-        doc='storage.cap-lo-c <= storage capacity <= storage.cap-up-c')
-    m.res_initial_and_final_storage_state = pyomo.Constraint(
-        m.t, m.sto_tuples,
-        rule=res_initial_and_final_storage_state_rule,
-        doc='storage content initial == and final >= storage.init * capacity')
+    if m.calendar is None:
+        m.res_storage_state_by_capacity = pyomo.Constraint(
+            m.t, m.sto_tuples,
+            rule=res_storage_state_by_capacity_rule,
+            doc='storage content <= storage capacity')
+    else:
+        m.def_storage_inter_state = pyomo.Constraint(
+            m.cal, m.sto_tuples,
+            rule=def_storage_inter_state_rule,
+            doc='storage[d+1] = storage[d] + change over period of d')
+        m.res_storage_intra_max = pyomo.Constraint(
+            m.tm, m.sto_tuples,
+            rule=res_storage_intra_max_rule,
+            doc='storage content change <= maximum change of period')
+        m.res_storage_intra_min = pyomo.Constraint(
+            m.tm, m.sto_tuples,
+            rule=res_storage_intra_min_rule,
+            doc='storage content change >= minimum change of period')
+        m.res_storage_inter_by_capacity = pyomo.Constraint(
+            m.cal, m.sto_tuples,
+            rule=res_storage_inter_by_capacity_rule,
+            doc='storage[d] + maximum change of period <= storage capacity')
+        m.res_storage_inter_min = pyomo.Constraint(
+            m.cal, m.sto_tuples,
+            rule=res_storage_inter_min_rule,
+            doc='storage[d] + minimum change of period >= 0')
+    if not m.var_bounds:
+        m.res_storage_power = pyomo.Constraint(
+            m.sto_tuples,
+            rule=res_storage_power_rule,
+            doc='storage.cap-lo-p <= storage power <= storage.cap-up-p')
+        m.res_storage_capacity = pyomo.Constraint(
+            m.sto_tuples,
+            rule=res_storage_capacity_rule,
+            doc='storage.cap-lo-c <= storage capacity <= storage.cap-up-c')
+    if not m.period_length:
+        m.res_initial_and_final_storage_state = pyomo.Constraint(
+            m.t_init_final, m.sto_tuples,
+            rule=res_initial_and_final_storage_state_rule,
+            doc='storage content initial == and final >= '
+                'storage.init * capacity')
+    elif m.calendar is not None:
+        m.res_initial_and_final_storage_state = pyomo.Constraint(
+            m.cal, m.sto_tuples,
+            rule=res_initial_and_final_storage_inter_rule,
+            doc='storage content initial == and final >= '
+                'storage.init * capacity')
 
     # costs
     m.def_costs = pyomo.Constraint(
@@ -554,20 +905,45 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         doc='minimize(cost = sum of all cost types)')
 
     # demand side management
-    m.def_dsm_variables = pyomo.Constraint(
-        m.tm, m.dsm_site_tuples,
-        rule=def_dsm_variables_rule,
-        doc='DSMup * efficiency factor n == DSMdo')
-
-    m.res_dsm_upward = pyomo.Constraint(
-        m.tm, m.dsm_site_tuples,
-        rule=res_dsm_upward_rule,
-        doc='DSMup <= Cup (threshold capacity of DSMup)')
-
-    m.res_dsm_downward = pyomo.Constraint(
-        m.tm, m.dsm_site_tuples,
-        rule=res_dsm_downward_rule,
-        doc='DSMdo <= Cdo (threshold capacity of DSMdo)')
+    if m.dsm_formulation == 'cumulative':
+        m.def_dsm_up_cumulative = pyomo.Constraint(
+            m.tm, m.dsm_site_tuples,
+            rule=def_dsm_up_cumulative_rule,
+            doc='DSMupcum[t] == DSMupcum[t-1] + DSMup[t] * efficiency n')
+        m.def_dsm_down_cumulative = pyomo.Constraint(
+            m.tm, m.dsm_site_tuples,
+            rule=def_dsm_down_cumulative_rule,
+            doc='DSMdocum[t] == DSMdocum[t-1] + DSMdo[t]')
+        m.res_dsm_delay_up = pyomo.Constraint(
+            m.tm, m.dsm_site_tuples,
+            rule=res_dsm_delay_up_rule,
+            doc='DSMdocum[t] >= DSMupcum[t - delay]')
+        m.res_dsm_delay_down = pyomo.Constraint(
+            m.tm, m.dsm_site_tuples,
+            rule=res_dsm_delay_down_rule,
+            doc='DSMupcum[t] >= DSMdocum[t - delay]')
+        m.res_dsm_balance = pyomo.Constraint(
+            m.dsm_site_tuples,
+            rule=res_dsm_balance_rule,
+            doc='DSMupcum[last] == DSMdocum[last]')
+    else:
+        m.def_dsm_variables = pyomo.Constraint(
+            m.tm, m.dsm_site_tuples,
+            rule=def_dsm_variables_rule,
+            doc='DSMup * efficiency factor n == DSMdo')
+
+    if not m.var_bounds:
+        m.res_dsm_upward = pyomo.Constraint(
+            m.tm, m.dsm_site_tuples,
+            rule=res_dsm_upward_rule,
+            doc='DSMup <= Cup (threshold capacity of DSMup)')
+
+    # a single variable in the cumulative formulation
+    if not (m.var_bounds and m.dsm_formulation == 'cumulative'):
+        m.res_dsm_downward = pyomo.Constraint(
+            m.tm, m.dsm_site_tuples,
+            rule=res_dsm_downward_rule,
+            doc='DSMdo <= Cdo (threshold capacity of DSMdo)')
 
     m.res_dsm_maximum = pyomo.Constraint(
         m.tm, m.dsm_site_tuples,
@@ -585,6 +961,8 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 
     if dual:
         m.dual = pyomo.Suffix(direction=pyomo.Suffix.IMPORT)
+    if profile:
+        m.stop_profile()
     return m
 
 
@@ -597,11 +975,8 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 # storage activity (calculated by function commodity_balance);
 # contains implicit constraint for stock commodity source term
 def res_vertex_rule(m, tm, sit, com, com_type):
-    # environmental or supim commodities don't have this constraint (yet)
-    if com in m.com_env:
-        return pyomo.Constraint.Skip
-    if com in m.com_supim:
-        return pyomo.Constraint.Skip
+    # environmental or supim commodities don't have this constraint (yet),
+    # so they are not part of its index set m.com_vertex_tuples
 
     # helper function commodity_balance calculates balance from input to
     # and output from processes, storage and transmission.
@@ -631,17 +1006,14 @@ def res_vertex_rule(m, tm, sit, com, com_type):
     # constraint is about power (MW), not energy (MWh)
     if com in m.com_demand:
         try:
-            power_surplus -= m.demand.loc[tm][sit, com]
+            power_surplus -= timeseries_value(m.demand_ts, tm, (sit, com))
         except KeyError:
             pass
     # if sit com is a dsm tuple, the power surplus is decreased by the
     # upshifted demand and increased by the downshifted demand.
     if (sit, com) in m.dsm_site_tuples:
         power_surplus -= m.dsm_up[tm, sit, com]
-        power_surplus += sum(m.dsm_down[t, tm, sit, com]
-                             for t in dsm_time_tuples(
-                                 tm, m.timesteps[1:],
-                                 m.dsm['delay'].loc[sit, com]))
+        power_surplus += dsm_downshift(m, tm, sit, com)
     return power_surplus == 0
 
 # demand side management (DSM) constraints
@@ -651,37 +1023,40 @@ def res_vertex_rule(m, tm, sit, com, com_type):
 def def_dsm_variables_rule(m, tm, sit, com):
     dsm_down_sum = 0
     for tt in dsm_time_tuples(tm,
-                              m.timesteps[1:],
-                              m.dsm['delay'].loc[sit, com]):
+                              m.tm_bounds,
+                              m.dsm_dict['delay'][sit, com]):
         dsm_down_sum += m.dsm_down[tm, tt, sit, com]
-    return dsm_down_sum == m.dsm_up[tm, sit, com] * m.dsm.loc[sit, com]['eff']
+    return dsm_down_sum == m.dsm_up[tm, sit, com] * m.dsm_dict['eff'][sit, com]
 
 
 # DSMup <= Cup (threshold capacity of DSMup)
 def res_dsm_upward_rule(m, tm, sit, com):
-    return m.dsm_up[tm, sit, com] <= int(m.dsm.loc[sit, com]['cap-max-up'])
+    return m.dsm_up[tm, sit, com] <= int(m.dsm_dict['cap-max-up'][sit, com])
+
+
+# bounds of DSMup if var_bounds (c.f. res_dsm_upward_rule)
+def dsm_up_bounds_rule(m, tm, sit, com):
+    return (0, int(m.dsm_dict['cap-max-up'][sit, com]))
 
 
 # DSMdo <= Cdo (threshold capacity of DSMdo)
 def res_dsm_downward_rule(m, tm, sit, com):
-    dsm_down_sum = 0
-    for t in dsm_time_tuples(tm,
-                             m.timesteps[1:],
-                             m.dsm['delay'].loc[sit, com]):
-        dsm_down_sum += m.dsm_down[t, tm, sit, com]
-    return dsm_down_sum <= m.dsm.loc[sit, com]['cap-max-do']
+    dsm_down_sum = dsm_downshift(m, tm, sit, com)
+    return dsm_down_sum <= m.dsm_dict['cap-max-do'][sit, com]
+
+
+# bounds of DSMdo in the cumulative formulation if var_bounds (c.f.
+# res_dsm_downward_rule)
+def dsm_down_bounds_rule(m, tm, sit, com):
+    return (0, m.dsm_dict['cap-max-do'][sit, com])
 
 
 # DSMup + DSMdo <= max(Cup,Cdo)
 def res_dsm_maximum_rule(m, tm, sit, com):
-    dsm_down_sum = 0
-    for t in dsm_time_tuples(tm,
-                             m.timesteps[1:],
-                             m.dsm['delay'].loc[sit, com]):
-        dsm_down_sum += m.dsm_down[t, tm, sit, com]
+    dsm_down_sum = dsm_downshift(m, tm, sit, com)
 
-    max_dsm_limit = max(m.dsm.loc[sit, com]['cap-max-up'],
-                        m.dsm.loc[sit, com]['cap-max-do'])
+    max_dsm_limit = max(m.dsm_dict['cap-max-up'][sit, com],
+                        m.dsm_dict['cap-max-do'][sit, com])
     return m.dsm_up[tm, sit, com] + dsm_down_sum <= max_dsm_limit
 
 
@@ -689,88 +1064,136 @@ def res_dsm_maximum_rule(m, tm, sit, com):
 def res_dsm_recovery_rule(m, tm, sit, com):
     dsm_up_sum = 0
     for t in dsm_recovery(tm,
-                          m.timesteps[1:],
-                          m.dsm['recov'].loc[sit, com]):
+                          m.tm_bounds,
+                          m.dsm_dict['recov'][sit, com]):
         dsm_up_sum += m.dsm_up[t, sit, com]
-    return dsm_up_sum <= (m.dsm.loc[sit, com]['cap-max-up'] *
-                          m.dsm['delay'].loc[sit, com])
+    return dsm_up_sum <= (m.dsm_dict['cap-max-up'][sit, com] *
+                          m.dsm_dict['delay'][sit, com])
+
+
+# cumulative DSM formulation: instead of pairing every upshift with its
+# downshifts (dsm_down[t, tt]), the cumulated upshift and downshift are
+# tracked; every upshift must be compensated within the delay and vice versa
+
+# DSMupcum[t] == DSMupcum[t-1] + DSMup[t] * efficiency factor n
+def def_dsm_up_cumulative_rule(m, tm, sit, com):
+    dsm_up_cum = m.dsm_up[tm, sit, com] * m.dsm_dict['eff'][sit, com]
+    if tm > m.tm_bounds[0]:
+        dsm_up_cum += m.dsm_up_cum[tm-1, sit, com]
+    return m.dsm_up_cum[tm, sit, com] == dsm_up_cum
+
+
+# DSMdocum[t] == DSMdocum[t-1] + DSMdo[t]
+def def_dsm_down_cumulative_rule(m, tm, sit, com):
+    dsm_down_cum = m.dsm_down[tm, sit, com]
+    if tm > m.tm_bounds[0]:
+        dsm_down_cum += m.dsm_down_cum[tm-1, sit, com]
+    return m.dsm_down_cum[tm, sit, com] == dsm_down_cum
+
+
+# DSMdocum[t] >= DSMupcum[t - delay]: upshifts compensated within delay
+def res_dsm_delay_up_rule(m, tm, sit, com):
+    delay = m.dsm_dict['delay'][sit, com]
+    if tm - delay < m.tm_bounds[0]:
+        return pyomo.Constraint.Skip
+    return m.dsm_down_cum[tm, sit, com] >= m.dsm_up_cum[tm-delay, sit, com]
+
+
+# DSMupcum[t] >= DSMdocum[t - delay]: downshifts compensated within delay
+def res_dsm_delay_down_rule(m, tm, sit, com):
+    delay = m.dsm_dict['delay'][sit, com]
+    if tm - delay < m.tm_bounds[0]:
+        return pyomo.Constraint.Skip
+    return m.dsm_up_cum[tm, sit, com] >= m.dsm_down_cum[tm-delay, sit, com]
+
+
+# DSMupcum[last] == DSMdocum[last]: all shifts compensated within horizon
+def res_dsm_balance_rule(m, sit, com):
+    last = m.tm_bounds[1]
+    return m.dsm_up_cum[last, sit, com] == m.dsm_down_cum[last, sit, com]
 
 
 # stock commodity purchase == commodity consumption, according to
 # commodity_balance of current (time step, site, commodity);
 # limit stock commodity use per time step
 def res_stock_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_stock:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_stock[tm, sit, com, com_type] <=
-                m.commodity.loc[sit, com, com_type]['maxperstep'])
+    return (m.e_co_stock[tm, sit, com, com_type] <=
+            m.commodity_dict['maxperstep'][sit, com, com_type])
+
+
+# bounds of stock commodity use if var_bounds (c.f. res_stock_step_rule)
+def e_co_stock_bounds_rule(m, tm, sit, com, com_type):
+    if (sit, com, com_type) in m.com_stock_tuples:
+        return (0, m.commodity_dict['maxperstep'][sit, com, com_type])
+    return (0, None)
 
 
 # limit stock commodity use in total (scaled to annual consumption, thanks
 # to m.weight)
 def res_stock_total_rule(m, sit, com, com_type):
-    if com not in m.com_stock:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total consumption of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_stock[tm, sit, com, com_type] * m.dt)
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity.loc[sit, com, com_type]['max'])
+    # calculate total consumption of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_stock[tm, sit, com, com_type] * m.dt[tm] *
+            m.timestep_weight[tm])
+    total_consumption *= m.weight
+    return (total_consumption <=
+            m.commodity_dict['max'][sit, com, com_type])
 
 
 # limit sell commodity use per time step
 def res_sell_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_sell:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_sell[tm, sit, com, com_type] <=
-                m.commodity.loc[sit, com, com_type]['maxperstep'])
+    return (m.e_co_sell[tm, sit, com, com_type] <=
+            m.commodity_dict['maxperstep'][sit, com, com_type])
+
+
+# bounds of sell commodity use if var_bounds (c.f. res_sell_step_rule)
+def e_co_sell_bounds_rule(m, tm, sit, com, com_type):
+    if (sit, com, com_type) in m.com_sell_tuples:
+        return (0, m.commodity_dict['maxperstep'][sit, com, com_type])
+    return (0, None)
 
 
 # limit sell commodity use in total (scaled to annual consumption, thanks
 # to m.weight)
 def res_sell_total_rule(m, sit, com, com_type):
-    if com not in m.com_sell:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total sale of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_sell[tm, sit, com, com_type] * m.dt)
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity.loc[sit, com, com_type]['max'])
+    # calculate total sale of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_sell[tm, sit, com, com_type] * m.dt[tm] *
+            m.timestep_weight[tm])
+    total_consumption *= m.weight
+    return (total_consumption <=
+            m.commodity_dict['max'][sit, com, com_type])
 
 
 # limit buy commodity use per time step
 def res_buy_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_buy:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_buy[tm, sit, com, com_type] <=
-                m.commodity.loc[sit, com, com_type]['maxperstep'])
+    return (m.e_co_buy[tm, sit, com, com_type] <=
+            m.commodity_dict['maxperstep'][sit, com, com_type])
+
+
+# bounds of buy commodity use if var_bounds (c.f. res_buy_step_rule)
+def e_co_buy_bounds_rule(m, tm, sit, com, com_type):
+    if (sit, com, com_type) in m.com_buy_tuples:
+        return (0, m.commodity_dict['maxperstep'][sit, com, com_type])
+    return (0, None)
 
 
 # limit buy commodity use in total (scaled to annual consumption, thanks
 # to m.weight)
 def res_buy_total_rule(m, sit, com, com_type):
-    if com not in m.com_buy:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total sale of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_buy[tm, sit, com, com_type] * m.dt)
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity.loc[sit, com, com_type]['max'])
+    # calculate total sale of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_buy[tm, sit, com, com_type] * m.dt[tm] *
+            m.timestep_weight[tm])
+    total_consumption *= m.weight
+    return (total_consumption <=
+            m.commodity_dict['max'][sit, com, com_type])
 
 
 # environmental commodity creation == - commodity_balance of that commodity
@@ -778,27 +1201,22 @@ def res_buy_total_rule(m, sit, com, com_type):
 # any process activity;
 # limit environmental commodity output per time step
 def res_env_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_env:
-        return pyomo.Constraint.Skip
-    else:
-        environmental_output = - commodity_balance(m, tm, sit, com)
-        return (environmental_output <=
-                m.commodity.loc[sit, com, com_type]['maxperstep'])
+    environmental_output = - commodity_balance(m, tm, sit, com)
+    return (environmental_output <=
+            m.commodity_dict['maxperstep'][sit, com, com_type])
 
 
 # limit environmental commodity output in total (scaled to annual
 # emissions, thanks to m.weight)
 def res_env_total_rule(m, sit, com, com_type):
-    if com not in m.com_env:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total creation of environmental commodity com
-        env_output_sum = 0
-        for tm in m.tm:
-            env_output_sum += (- commodity_balance(m, tm, sit, com) * m.dt)
-        env_output_sum *= m.weight
-        return (env_output_sum <=
-                m.commodity.loc[sit, com, com_type]['max'])
+    # calculate total creation of environmental commodity com
+    env_output_sum = 0
+    for tm in m.tm:
+        env_output_sum += (- commodity_balance(m, tm, sit, com) *
+                           m.dt[tm] * m.timestep_weight[tm])
+    env_output_sum *= m.weight
+    return (env_output_sum <=
+            m.commodity_dict['max'][sit, com, com_type])
 
 # process
 
@@ -807,28 +1225,42 @@ def res_env_total_rule(m, sit, com, com_type):
 def def_process_capacity_rule(m, sit, pro):
     return (m.cap_pro[sit, pro] ==
             m.cap_pro_new[sit, pro] +
-            m.process.loc[sit, pro]['inst-cap'])
+            m.process_dict['inst-cap'][sit, pro])
 
 
 # process input power == process throughput * input ratio
 def def_process_input_rule(m, tm, sit, pro, co):
     return (m.e_pro_in[tm, sit, pro, co] ==
-            m.tau_pro[tm, sit, pro] * m.r_in.loc[pro, co])
+            m.tau_pro[tm, sit, pro] * m.r_in_dict[pro, co])
 
 
 # process output power = process throughput * output ratio
 def def_process_output_rule(m, tm, sit, pro, co):
     return (m.e_pro_out[tm, sit, pro, co] ==
-            m.tau_pro[tm, sit, pro] * m.r_out.loc[pro, co])
+            m.tau_pro[tm, sit, pro] * m.r_out_dict[pro, co])
+
+
+# expressions of the reduced formulation, equivalent to the def_process_*
+# rules above and def_partial_process_input_rule below
+def cap_pro_rule(m, sit, pro):
+    return m.cap_pro_new[sit, pro] + m.process_dict['inst-cap'][sit, pro]
+
+
+def e_pro_in_rule(m, tm, sit, pro, co):
+    if (sit, pro, co) in m.pro_partial_input_tuples:
+        return partial_process_input(m, tm, sit, pro, co)
+    return m.tau_pro[tm, sit, pro] * m.r_in_dict[pro, co]
+
+
+def e_pro_out_rule(m, tm, sit, pro, co):
+    return m.tau_pro[tm, sit, pro] * m.r_out_dict[pro, co]
 
 
 # process input (for supim commodity) = process capacity * timeseries
 def def_intermittent_supply_rule(m, tm, sit, pro, coin):
-    if coin in m.com_supim:
-        return (m.e_pro_in[tm, sit, pro, coin] <=
-                m.cap_pro[sit, pro] * m.supim.loc[tm][sit, coin])
-    else:
-        return pyomo.Constraint.Skip
+    return (m.e_pro_in[tm, sit, pro, coin] <=
+            m.cap_pro[sit, pro] *
+            timeseries_value(m.supim_ts, tm, (sit, coin)))
 
 
 # process throughput <= process capacity
@@ -837,21 +1269,23 @@ def res_process_throughput_by_capacity_rule(m, tm, sit, pro):
 
 
 def res_process_maxgrad_lower_rule(m, t, sit, pro):
-    return (m.tau_pro[t-1, sit, pro] -
-            m.cap_pro[sit, pro] * m.process.loc[sit, pro]['max-grad'] * m.dt <=
+    return (m.tau_pro[m.previous_timestep[t], sit, pro] -
+            m.cap_pro[sit, pro] * m.process_dict['max-grad'][sit, pro] *
+            m.dt[t] <=
             m.tau_pro[t, sit, pro])
 
 
 def res_process_maxgrad_upper_rule(m, t, sit, pro):
-    return (m.tau_pro[t-1, sit, pro] +
-            m.cap_pro[sit, pro] * m.process.loc[sit, pro]['max-grad'] * m.dt >=
+    return (m.tau_pro[m.previous_timestep[t], sit, pro] +
+            m.cap_pro[sit, pro] * m.process_dict['max-grad'][sit, pro] *
+            m.dt[t] >=
             m.tau_pro[t, sit, pro])
 
 
 def res_throughput_by_online_capacity_min_rule(m, tm, sit, pro):
     return (m.tau_pro[tm, sit, pro] >=
             m.cap_online[tm, sit, pro] *
-            m.process.loc[sit, pro]['min-fraction'])
+            m.process_dict['min-fraction'][sit, pro])
 
 
 def res_throughput_by_online_capacity_max_rule(m, tm, sit, pro):
@@ -859,15 +1293,20 @@ def res_throughput_by_online_capacity_max_rule(m, tm, sit, pro):
 
 
 def def_partial_process_input_rule(m, tm, sit, pro, coin):
-    R = m.r_in.loc[pro, coin]  # input ratio at maximum operation point
-    r = m.r_in_min_fraction[pro, coin]  # input ratio at lowest operation point
-    min_fraction = m.process.loc[sit, pro]['min-fraction']
+    return (m.e_pro_in[tm, sit, pro, coin] ==
+            partial_process_input(m, tm, sit, pro, coin))
+
+
+def partial_process_input(m, tm, sit, pro, coin):
+    R = m.r_in_dict[pro, coin]  # input ratio at maximum operation point
+    # input ratio at lowest operation point
+    r = m.r_in_min_fraction_dict[pro, coin]
+    min_fraction = m.process_dict['min-fraction'][sit, pro]
 
     online_factor = min_fraction * (r - R) / (1 - min_fraction)
     throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
 
-    return (m.e_pro_in[tm, sit, pro, coin] ==
-            m.cap_online[tm, sit, pro] * online_factor +
+    return (m.cap_online[tm, sit, pro] * online_factor +
             m.tau_pro[tm, sit, pro] * throughput_factor)
 
 
@@ -878,27 +1317,36 @@ def res_cap_online_by_cap_pro_rule(m, tm, sit, pro):
 def def_startup_capacity_rule(m, tm, sit, pro):
     return (m.startup_pro[tm, sit, pro] >=
             m.cap_online[tm, sit, pro] -
-            m.cap_online[tm-1, sit, pro])
+            m.cap_online[m.previous_timestep[tm], sit, pro])
 
 
 # lower bound <= process capacity <= upper bound
 def res_process_capacity_rule(m, sit, pro):
-    return (m.process.loc[sit, pro]['cap-lo'],
+    return (m.process_dict['cap-lo'][sit, pro],
             m.cap_pro[sit, pro],
-            m.process.loc[sit, pro]['cap-up'])
+            m.process_dict['cap-up'][sit, pro])
+
+
+# process capacity limits as bounds of the new capacity if var_bounds:
+# max(0, cap-lo - inst-cap) <= new process capacity <= cap-up - inst-cap;
+# the lower bound keeps new capacities non-negative like NonNegativeReals
+def cap_pro_new_bounds_rule(m, sit, pro):
+    inst_cap = m.process_dict['inst-cap'][sit, pro]
+    return (max(0, m.process_dict['cap-lo'][sit, pro] - inst_cap),
+            m.process_dict['cap-up'][sit, pro] - inst_cap)
 
 
 # used process area <= maximal process area
 def res_area_rule(m, sit):
-    if m.site.loc[sit]['area'] >= 0 and sum(
-                         m.process.loc[(s, p), 'area-per-cap']
-                         for (s, p) in m.pro_area_tuples
-                         if s == sit) > 0:
-        total_area = sum(m.cap_pro[s, p] *
-                         m.process.loc[(s, p), 'area-per-cap']
-                         for (s, p) in m.pro_area_tuples
-                         if s == sit)
-        return total_area <= m.site.loc[sit]['area']
+    processes = m.pro_area_dict.get(sit, [])
+    # m.sit_area and m.proc_area contain the numeric, non-negative areas
+    if sit in m.sit_area.index and sum(
+                         m.proc_area[sit, p]
+                         for p in processes) > 0:
+        total_area = sum(m.cap_pro[sit, p] *
+                         m.process_dict['area-per-cap'][sit, p]
+                         for p in processes)
+        return total_area <= m.site_dict['area'][sit]
     else:
         # Skip constraint, if area is not numeric
         return pyomo.Constraint.Skip
@@ -906,16 +1354,13 @@ def res_area_rule(m, sit):
 
 # power connection capacity: Sell == Buy
 def res_sell_buy_symmetry_rule(m, sit_in, pro_in, coin):
-    # constraint only for sell and buy processes
-    # and the processes must be in the same site
-    if coin in m.com_buy:
-        sell_pro = search_sell_buy_tuple(m, sit_in, pro_in, coin)
-        if sell_pro is None:
-            return pyomo.Constraint.Skip
-        else:
-            return (m.cap_pro[sit_in, pro_in] == m.cap_pro[sit_in, sell_pro])
-    else:
+    # constraint only for sell and buy processes (index set contains buy
+    # commodity inputs only) and the processes must be in the same site
+    sell_pro = m.sell_buy_pairs.get(pro_in)
+    if sell_pro is None:
         return pyomo.Constraint.Skip
+    else:
+        return (m.cap_pro[sit_in, pro_in] == m.cap_pro[sit_in, sell_pro])
 
 
 # transmission
@@ -924,14 +1369,30 @@ def res_sell_buy_symmetry_rule(m, sit_in, pro_in, coin):
 def def_transmission_capacity_rule(m, sin, sout, tra, com):
     return (m.cap_tra[sin, sout, tra, com] ==
             m.cap_tra_new[sin, sout, tra, com] +
-            m.transmission.loc[sin, sout, tra, com]['inst-cap'])
+            m.transmission_dict['inst-cap'][sin, sout, tra, com])
 
 
 # transmission output == transmission input * efficiency
 def def_transmission_output_rule(m, tm, sin, sout, tra, com):
     return (m.e_tra_out[tm, sin, sout, tra, com] ==
             m.e_tra_in[tm, sin, sout, tra, com] *
-            m.transmission.loc[sin, sout, tra, com]['eff'])
+            m.transmission_dict['eff'][sin, sout, tra, com])
+
+
+# expressions of the reduced formulation, equivalent to the two rules above
+def cap_tra_rule(m, sin, sout, tra, com):
+    return (m.cap_tra_new[sin, sout, tra, com] +
+            m.transmission_dict['inst-cap'][sin, sout, tra, com])
+
+
+def e_tra_out_rule(m, tm, sin, sout, tra, com):
+    return (m.e_tra_in[tm, sin, sout, tra, com] *
+            m.transmission_dict['eff'][sin, sout, tra, com])
+
+
+# new transmission capacity of both directions if undirected_transmission
+def cap_tra_new_rule(m, sin, sout, tra, com):
+    return m.cap_tra_pair_new[m.tra_pair[sin, sout, tra, com]]
 
 
 # transmission input <= transmission capacity
@@ -942,9 +1403,17 @@ def res_transmission_input_by_capacity_rule(m, tm, sin, sout, tra, com):
 
 # lower bound <= transmission capacity <= upper bound
 def res_transmission_capacity_rule(m, sin, sout, tra, com):
-    return (m.transmission.loc[sin, sout, tra, com]['cap-lo'],
+    return (m.transmission_dict['cap-lo'][sin, sout, tra, com],
             m.cap_tra[sin, sout, tra, com],
-            m.transmission.loc[sin, sout, tra, com]['cap-up'])
+            m.transmission_dict['cap-up'][sin, sout, tra, com])
+
+
+# transmission capacity limits as bounds of the new capacity if var_bounds
+def cap_tra_new_bounds_rule(m, sin, sout, tra, com):
+    inst_cap = m.transmission_dict['inst-cap'][sin, sout, tra, com]
+    return (max(0, m.transmission_dict['cap-lo'][sin, sout, tra, com] -
+                inst_cap),
+            m.transmission_dict['cap-up'][sin, sout, tra, com] - inst_cap)
 
 
 # transmission capacity from A to B == transmission capacity from B to A
@@ -958,26 +1427,42 @@ def res_transmission_symmetry_rule(m, sin, sout, tra, com):
 # + newly stored energy * input efficiency
 # - retrieved energy / output efficiency
 def def_storage_state_rule(m, t, sit, sto, com):
+    if m.calendar is not None and t == m.periods[m.period_of[t]][0]:
+        # seasonal storage: content relative to the period start
+        previous_content = 0
+    else:
+        previous_content = m.e_sto_con[m.previous_timestep[t], sit, sto, com]
     return (m.e_sto_con[t, sit, sto, com] ==
-            m.e_sto_con[t-1, sit, sto, com] +
+            previous_content +
             m.e_sto_in[t, sit, sto, com] *
-            m.storage.loc[sit, sto, com]['eff-in'] * m.dt -
+            m.storage_dict['eff-in'][sit, sto, com] * m.dt[t] -
             m.e_sto_out[t, sit, sto, com] /
-            m.storage.loc[sit, sto, com]['eff-out'] * m.dt)
+            m.storage_dict['eff-out'][sit, sto, com] * m.dt[t])
 
 
 # storage power == new storage power + existing storage power
 def def_storage_power_rule(m, sit, sto, com):
     return (m.cap_sto_p[sit, sto, com] ==
             m.cap_sto_p_new[sit, sto, com] +
-            m.storage.loc[sit, sto, com]['inst-cap-p'])
+            m.storage_dict['inst-cap-p'][sit, sto, com])
 
 
 # storage capacity == new storage capacity + existing storage capacity
 def def_storage_capacity_rule(m, sit, sto, com):
     return (m.cap_sto_c[sit, sto, com] ==
             m.cap_sto_c_new[sit, sto, com] +
-            m.storage.loc[sit, sto, com]['inst-cap-c'])
+            m.storage_dict['inst-cap-c'][sit, sto, com])
+
+
+# expressions of the reduced formulation, equivalent to the two rules above
+def cap_sto_p_rule(m, sit, sto, com):
+    return (m.cap_sto_p_new[sit, sto, com] +
+            m.storage_dict['inst-cap-p'][sit, sto, com])
+
+
+def cap_sto_c_rule(m, sit, sto, com):
+    return (m.cap_sto_c_new[sit, sto, com] +
+            m.storage_dict['inst-cap-c'][sit, sto, com])
 
 
 # storage input <= storage power
@@ -995,18 +1480,75 @@ def res_storage_state_by_capacity_rule(m, t, sit, sto, com):
     return m.e_sto_con[t, sit, sto, com] <= m.cap_sto_c[sit, sto, com]
 
 
+# seasonal storage: storage content at the start of calendar period d + 1
+# == content at the start of d + content change over the representative
+# period of d
+def def_storage_inter_state_rule(m, d, sit, sto, com):
+    if d == m.cal.last():
+        return pyomo.Constraint.Skip
+    last = m.periods[m.calendar[d]][-1]
+    return (m.e_sto_inter[d + 1, sit, sto, com] ==
+            m.e_sto_inter[d, sit, sto, com] +
+            m.e_sto_con[last, sit, sto, com])
+
+
+# content change within a representative period <= its maximum change
+def res_storage_intra_max_rule(m, t, sit, sto, com):
+    return (m.e_sto_con[t, sit, sto, com] <=
+            m.e_sto_intra_max[m.period_of[t], sit, sto, com])
+
+
+# content change within a representative period >= its minimum change
+def res_storage_intra_min_rule(m, t, sit, sto, com):
+    return (m.e_sto_con[t, sit, sto, com] >=
+            m.e_sto_intra_min[m.period_of[t], sit, sto, com])
+
+
+# content at the start of calendar period d + maximum change within its
+# representative period <= storage capacity
+def res_storage_inter_by_capacity_rule(m, d, sit, sto, com):
+    if d == m.cal.last():
+        return pyomo.Constraint.Skip
+    return (m.e_sto_inter[d, sit, sto, com] +
+            m.e_sto_intra_max[m.calendar[d], sit, sto, com] <=
+            m.cap_sto_c[sit, sto, com])
+
+
+# content at the start of calendar period d + minimum change within its
+# representative period >= 0
+def res_storage_inter_min_rule(m, d, sit, sto, com):
+    if d == m.cal.last():
+        return pyomo.Constraint.Skip
+    return (m.e_sto_inter[d, sit, sto, com] +
+            m.e_sto_intra_min[m.calendar[d], sit, sto, com] >= 0)
+
+
 # lower bound <= storage power <= upper bound
 def res_storage_power_rule(m, sit, sto, com):
-    return (m.storage.loc[sit, sto, com]['cap-lo-p'],
+    return (m.storage_dict['cap-lo-p'][sit, sto, com],
             m.cap_sto_p[sit, sto, com],
-            m.storage.loc[sit, sto, com]['cap-up-p'])
+            m.storage_dict['cap-up-p'][sit, sto, com])
 
 
 # lower bound <= storage capacity <= upper bound
 def res_storage_capacity_rule(m, sit, sto, com):
-    return (m.storage.loc[sit, sto, com]['cap-lo-c'],
+    return (m.storage_dict['cap-lo-c'][sit, sto, com],
             m.cap_sto_c[sit, sto, com],
-            m.storage.loc[sit, sto, com]['cap-up-c'])
+            m.storage_dict['cap-up-c'][sit, sto, com])
+
+
+# storage power and capacity limits as bounds of the new power and capacity
+# if var_bounds
+def cap_sto_p_new_bounds_rule(m, sit, sto, com):
+    inst_cap = m.storage_dict['inst-cap-p'][sit, sto, com]
+    return (max(0, m.storage_dict['cap-lo-p'][sit, sto, com] - inst_cap),
+            m.storage_dict['cap-up-p'][sit, sto, com] - inst_cap)
+
+
+def cap_sto_c_new_bounds_rule(m, sit, sto, com):
+    inst_cap = m.storage_dict['inst-cap-c'][sit, sto, com]
+    return (max(0, m.storage_dict['cap-lo-c'][sit, sto, com] - inst_cap),
+            m.storage_dict['cap-up-c'][sit, sto, com] - inst_cap)
 
 
 # initialization of storage content in first timestep t[1]
@@ -1016,11 +1558,26 @@ def res_initial_and_final_storage_state_rule(m, t, sit, sto, com):
     if t == m.t[1]:  # first timestep (Pyomo uses 1-based indexing)
         return (m.e_sto_con[t, sit, sto, com] ==
                 m.cap_sto_c[sit, sto, com] *
-                m.storage.loc[sit, sto, com]['init'])
+                m.storage_dict['init'][sit, sto, com])
     elif t == m.t[len(m.t)]:  # last timestep
         return (m.e_sto_con[t, sit, sto, com] >=
                 m.cap_sto_c[sit, sto, com] *
-                m.storage.loc[sit, sto, com]['init'])
+                m.storage_dict['init'][sit, sto, com])
+    else:
+        return pyomo.Constraint.Skip
+
+
+# seasonal storage: content[start of first calendar period] == storage
+# capacity * fraction <= content[end of last calendar period]
+def res_initial_and_final_storage_inter_rule(m, d, sit, sto, com):
+    if d == m.cal.first():
+        return (m.e_sto_inter[d, sit, sto, com] ==
+                m.cap_sto_c[sit, sto, com] *
+                m.storage_dict['init'][sit, sto, com])
+    elif d == m.cal.last():
+        return (m.e_sto_inter[d, sit, sto, com] >=
+                m.cap_sto_c[sit, sto, com] *
+                m.storage_dict['init'][sit, sto, com])
     else:
         return pyomo.Constraint.Skip
 
@@ -1047,96 +1604,98 @@ def def_costs_rule(m, cost_type):
     if cost_type == 'Invest':
         return m.costs[cost_type] == \
             sum(m.cap_pro_new[p] *
-                m.process.loc[p]['inv-cost'] *
-                m.process.loc[p]['annuity-factor']
+                m.process_dict['inv-cost'][p] *
+                m.process_dict['annuity-factor'][p]
                 for p in m.pro_tuples) + \
             sum(m.cap_tra_new[t] *
-                m.transmission.loc[t]['inv-cost'] *
-                m.transmission.loc[t]['annuity-factor']
+                m.transmission_dict['inv-cost'][t] *
+                m.transmission_dict['annuity-factor'][t]
                 for t in m.tra_tuples) + \
             sum(m.cap_sto_p_new[s] *
-                m.storage.loc[s]['inv-cost-p'] *
-                m.storage.loc[s]['annuity-factor'] +
+                m.storage_dict['inv-cost-p'][s] *
+                m.storage_dict['annuity-factor'][s] +
                 m.cap_sto_c_new[s] *
-                m.storage.loc[s]['inv-cost-c'] *
-                m.storage.loc[s]['annuity-factor']
+                m.storage_dict['inv-cost-c'][s] *
+                m.storage_dict['annuity-factor'][s]
                 for s in m.sto_tuples)
 
     elif cost_type == 'Fixed':
         return m.costs[cost_type] == \
-            sum(m.cap_pro[p] * m.process.loc[p]['fix-cost']
+            sum(m.cap_pro[p] * m.process_dict['fix-cost'][p]
                 for p in m.pro_tuples) + \
-            sum(m.cap_tra[t] * m.transmission.loc[t]['fix-cost']
+            sum(m.cap_tra[t] * m.transmission_dict['fix-cost'][t]
                 for t in m.tra_tuples) + \
-            sum(m.cap_sto_p[s] * m.storage.loc[s]['fix-cost-p'] +
-                m.cap_sto_c[s] * m.storage.loc[s]['fix-cost-c']
+            sum(m.cap_sto_p[s] * m.storage_dict['fix-cost-p'][s] +
+                m.cap_sto_c[s] * m.storage_dict['fix-cost-c'][s]
                 for s in m.sto_tuples)
 
     elif cost_type == 'Variable':
-        return m.costs[cost_type] == \
-            sum(m.tau_pro[(tm,) + p] * m.dt *
-                m.process.loc[p]['var-cost'] *
-                m.weight
+        variable_costs = \
+            sum(m.tau_pro[(tm,) + p] * m.dt[tm] *
+                m.process_dict['var-cost'][p] *
+                m.weight * m.timestep_weight[tm]
                 for tm in m.tm
                 for p in m.pro_tuples) + \
-            sum(m.e_tra_in[(tm,) + t] * m.dt *
-                m.transmission.loc[t]['var-cost'] *
-                m.weight
+            sum(m.e_tra_in[(tm,) + t] * m.dt[tm] *
+                m.transmission_dict['var-cost'][t] *
+                m.weight * m.timestep_weight[tm]
                 for tm in m.tm
                 for t in m.tra_tuples) + \
-            sum(m.e_sto_con[(tm,) + s] *
-                m.storage.loc[s]['var-cost-c'] * m.weight +
-                (m.e_sto_in[(tm,) + s] + m.e_sto_out[(tm,) + s]) * m.dt *
-                m.storage.loc[s]['var-cost-p'] * m.weight
+            sum((m.e_sto_con[(tm,) + s] *
+                 m.storage_dict['var-cost-c'][s] * m.weight +
+                 (m.e_sto_in[(tm,) + s] + m.e_sto_out[(tm,) + s]) *
+                 m.dt[tm] * m.storage_dict['var-cost-p'][s] * m.weight) *
+                m.timestep_weight[tm]
                 for tm in m.tm
                 for s in m.sto_tuples)
+        if m.calendar is not None:
+            # seasonal storage: e_sto_con is only the change within a period,
+            # the content at its start is held for the whole period
+            variable_costs += sum(
+                m.e_sto_inter[(d,) + s] * m.period_length *
+                m.storage_dict['var-cost-c'][s] * m.weight
+                for d in range(len(m.calendar))
+                for s in m.sto_tuples)
+        return m.costs[cost_type] == variable_costs
 
     elif cost_type == 'Fuel':
         return m.costs[cost_type] == sum(
-            m.e_co_stock[(tm,) + c] * m.dt *
-            m.commodity.loc[c]['price'] *
-            m.weight
-            for tm in m.tm for c in m.com_tuples
-            if c[1] in m.com_stock)
+            m.e_co_stock[(tm,) + c] * m.dt[tm] *
+            m.commodity_dict['price'][c] *
+            m.weight * m.timestep_weight[tm]
+            for tm in m.tm for c in m.com_stock_tuples)
 
     elif cost_type == 'Revenue':
-        sell_tuples = commodity_subset(m.com_tuples, m.com_sell)
-        com_prices = get_com_price(m, sell_tuples)
-
         return m.costs[cost_type] == -sum(
             m.e_co_sell[(tm,) + c] *
-            com_prices[c].loc[tm] *
-            m.weight * m.dt
+            timeseries_value(m.com_price_ts, tm, c) *
+            m.weight * m.dt[tm] * m.timestep_weight[tm]
             for tm in m.tm
-            for c in sell_tuples)
+            for c in m.com_sell_tuples)
 
     elif cost_type == 'Purchase':
-        buy_tuples = commodity_subset(m.com_tuples, m.com_buy)
-        com_prices = get_com_price(m, buy_tuples)
-
         return m.costs[cost_type] == sum(
             m.e_co_buy[(tm,) + c] *
-            com_prices[c].loc[tm] *
-            m.weight * m.dt
+            timeseries_value(m.com_price_ts, tm, c) *
+            m.weight * m.dt[tm] * m.timestep_weight[tm]
             for tm in m.tm
-            for c in buy_tuples)
+            for c in m.com_buy_tuples)
 
     elif cost_type == 'Startup':
         return m.costs[cost_type] == sum(
             m.startup_pro[(tm,) + p] *
-            m.process.loc[p]['startup-cost'] *
-            m.weight * m.dt
+            m.process_dict['startup-cost'][p] *
+            m.weight * m.dt[tm] * m.timestep_weight[tm]
             for tm in m.tm
             for p in m.pro_partial_tuples)
 
     elif cost_type == 'Environmental':
         return m.costs[cost_type] == sum(
             - commodity_balance(m, tm, sit, com) *
-            m.weight * m.dt *
-            m.commodity.loc[sit, com, com_type]['price']
+            m.weight * m.dt[tm] * m.timestep_weight[tm] *
+            m.commodity_dict['price'][sit, com, com_type]
             for tm in m.tm
-            for sit, com, com_type in m.com_tuples
-            if com in m.com_env)
+            for sit, com, com_type in m.com_env_tuples)
 
     else:
         raise NotImplementedError("Unknown cost type.")
@@ -1182,8 +1741,175 @@ def res_global_co2_limit_rule(m):
         for sit in m.sit:
             # minus because negative commodity_balance represents creation of
             # that commodity.
-            co2_output_sum += (- commodity_balance(m, tm, sit, 'CO2') * m.dt)
+            co2_output_sum += (- commodity_balance(m, tm, sit, 'CO2') *
+                               m.dt[tm] * m.timestep_weight[tm])
 
     # scaling to annual output (cf. definition of m.weight)
     co2_output_sum *= m.weight
     return (co2_output_sum <= m.hacks.loc['Global CO2 limit', 'Value'])
+
+
+def add_mutable_params(m):
+    """ Declare the input columns in MUTABLE_PARAMS as mutable Params.
+
+    Is called by create_model(..., mutable=True) before the constraints are
+    created. The Params replace the numeric values in the compiled parameter
+    tables (m.site_dict, ..., m.r_in_dict, m.r_out_dict), so that the rules
+    use them without modification. Buy and Sell commodity prices are not
+    mutable, as they enter the model via the price matrix m.com_price_ts.
+
+    Args:
+        m: the model object
+
+    Returns:
+        Nothing
+    """
+    index_sets = {
+        'site': m.sit,
+        'commodity': m.com_tuples,
+        'process': m.pro_tuples,
+        'transmission': m.tra_tuples,
+        'storage': m.sto_tuples}
+
+    # (table, column) -> (Param, keys of the Param)
+    m.mutable_params = {}
+
+    for table, columns in MUTABLE_PARAMS.items():
+        if table not in index_sets:
+            continue
+        table_dict = getattr(m, table + '_dict')
+        for column in columns:
+            values = dict((key, value)
+                          for key, value in table_dict[column].items()
+                          if is_number(value))
+            if table == 'commodity' and column == 'price':
+                values = dict((key, value) for key, value in values.items()
+                              if key[2] not in ('Buy', 'Sell'))
+            param = pyomo.Param(
+                index_sets[table],
+                initialize=values,
+                mutable=True,
+                doc='Mutable {} {}'.format(table, column))
+            m.add_component('{}_{}'.format(table, column).replace('-', '_'),
+                            param)
+            m.mutable_params[table, column] = (param, set(values))
+            table_dict[column] = dict(
+                (key, param[key] if key in values else value)
+                for key, value in table_dict[column].items())
+
+    # process_commodity ratios, by direction
+    for direction in ['In', 'Out']:
+        name = 'r_{}'.format(direction.lower())
+        values = getattr(m, name + '_dict')
+        param = pyomo.Param(
+            m.pro, m.com,
+            initialize=values,
+            mutable=True,
+            doc='Mutable process_commodity ratio ({})'.format(direction))
+        m.add_component(name + '_param', param)
+        m.mutable_params['process_commodity', direction] = (param,
+                                                            set(values))
+        setattr(m, name + '_dict',
+                dict((key, param[key]) for key in values))
+
+
+def update_model(m, data):
+    """ Apply changed input data to a model created with mutable=True.
+
+    Compares data with the model's input data and writes changed values into
+    the mutable Params (see MUTABLE_PARAMS), so that the model can be solved
+    again without calling create_model. Changed wacc or depreciation values
+    update the annuity factors. Buy and Sell prices (the buy_sell_price
+    timeseries and the price column of Buy and Sell commodities) are not
+    mutable; changing them raises StructuralChange.
+
+    Args:
+        m: a model created by create_model(..., mutable=True)
+        data: modified input data dict, e.g. scenario(read_excel(filename))
+
+    Returns:
+        the updated model m
+
+    Raises:
+        StructuralChange: if data differs in anything else than values of
+            mutable parameters; such changes need a new create_model call
+        ValueError: if a mutable parameter is changed to a non-numeric
+            value, or the model was not created with mutable=True
+    """
+    if not hasattr(m, 'mutable_params'):
+        raise ValueError("Model was not created with mutable=True")
+
+    updates = []
+    for name in sorted(set(m._data) | set(data)):
+        old = m._data.get(name)
+        new = data.get(name)
+        if old is None or new is None:
+            if old is not new:
+                raise StructuralChange("Input '{}' added or removed"
+                                       .format(name))
+            continue
+        if name == 'dt':
+            # timestep durations scale weight and many coefficients
+            if not old.equals(new):
+                raise StructuralChange("Input 'dt' changed")
+            continue
+        old = old.drop('annuity-factor', axis=1, errors='ignore')
+        new = new.drop('annuity-factor', axis=1, errors='ignore')
+        if not (old.index.equals(new.index) and
+                old.columns.equals(new.columns)):
+            raise StructuralChange("Index or columns of input '{}' changed"
+                                   .format(name))
+
+        changed = (old != new) & ~(old.isnull() & new.isnull())
+        for row, col in zip(*changed.values.nonzero()):
+            key = new.index[row]
+            column = new.columns[col]
+            value = new.iat[row, col]
+            if column in ANNUITY_INPUTS and name in ('process',
+                                                     'transmission',
+                                                     'storage'):
+                # enters the model via the annuity factor, see below
+                continue
+            if name == 'process_commodity' and column == 'ratio':
+                param, keys = m.mutable_params[name, key[2]]
+                key = key[:2]
+            elif column in MUTABLE_PARAMS.get(name, []):
+                param, keys = m.mutable_params[name, column]
+            else:
+                raise StructuralChange("Input '{}' column '{}' is not mutable"
+                                       .format(name, column))
+            if key not in keys or value != value:
+                # entry without Param, e.g. a NaN that becomes a number
+                raise StructuralChange("Input '{}' column '{}' at {} can "
+                                       "only be changed between numeric "
+                                       "values".format(name, column, key))
+            if not is_number(value):
+                raise ValueError("Input '{}' column '{}' at {} is not "
+                                 "numeric: {!r}".format(name, column, key,
+                                                        value))
+            updates.append((param, key, value))
+
+    for param, key, value in updates:
+        param[key] = value
+
+    # annuity factors go into copies of the tables, data stays unchanged
+    data = dict(data)
+    for name in ['process', 'transmission', 'storage']:
+        data[name] = data[name].copy()
+        data[name]['annuity-factor'] = annuity_factor(
+            data[name]['depreciation'],
+            data[name]['wacc'])
+        param, keys = m.mutable_params[name, 'annuity-factor']
+        for key, value in data[name]['annuity-factor'].items():
+            if key in keys:
+                param[key] = value
+
+    # keep input DataFrames of the model in sync for reporting and discard
+    # the now outdated result cache, if any
+    m._data = data
+    for name in ['site', 'commodity', 'process', 'process_commodity',
+                 'transmission', 'storage']:
+        setattr(m, name, data[name])
+    if hasattr(m, '_result'):
+        del m._result
+    return m
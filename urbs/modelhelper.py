@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 
@@ -23,6 +24,12 @@ def annuity_factor(n, i):
     return (1+i)**n * i / ((1+i)**n - 1)
 
 
+def is_number(value):
+    """ True for int or float values except NaN (e.g. not '1.25xBuy'). """
+    return (isinstance(value, (int, float, np.integer, np.floating)) and
+            not isinstance(value, bool) and value == value)
+
+
 def commodity_balance(m, tm, sit, com):
     """Calculate commodity balance at given timestep.
 
@@ -30,6 +37,8 @@ def commodity_balance(m, tm, sit, com):
     consumed (to process/storage/transmission, counts positive) and provided
     (from process/storage/transmission, counts negative) power. Used as helper
     function in create_model for constraints on demand and stock commodities.
+    Only the flows listed in m.com_incidence (see commodity_incidence) for
+    the given site and commodity are visited.
 
     Args:
         m: the model object
@@ -42,27 +51,95 @@ def commodity_balance(m, tm, sit, com):
 
     """
     balance = 0
-    for site, process in m.pro_tuples:
-        if site == sit and com in m.r_in.loc[process].index:
-            # usage as input for process increases balance
-            balance += m.e_pro_in[(tm, site, process, com)]
-        if site == sit and com in m.r_out.loc[process].index:
-            # output from processes decreases balance
-            balance -= m.e_pro_out[(tm, site, process, com)]
+    for var, index, sign in m.com_incidence.get((sit, com), ()):
+        if sign > 0:
+            balance += var[(tm,) + index]
+        else:
+            balance -= var[(tm,) + index]
+    return balance
+
+
+def commodity_incidence(m):
+    """Index all power flows by the (site, commodity) balance they enter.
+
+    Run once in create_model after the flow variables have been declared, so
+    that commodity_balance does not have to scan all process, transmission
+    and storage tuples for every timestep.
+
+    Args:
+        m: the model object
+
+    Returns:
+        a dict with (site, commodity) tuples as keys and lists of
+        (variable, index, sign) tuples as values; index is the variable index
+        without the leading timestep, sign is +1 for consumption and -1 for
+        provision of the commodity
+    """
+    incidence = {}
+
+    def add(sit, com, var, index, sign):
+        incidence.setdefault((sit, com), []).append((var, index, sign))
+
+    for site, process, commodity in m.pro_input_tuples:
+        # usage as input for process increases balance
+        add(site, commodity, m.e_pro_in, (site, process, commodity), 1)
+    for site, process, commodity in m.pro_output_tuples:
+        # output from processes decreases balance
+        add(site, commodity, m.e_pro_out, (site, process, commodity), -1)
     for site_in, site_out, transmission, commodity in m.tra_tuples:
+        index = (site_in, site_out, transmission, commodity)
         # exports increase balance
-        if site_in == sit and commodity == com:
-            balance += m.e_tra_in[(tm, site_in, site_out, transmission, com)]
+        add(site_in, commodity, m.e_tra_in, index, 1)
         # imports decrease balance
-        if site_out == sit and commodity == com:
-            balance -= m.e_tra_out[(tm, site_in, site_out, transmission, com)]
+        add(site_out, commodity, m.e_tra_out, index, -1)
     for site, storage, commodity in m.sto_tuples:
+        index = (site, storage, commodity)
         # usage as input for storage increases consumption
         # output from storage decreases consumption
-        if site == sit and commodity == com:
-            balance += m.e_sto_in[(tm, site, storage, com)]
-            balance -= m.e_sto_out[(tm, site, storage, com)]
-    return balance
+        add(site, commodity, m.e_sto_in, index, 1)
+        add(site, commodity, m.e_sto_out, index, -1)
+    return incidence
+
+
+def timeseries_matrix(df):
+    """Convert a timeseries DataFrame to a NumPy matrix with position maps.
+
+    Used in create_model for the demand, supim and buy_sell_price
+    timeseries, so that single values can be read within the rules without
+    creating a row Series per timestep (see timeseries_value).
+
+    Args:
+        df: a DataFrame with timesteps as index and timeseries as columns
+
+    Returns:
+        a (values, rows, cols) tuple: a contiguous 2-D float array of the
+        DataFrame values and two dicts that map timesteps to row positions and
+        column labels to column positions. Single-level column tuples, e.g.
+        ('Elec buy',), are unpacked to their only element.
+    """
+    values = np.ascontiguousarray(df.values, dtype=float)
+    rows = dict((t, k) for k, t in enumerate(df.index))
+    cols = {}
+    for k, col in enumerate(df.columns):
+        if isinstance(col, tuple) and len(col) == 1:
+            col = col[0]
+        cols[col] = k
+    return values, rows, cols
+
+
+def timeseries_value(ts, tm, col):
+    """Read a single value from a matrix created by timeseries_matrix.
+
+    Args:
+        ts: a (values, rows, cols) tuple as returned by timeseries_matrix
+        tm: the timestep
+        col: the column label, e.g. a (site, commodity) tuple
+
+    Returns:
+        the value; raises KeyError for unknown timesteps or columns
+    """
+    values, rows, cols = ts
+    return values[rows[tm], cols[col]]
 
 
 def dsm_down_time_tuples(time, sit_com_tuple, m):
@@ -80,68 +157,108 @@ def dsm_down_time_tuples(time, sit_com_tuple, m):
     if m.dsm.empty:
         return []
 
-    delay = m.dsm['delay']
-    ub = max(time)
-    lb = min(time)
-    time_list = []
+    sit_com_tuple = list(sit_com_tuple)
+    if not sit_com_tuple:
+        return []
+    time = np.asarray(list(time))
+    delays = np.array([int(m.dsm_dict['delay'][sit_com])
+                       for sit_com in sit_com_tuple])
 
-    for (site, commodity) in sit_com_tuple:
-        for step1 in time:
-            for step2 in range(step1 - delay[site, commodity],
-                               step1 + delay[site, commodity] + 1):
-                if lb <= step2 <= ub:
-                    time_list.append((step1, step2, site, commodity))
+    # array of all step2 candidates for every (site, commodity) pair
+    # (axis 0), step1 (axis 1) and offset within the largest delay (axis 2)
+    offsets = np.arange(-delays.max(), delays.max() + 1)
+    candidates = np.broadcast_to(
+        time[np.newaxis, :, np.newaxis] + offsets,
+        (len(delays), len(time), len(offsets)))
+    valid = ((np.abs(offsets) <= delays[:, np.newaxis, np.newaxis]) &
+             (candidates >= time.min()) & (candidates <= time.max()))
+    pair, row, _ = np.nonzero(valid)
 
-    return time_list
+    return [(first, second) + sit_com_tuple[k]
+            for first, second, k in zip(time[row].tolist(),
+                                        candidates[valid].tolist(),
+                                        pair.tolist())]
 
 
-def dsm_time_tuples(timestep, time, delay):
-    """ Tuples for the two time instances of DSM_down
+def get_dsm_formulation(dsm, formulation=None):
+    """ Determine which DSM formulation create_model uses.
 
     Args:
-        timestep: current timestep
-        time: list with time indices
-        delay: allowed dsm delay in particular site and commodity
+        dsm: the DSM DataFrame
+        formulation: 'pairwise', 'cumulative' or None; if None, the value of
+            the optional DSM column 'formulation' is used (default: pairwise)
 
     Returns:
-        A list of possible time tuples of a current time step in a specific
-        site and commodity
+        the formulation name ('pairwise' or 'cumulative')
+    """
+    if formulation is None:
+        formulation = 'pairwise'
+        if 'formulation' in dsm.columns:
+            values = set(str(value).strip().lower()
+                         for value in dsm['formulation'].dropna())
+            if len(values) > 1:
+                raise ValueError("DSM column 'formulation' must contain "
+                                 "one value for all rows, not {}"
+                                 .format(sorted(values)))
+            elif values:
+                formulation = values.pop()
+
+    if formulation not in ('pairwise', 'cumulative'):
+        raise ValueError("Unknown DSM formulation '{}'".format(formulation))
+    return formulation
+
+
+def dsm_downshift(m, tm, sit, com):
+    """ Total DSM downshift in a timestep.
+
+    Args:
+        m: the model object
+        tm: the timestep
+        sit: the site
+        com: the commodity
+
+    Returns:
+        the sum of all downshifts in timestep tm; in the pairwise DSM
+        formulation, these are the dsm_down variables of all upshift
+        timesteps within the delay, in the cumulative one a single variable
     """
+    if m.dsm_formulation == 'cumulative':
+        return m.dsm_down[tm, sit, com]
+    return sum(m.dsm_down[t, tm, sit, com]
+               for t in dsm_time_tuples(tm, m.tm_bounds,
+                                        m.dsm_dict['delay'][sit, com]))
 
-    ub = max(time)
-    lb = min(time)
 
-    time_list = list()
+def dsm_time_tuples(timestep, bounds, delay):
+    """ Tuples for the two time instances of DSM_down
 
-    for step in range(timestep - delay, timestep + delay + 1):
-        if step >= lb and step <= ub:
-            time_list.append(step)
+    Args:
+        timestep: current timestep
+        bounds: (first, last) tuple of the modelled timesteps
+        delay: allowed dsm delay in particular site and commodity
 
-    return time_list
+    Returns:
+        A range of possible time tuples of a current time step in a specific
+        site and commodity
+    """
+    lb, ub = bounds
+    return range(max(lb, timestep - delay), min(ub, timestep + delay) + 1)
 
 
-def dsm_recovery(timestep, time, recov):
+def dsm_recovery(timestep, bounds, recov):
     """ Time frame for the allowed time indices in case of recovery
 
     Args:
         timestep: current timestep
-        time: list with time indices
+        bounds: (first, last) tuple of the modelled timesteps
         recov: allowed dsm recovery in particular site and commodity
 
     Returns:
-        A list of possible time indices which are within the modelled time
+        A range of possible time indices which are within the modelled time
         area
     """
-
-    ub = max(time)
-
-    time_list = list()
-
-    for step in range(timestep, timestep+recov):
-        if step <= ub:
-            time_list.append(step)
-
-    return time_list
+    lb, ub = bounds
+    return range(timestep, min(ub + 1, timestep + recov))
 
 
 def commodity_subset(com_tuples, type_name):
@@ -165,34 +282,66 @@ def commodity_subset(com_tuples, type_name):
                    if com in type_name)
 
 
-def get_com_price(instance, tuples):
-    """ Calculate commodity prices for each modelled timestep.
+def com_price_matrix(instance, tuples):
+    """ Calculate commodity prices for each modelled timestep as a matrix.
+
+    Price strings (e.g. '1.25xBuy') are parsed once per distinct string.
 
     Args:
         instance: a Pyomo ConcreteModel instance
         tuples: a list of (site, commodity, commodity type) tuples
 
     Returns:
-        a Pandas DataFrame with entities as columns and timesteps as index
+        a (values, rows, cols) tuple like timeseries_matrix: a 2-D float
+        array with one row per modelled timestep and one column per tuple,
+        a dict mapping timesteps to rows and one mapping tuples to columns
     """
-    com_price = pd.DataFrame(index=instance.tm)
-    for c in tuples:
+    timesteps = list(instance.tm)
+    tuples = list(tuples)
+    values = np.empty((len(timesteps), len(tuples)))
+    ts_values, ts_rows, ts_cols = instance.buy_sell_price_ts
+    ts_positions = [ts_rows[tm] for tm in timesteps]
+    factors = {}
+    for k, c in enumerate(tuples):
         # check commodity price: fix or has a timeseries
-        # type(instance.commodity.loc[c]['price']):
+        # type(instance.commodity_dict['price'][c]):
         # float => fix: com price = 0.15
         # string => var: com price = '1.25xBuy' (Buy: refers to timeseries)
-        if not isinstance(instance.commodity.loc[c]['price'], (float, int)):
+        price = instance.commodity_dict['price'][c]
+        if not isinstance(price, (float, int)):
             # a different commodity price for each hour
             # factor, to realize a different commodity price for each site
-            factor = extract_number_str(instance.commodity.loc[c]['price'])
-            price = factor * instance.buy_sell_price.loc[(instance.tm,) +
-                                                         (c[1],)]
-            com_price[c] = pd.Series(price, index=com_price.index)
+            if price not in factors:
+                factors[price] = extract_number_str(price)
+            values[:, k] = factors[price] * ts_values[ts_positions,
+                                                      ts_cols[c[1]]]
         else:
             # same commodity price for each hour
-            price = instance.commodity.loc[c]['price']
-            com_price[c] = pd.Series(price, index=com_price.index)
-    return com_price
+            values[:, k] = price
+    rows = dict((tm, k) for k, tm in enumerate(timesteps))
+    cols = dict((c, k) for k, c in enumerate(tuples))
+    return values, rows, cols
+
+
+def get_com_price(instance, tuples):
+    """ Calculate commodity prices for each modelled timestep.
+
+    Args:
+        instance: a Pyomo ConcreteModel instance
+        tuples: a list of (site, commodity, commodity type) tuples
+
+    Returns:
+        a Pandas DataFrame with entities as columns and timesteps as index
+    """
+    tuples = list(tuples)
+    if hasattr(instance, 'com_price_ts') and all(
+            c in instance.com_price_ts[2] for c in tuples):
+        values, rows, cols = instance.com_price_ts
+        values = values[:, [cols[c] for c in tuples]]
+    else:
+        values = com_price_matrix(instance, tuples)[0]
+    return pd.DataFrame(values, index=list(instance.tm),
+                        columns=pd.Index(tuples, tupleize_cols=False))
 
 
 def extract_number_str(str_in):
@@ -243,35 +392,176 @@ def extract_number_str(str_in):
         return float(str_num)
 
 
-def search_sell_buy_tuple(instance, sit_in, pro_in, coin):
-    """ Return the equivalent sell-process for a given buy-process.
+def sell_buy_pairs(m):
+    """ Return the equivalent sell process for every buy process.
+
+    A sell process is equivalent to a buy process, if it consumes a
+    commodity in a site that the buy process produces in a site. If several
+    sell processes qualify, the first one in pro_output_tuples is used.
 
     Args:
-        instance: a Pyomo ConcreteModel instance
-        sit_in: a site
-        pro_in: a process
-        co_in: a commodity
+        m: the model object
+
+    Returns:
+        a dict with buy processes as keys and sell processes as values;
+        buy processes without equivalent sell process are missing
+    """
+    # buy_out[process] = {(site, output_commodity), ...}
+    buy_out = {}
+    for site, process, commodity in m.pro_output_tuples:
+        buy_out.setdefault(process, set()).add((site, commodity))
+
+    # sell processes in order of appearance in pro_output_tuples
+    sell_rank = {}
+    for site, process, commodity in m.pro_output_tuples:
+        if commodity in m.com_sell and process not in sell_rank:
+            sell_rank[process] = len(sell_rank)
+
+    # sell_in[(site, input_commodity)] = first sell process consuming it
+    sell_in = {}
+    for site, process, commodity in m.pro_input_tuples:
+        if process in sell_rank:
+            current = sell_in.get((site, commodity))
+            if current is None or sell_rank[process] < sell_rank[current]:
+                sell_in[(site, commodity)] = process
+
+    # check: buy - commodity == commodity - sell; for a site
+    pairs = {}
+    for site, process, commodity in m.pro_buy_input_tuples:
+        candidates = [sell_in[key]
+                      for key in buy_out.get(process, ())
+                      if key in sell_in]
+        if candidates:
+            pairs[process] = min(candidates, key=sell_rank.get)
+    return pairs
+
+
+def transmission_pairs(m):
+    """ Return the representative direction of every transmission.
+
+    In the undirected transmission representation, both directions of a
+    transmission between two sites share one capacity. The direction that
+    comes first in tra_tuples represents the pair.
+
+    Args:
+        m: the model object
+
+    Returns:
+        a dict with (sin, sout, tra, com) tuples as keys and the
+        representative (sin, sout, tra, com) tuple of their pair as values
+    """
+    pairs = {}
+    for sin, sout, tra, com in m.tra_tuples:
+        reverse = (sout, sin, tra, com)
+        pairs[sin, sout, tra, com] = pairs.get(reverse, (sin, sout, tra, com))
+    return pairs
+
+
+def timestep_weights(timesteps, weights=None):
+    """ Return the number of timesteps each modelled timestep represents.
+
+    Args:
+        timesteps: list of modelled timesteps
+        weights: optional dict or Series with timesteps as keys; default: 1
+            for all timesteps
+
+    Returns:
+        a dict with timesteps as keys and weights as values
+    """
+    if weights is None:
+        return dict((t, 1) for t in timesteps)
+    weights = pd.Series(weights)
+    missing = [t for t in timesteps if t not in weights.index]
+    if missing:
+        raise ValueError("No weight for timesteps {}".format(missing))
+    return dict((t, float(weights[t])) for t in timesteps)
+
+
+def check_optimal(results, description):
+    """ Raise a RuntimeError unless a solve terminated optimally.
+
+    Args:
+        results: results object returned by the solve method of a solver
+        description: what was solved, e.g. 'block of timesteps 1 to 730',
+            for the error message
+
+    Returns:
+        Nothing
+    """
+    from pyomo.opt import TerminationCondition
+    condition = results.solver.termination_condition
+    if condition != TerminationCondition.optimal:
+        raise RuntimeError("Solve of {} terminated with condition '{}'"
+                           .format(description, condition))
+
+
+def timestep_durations(timesteps, dt=1):
+    """ Return the duration of each modelled timestep.
+
+    Args:
+        timesteps: list of modelled timesteps
+        dt: duration in hours; a number for all timesteps, a dict or Series
+            with timesteps as keys, or a list in the order of timesteps
+
+    Returns:
+        a dict with timesteps as keys and durations (hours) as values
+    """
+    if np.isscalar(dt):
+        durations = dict((t, float(dt)) for t in timesteps)
+    elif isinstance(dt, (dict, pd.Series)):
+        dt = pd.Series(dt)
+        missing = [t for t in timesteps if t not in dt.index]
+        if missing:
+            raise ValueError("No duration for timesteps {}".format(missing))
+        durations = dict((t, float(dt[t])) for t in timesteps)
+    else:
+        dt = list(dt)
+        if len(dt) != len(timesteps):
+            raise ValueError("Got {} durations for {} timesteps".format(
+                len(dt), len(timesteps)))
+        durations = dict((t, float(d)) for t, d in zip(timesteps, dt))
+    if any(not d > 0 for d in durations.values()):
+        raise ValueError("Timestep durations must be positive")
+    return durations
+
+
+def previous_timesteps(timesteps, period_length=None):
+    """ Return the predecessor of each modelled timestep.
+
+    Without periods, the predecessor of timestep t is the timestep before it,
+    so that timesteps[0] is the predecessor of the first modelled timestep.
+    With representative periods, each period of period_length modelled
+    timesteps is cyclic: its first timestep follows its last one.
+
+    Args:
+        timesteps: list of timesteps including the initial timestep
+        period_length: optional number of timesteps per period
+
+    Returns:
+        a dict with modelled timesteps as keys and predecessors as values
+    """
+    timesteps = list(timesteps)
+    previous = dict(zip(timesteps[1:], timesteps[:-1]))
+    if period_length:
+        for period in representative_periods(timesteps, period_length):
+            previous[period[0]] = period[-1]
+    return previous
+
+
+def representative_periods(timesteps, period_length):
+    """ Split the modelled timesteps into periods of equal length.
+
+    Args:
+        timesteps: list of timesteps including the initial timestep
+        period_length: number of timesteps per period
 
     Returns:
-        a process
+        a list of the timestep lists of the periods
     """
-    pro_output_tuples = list(instance.pro_output_tuples.value)
-    pro_input_tuples = list(instance.pro_input_tuples.value)
-    # search the output commodities for the "buy" process
-    # buy_out = (site,output_commodity)
-    buy_out = set([(x[0], x[2])
-                   for x in pro_output_tuples
-                   if x[1] == pro_in])
-    # search the sell process for the output_commodity from the buy process
-    sell_output_tuple = ([x
-                          for x in pro_output_tuples
-                          if x[2] in instance.com_sell])
-    for k in range(len(sell_output_tuple)):
-        sell_pro = sell_output_tuple[k][1]
-        sell_in = set([(x[0], x[2])
-                       for x in pro_input_tuples
-                       if x[1] == sell_pro])
-        # check: buy - commodity == commodity - sell; for a site
-        if not(sell_in.isdisjoint(buy_out)):
-            return sell_pro
-    return None
+    modelled = list(timesteps)[1:]
+    if len(modelled) % period_length:
+        raise ValueError("{} modelled timesteps cannot be divided into "
+                         "periods of length {}".format(len(modelled),
+                                                       period_length))
+    return [modelled[start:start + period_length]
+            for start in range(0, len(modelled), period_length)]
@@ -0,0 +1,112 @@
+"""Size and structure of the urbs linear program before solving."""
+import numpy as np
+import pandas as pd
+import pyomo.core as pyomo
+from .sparse import create_sparse_model, SparseModel
+
+# rough memory (bytes) an LP solver needs per nonzero (value and index in a
+# row- and a column-wise copy of the matrix) and per row or column (bounds,
+# basis status, scaling and work arrays)
+MEMORY_PER_NONZERO = 24
+MEMORY_PER_VECTOR = 64
+
+
+def model_size(data, timesteps=None, **kwargs):
+    """ Return the LP dimensions per constraint family.
+
+    Args:
+        data: input data dict as returned by read_excel, a SparseModel or a
+            model created by create_model
+        timesteps: optional list of timesteps if data is an input dict,
+            default: demand timeseries
+        **kwargs: optional keyword arguments for create_sparse_model if data
+            is an input dict, e.g. dt or dsm_formulation
+
+    Returns:
+        DataFrame of Rows, Columns (referenced by the family), Nonzeros, the
+        smallest and largest absolute coefficient (Min coef, Max coef) and
+        the estimated solver Memory (bytes) per constraint family, and a
+        'Total' row with all columns of the model
+    """
+    if isinstance(data, dict):
+        data = create_sparse_model(data, timesteps, **kwargs)
+    if isinstance(data, SparseModel):
+        families, n_cols = sparse_families(data)
+    else:
+        families, n_cols = pyomo_families(data)
+
+    sizes = [size_row(name, n_rows, len(np.unique(columns)), coefficients)
+             for name, n_rows, columns, coefficients in families]
+    total = size_row(
+        'Total', sum(n_rows for _, n_rows, _, _ in families), n_cols,
+        np.concatenate([coefficients for _, _, _, coefficients in families] +
+                       [np.empty(0)]))
+    total[-1] += n_cols * MEMORY_PER_VECTOR
+    sizes.append(total)
+
+    sizes = pd.DataFrame(sizes, columns=['Name', 'Rows', 'Columns',
+                                         'Nonzeros', 'Min coef', 'Max coef',
+                                         'Memory'])
+    sizes.set_index('Name', inplace=True)
+    return sizes
+
+
+def sparse_families(sm):
+    """ Return the constraint families of a SparseModel.
+
+    Returns:
+        a (families, n_cols) tuple: a list of (name, number of rows, column
+        positions, coefficients) per constraint family and the number of
+        columns of the model
+    """
+    _, A, _, _, _, _ = sm.matrix()
+    A.eliminate_zeros()
+    families = []
+    for name, block in sm.constraints.items():
+        part = A[block.offset:block.offset + block.size]
+        families.append((name, block.size, part.indices, part.data))
+    return families, A.shape[1]
+
+
+def pyomo_families(m):
+    """ Return the active constraint families of a Pyomo model.
+
+    Reads the linear coefficients of each constraint body, which takes
+    about as long as writing the model for a solver.
+
+    Returns:
+        a (families, n_cols) tuple like sparse_families, with the number of
+        variables of the model as number of columns
+    """
+    from pyomo.repn import generate_standard_repn
+
+    positions = dict((id(var), k) for k, var in enumerate(
+        m.component_data_objects(pyomo.Var, descend_into=True)))
+    families = []
+    for con in m.component_objects(pyomo.Constraint, active=True):
+        n_rows = 0
+        columns = []
+        coefficients = []
+        for c in con.values():
+            if not c.active:
+                continue
+            n_rows += 1
+            repn = generate_standard_repn(c.body, compute_values=True)
+            for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+                if coef != 0:
+                    columns.append(positions[id(var)])
+                    coefficients.append(coef)
+        families.append((con.name, n_rows, np.array(columns, dtype=int),
+                         np.array(coefficients, dtype=float)))
+    return families, len(positions)
+
+
+def size_row(name, n_rows, n_cols, coefficients):
+    """ Return name, rows, columns, nonzeros, coefficient range and memory.
+    """
+    coefficients = np.abs(coefficients)
+    nonzeros = len(coefficients)
+    return [name, n_rows, n_cols, nonzeros,
+            coefficients.min() if nonzeros else np.nan,
+            coefficients.max() if nonzeros else np.nan,
+            nonzeros * MEMORY_PER_NONZERO + n_rows * MEMORY_PER_VECTOR]
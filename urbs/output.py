@@ -110,9 +110,11 @@ def get_timeseries(instance, com, sites, timesteps=None):
     stock.name = 'Stock'
 
     # PROCESS
+    # in the reduced formulation, e_pro_out and e_pro_in only contain the
+    # commodities produced or consumed by some process
     created = get_entity(instance, 'e_pro_out')
-    created = created.xs(com, level='com').loc[timesteps]
     try:
+        created = created.xs(com, level='com').loc[timesteps]
         created = created.unstack(level='sit')[sites].fillna(0).sum(axis=1)
         created = created.unstack(level='pro')
         created = drop_all_zero_columns(created)
@@ -120,8 +122,8 @@ def get_timeseries(instance, com, sites, timesteps=None):
         created = pd.DataFrame(index=timesteps)
 
     consumed = get_entity(instance, 'e_pro_in')
-    consumed = consumed.xs(com, level='com').loc[timesteps]
     try:
+        consumed = consumed.xs(com, level='com').loc[timesteps]
         consumed = consumed.unstack(level='sit')[sites].fillna(0).sum(axis=1)
         consumed = consumed.unstack(level='pro')
         consumed = drop_all_zero_columns(consumed)
@@ -199,7 +201,9 @@ def get_timeseries(instance, com, sites, timesteps=None):
             dsmdo = dsmdo.unstack()[sites].sum(axis=1)
 
             # convert dsmdo to Series by summing over the first time level
-            dsmdo = dsmdo.unstack().sum(axis=0)
+            # (only pairwise DSM formulation; cumulative is indexed by t)
+            if dsmdo.index.nlevels > 1:
+                dsmdo = dsmdo.unstack().sum(axis=0)
             dsmdo.index.names = ['t']
 
             # derive secondary timeseries
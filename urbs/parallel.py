@@ -0,0 +1,107 @@
+"""Subproblems kept in worker processes for decomposition methods."""
+import multiprocessing
+
+
+class SubproblemPool(object):
+    """ Subproblems distributed over worker processes.
+
+    Args:
+        build: module-level function that creates a subproblem from the
+            arguments in subproblems, e.g. create_model
+        solve: module-level function solve(subproblem, optim, *args) that
+            solves a subproblem and returns a (picklable) result
+        subproblems: list of argument tuples for build, one per subproblem
+        solver: name of the solver for SolverFactory, e.g. 'glpk'
+        processes: number of worker processes; default: number of CPUs (at
+            most one per subproblem); 0 or 1 solve all subproblems in the
+            calling process
+    """
+    def __init__(self, build, solve, subproblems, solver, processes=None):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        processes = min(processes, len(subproblems))
+        self.size = len(subproblems)
+        self.workers = []
+        if processes <= 1:
+            self.local = _Worker(build, solve, subproblems, solver)
+            return
+        self.local = None
+        for k in range(processes):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_run_worker,
+                args=(child, build, solve, subproblems[k::processes], solver))
+            process.daemon = True
+            process.start()
+            self.workers.append((process, parent))
+
+    def solve(self, args):
+        """ Solve all subproblems.
+
+        Args:
+            args: list of argument tuples for solve, one per subproblem
+
+        Returns:
+            list of the results of solve, one per subproblem
+        """
+        if self.local:
+            return self.local.solve(args)
+        processes = len(self.workers)
+        for k, (process, connection) in enumerate(self.workers):
+            connection.send(args[k::processes])
+        results = [None] * self.size
+        for k, (process, connection) in enumerate(self.workers):
+            worker_results = connection.recv()
+            if isinstance(worker_results, Exception):
+                raise worker_results
+            results[k::processes] = worker_results
+        return results
+
+    def close(self):
+        """ Stop the worker processes.
+
+        Workers that stopped after an error (see _run_worker) have closed
+        their pipe already, so that the error raised by solve is not hidden
+        by a failing send.
+        """
+        for process, connection in self.workers:
+            if process.is_alive():
+                try:
+                    connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+            process.join()
+        self.workers = []
+
+
+class _Worker(object):
+    """ Subproblems of one worker process.
+
+    Every subproblem gets a solver object of its own, as persistent solvers
+    are bound to one model.
+    """
+    def __init__(self, build, solve, subproblems, solver):
+        import pyomo.environ  # registers the solver plugins
+        from pyomo.opt import SolverFactory
+        self.solve_subproblem = solve
+        self.subproblems = [build(*args) for args in subproblems]
+        self.optims = [SolverFactory(solver) for _ in self.subproblems]
+
+    def solve(self, args):
+        return [self.solve_subproblem(subproblem, optim, *arg)
+                for subproblem, optim, arg
+                in zip(self.subproblems, self.optims, args)]
+
+
+def _run_worker(connection, build, solve, subproblems, solver):
+    """ Main loop of a worker process: solve until None is received. """
+    try:
+        worker = _Worker(build, solve, subproblems, solver)
+        while True:
+            args = connection.recv()
+            if args is None:
+                break
+            connection.send(worker.solve(args))
+    except Exception as error:
+        connection.send(error)
+    connection.close()
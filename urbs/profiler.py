@@ -0,0 +1,96 @@
+"""Build-time profile of the model components of create_model."""
+import time
+import tracemalloc
+import pandas as pd
+import pyomo.core as pyomo
+
+# short entity type names, as used by list_entities
+ENTITY_TYPES = [(pyomo.Set, 'set'), (pyomo.Param, 'par'), (pyomo.Var, 'var'),
+                (pyomo.Expression, 'expr'), (pyomo.Constraint, 'con'),
+                (pyomo.Objective, 'obj')]
+
+
+class ProfiledModel(pyomo.ConcreteModel):
+    """ ConcreteModel that records the construction of its components.
+
+    Memory is measured with tracemalloc, which is started if it is not
+    tracing already and slows down the model build.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ProfiledModel, self).__init__(*args, **kwargs)
+        self._build_tracemalloc = not tracemalloc.is_tracing()
+        if self._build_tracemalloc:
+            tracemalloc.start()
+        self._build_records = []
+        self._build_mark = (time.time(), tracemalloc.get_traced_memory()[0])
+
+    def add_component(self, name, val):
+        super(ProfiledModel, self).add_component(name, val)
+        if (not hasattr(self, '_build_records') or
+                not getattr(self, '_build_recording', True)):
+            return
+        start, memory = self._build_mark
+        generated, skipped = component_size(val)
+        self._build_mark = (time.time(), tracemalloc.get_traced_memory()[0])
+        self._build_records.append((
+            name, entity_type(val), self._build_mark[0] - start,
+            generated, skipped, self._build_mark[1] - memory))
+
+    def stop_profile(self):
+        """ Stop recording, and tracemalloc if the model started it. """
+        self._build_recording = False
+        if self._build_tracemalloc:
+            tracemalloc.stop()
+            self._build_tracemalloc = False
+
+
+def entity_type(component):
+    """ Return the short type name of a component, e.g. 'con'. """
+    for component_type, name in ENTITY_TYPES:
+        if isinstance(component, component_type):
+            return name
+    return type(component).__name__.lower()
+
+
+def component_size(component):
+    """ Return the number of generated and skipped indices of a component.
+
+    Args:
+        component: a constructed Pyomo component
+
+    Returns:
+        a (generated, skipped) tuple; indices are skipped if the rule of a
+        Constraint or Expression does not create them for an index of its
+        index set
+    """
+    if isinstance(component, pyomo.Set) and not component.is_indexed():
+        return len(component), 0
+    if not component.is_indexed():
+        return 1, 0
+    generated = len(component)
+    if isinstance(component, (pyomo.Constraint, pyomo.Expression)):
+        return generated, len(component.index_set()) - generated
+    return generated, 0
+
+
+def build_profile(instance, filename=None):
+    """ Return the build-time profile of a model created with profile=True.
+
+    Args:
+        instance: a model created by create_model(..., profile=True)
+        filename: optional CSV file to write the profile to, e.g. next to
+            the solver log in the result directory
+
+    Returns:
+        DataFrame of Type, Time (s), generated Indices, Skipped indices and
+        allocated Memory (bytes) of each component in order of creation
+    """
+    if not hasattr(instance, '_build_records'):
+        raise ValueError("Model was not created with profile=True")
+    profile = pd.DataFrame(instance._build_records,
+                           columns=['Name', 'Type', 'Time', 'Indices',
+                                    'Skipped', 'Memory'])
+    profile.set_index('Name', inplace=True)
+    if filename:
+        profile.to_csv(filename)
+    return profile
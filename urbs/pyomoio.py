@@ -7,7 +7,7 @@ def get_entity(instance, name):
 
     Args:
         instance: a Pyomo ConcreteModel instance
-        name: name of a Set, Param, Var, Constraint or Objective
+        name: name of a Set, Param, Var, Expression, Constraint or Objective
 
     Returns:
         a Pandas Series with domain as index and values (or 1's, for sets) of
@@ -61,6 +61,19 @@ def get_entity(instance, name):
                 [(v[0], instance.dual[v[1]]) for v in entity.iteritems()])
             labels = ['None']
 
+    elif isinstance(entity, pyomo.Expression):
+        # expressions have no value attribute, so evaluate them; unsolved
+        # variables within result in None, like for variables
+        values = [(index, pyomo.value(expr, exception=False))
+                  for index, expr in entity.iteritems()]
+        if entity.dim() > 1:
+            results = pd.DataFrame([index + (value,)
+                                    for index, value in values])
+        else:
+            results = pd.DataFrame(values)
+            if entity.dim() == 0:
+                labels = ['None']
+
     else:
         # create DataFrame
         if entity.dim() > 1:
@@ -129,11 +142,12 @@ def get_entities(instance, names):
 
 
 def list_entities(instance, entity_type):
-    """ Return list of sets, params, variables, constraints or objectives
+    """ Return list of sets, params, variables, expressions, constraints or
+    objectives
 
     Args:
         instance: a Pyomo ConcreteModel object
-        entity_type: "set", "par", "var", "con" or "obj"
+        entity_type: "set", "par", "var", "expr", "con" or "obj"
 
     Returns:
         DataFrame of entities
@@ -156,6 +170,8 @@ def list_entities(instance, entity_type):
             return isinstance(entity, pyomo.Param)
         elif entity_type == 'var':
             return isinstance(entity, pyomo.Var)
+        elif entity_type == 'expr':
+            return isinstance(entity, pyomo.Expression)
         elif entity_type == 'con':
             return isinstance(entity, pyomo.Constraint)
         elif entity_type == 'obj':
@@ -190,8 +206,8 @@ def _get_onset_names(entity):
     """ Return a list of domain set names for a given model entity
 
     Args:
-        entity: a member entity (i.e. a Set, Param, Var, Objective, Constraint)
-                of a Pyomo ConcreteModel object
+        entity: a member entity (i.e. a Set, Param, Var, Expression,
+                Objective, Constraint) of a Pyomo ConcreteModel object
 
     Returns:
         list of domain set names for that entity
@@ -235,8 +251,8 @@ def _get_onset_names(entity):
             # no domain, so no labels needed
             pass
 
-    elif isinstance(entity, (pyomo.Param, pyomo.Var, pyomo.Constraint,
-                    pyomo.Objective)):
+    elif isinstance(entity, (pyomo.Param, pyomo.Var, pyomo.Expression,
+                    pyomo.Constraint, pyomo.Objective)):
         if entity.dim() > 0 and entity._index:
             labels = _get_onset_names(entity._index)
         else:
@@ -0,0 +1,209 @@
+"""Rolling-horizon dispatch with fixed capacities."""
+import pandas as pd
+import pyomo.core as pyomo
+from .model import create_model, def_costs_rule
+from .modelhelper import check_optimal, timestep_durations
+from .pyomoio import get_entity
+from .saveload import create_result_cache, ResultContainer
+
+# (input table, capacity entity, input columns) of the capacities that
+# fix_capacities sets as installed capacities with equal lower/upper limits
+FIXED_CAPACITIES = [
+    ('process', 'cap_pro', ['inst-cap', 'cap-lo', 'cap-up']),
+    ('transmission', 'cap_tra', ['inst-cap', 'cap-lo', 'cap-up']),
+    ('storage', 'cap_sto_c', ['inst-cap-c', 'cap-lo-c', 'cap-up-c']),
+    ('storage', 'cap_sto_p', ['inst-cap-p', 'cap-lo-p', 'cap-up-p'])]
+
+# cost types that do not depend on the dispatch
+CAPACITY_COST_TYPES = ['Invest', 'Fixed']
+
+
+def fix_capacities(data, prob):
+    """ Return input data with the capacities of a solved model as fixed.
+
+    Args:
+        data: input data dict as returned by read_excel
+        prob: a solved urbs model (or result container) with the same
+            processes, transmissions and storages
+
+    Returns:
+        a copy of data in which the installed capacities and the capacity
+        limits of all processes, transmissions and storages equal their
+        capacities in prob, so that no new capacity can be built
+    """
+    data = dict(data)
+    for table, entity, columns in FIXED_CAPACITIES:
+        if data[table].empty:
+            continue
+        capacity = get_entity(prob, entity).reindex(data[table].index)
+        data[table] = data[table].copy()
+        for column in columns:
+            data[table][column] = capacity.values
+    return data
+
+
+def rolling_horizon(prob, data, timesteps, optim, window=168, overlap=24,
+                    **kwargs):
+    """ Solve the dispatch for fixed capacities in overlapping windows.
+
+    The commodity totals (max) and the hacks' global CO2 limit are applied
+    to each window scaled to a year, like to any shorter model, and DSM
+    shifts do not cross window boundaries.
+
+    Args:
+        prob: a solved urbs model (or result container) whose capacities
+            are used, e.g. an investment run on fewer or aggregated timesteps
+        data: input data dict as returned by read_excel
+        timesteps: list of timesteps of the full dispatch, the first one is
+            only the initial timestep, like in create_model
+        optim: a solver object, e.g. SolverFactory('glpk')
+        window: number of modelled timesteps per window
+        overlap: number of timesteps at the end of each window that are only
+            used to look ahead and solved again by the next window
+        **kwargs: optional keyword arguments for create_model, e.g. dt;
+            representative periods (weights, period_length, calendar) are
+            not supported, as each window is a chronological dispatch
+
+    Returns:
+        a ResultContainer with the stitched results of all windows; entities
+        without timesteps (e.g. capacities) and the Invest and Fixed costs
+        are taken from prob, the other costs are those of the committed
+        timesteps of all windows
+    """
+    if not 0 <= overlap < window:
+        raise ValueError("overlap must be at least 0 and less than window")
+    unsupported = [name for name in ('weights', 'period_length', 'calendar')
+                   if kwargs.get(name) is not None]
+    if unsupported:
+        raise ValueError("rolling_horizon does not support {}".format(
+            ', '.join(unsupported)))
+
+    timesteps = list(timesteps)
+    modelled = timesteps[1:]
+    dispatch_data = fix_capacities(data, prob)
+    kwargs['dt'] = timestep_durations(
+        modelled, kwargs.get('dt', data.get('dt', 1)))
+    weight = float(8760) / sum(kwargs['dt'].values())
+
+    parts = {}
+    costs = {}
+    state = None
+    for start in range(0, len(modelled), window - overlap):
+        final = start + window >= len(modelled)
+        steps = modelled[start:start + window]
+        committed = steps if final else steps[:window - overlap]
+
+        m = create_model(dispatch_data, [timesteps[start]] + steps, **kwargs)
+        set_window_state(m, state, final)
+        check_optimal(optim.solve(m), 'window of timesteps {} to {}'
+                      .format(steps[0], steps[-1]))
+
+        # keep the committed timesteps (and the initial one of the first
+        # window) of all timeseries results
+        keep = set(committed)
+        if state is None:
+            keep.add(timesteps[0])
+        for name, entity in create_result_cache(m).items():
+            if 't' not in entity.index.names:
+                continue
+            in_window = entity.index.get_level_values('t').isin(keep)
+            parts.setdefault(name, []).append(entity[in_window])
+
+        # costs of the committed timesteps, scaled to the full timesteps
+        for cost_type, value in window_costs(m, committed).items():
+            costs[cost_type] = (costs.get(cost_type, 0) +
+                                value * weight / pyomo.value(m.weight))
+
+        state = window_state(m, committed[-1])
+        del m
+        if final:
+            break
+
+    result = dict((name, pd.concat(series)) for name, series in parts.items())
+
+    # entities without timesteps, e.g. capacities, from prob
+    if not hasattr(prob, '_result'):
+        prob._result = create_result_cache(prob)
+    for name, entity in prob._result.items():
+        if name not in result:
+            result[name] = entity
+    cost_entity = result['costs'].copy()
+    for cost_type, value in costs.items():
+        cost_entity[cost_type] = value
+    result['costs'] = cost_entity
+    return ResultContainer(data, result)
+
+
+def window_costs(m, committed):
+    """ Return the dispatch costs of the committed timesteps of a window.
+
+    Evaluates the cost definitions of create_model (def_costs_rule) for a
+    solved window with a timestep weight of 0 for all timesteps that are not
+    committed.
+
+    Args:
+        m: a solved model of one window
+        committed: list of committed timesteps
+
+    Returns:
+        a dict of costs by cost type (scaled by the window's weight) for all
+        cost types except CAPACITY_COST_TYPES
+    """
+    timestep_weight = m.timestep_weight
+    committed = set(committed)
+    m.timestep_weight = dict((t, w if t in committed else 0)
+                             for t, w in timestep_weight.items())
+    try:
+        return dict((cost_type, pyomo.value(def_costs_rule(m, cost_type)
+                                            .args[1]))
+                    for cost_type in m.cost_type
+                    if cost_type not in CAPACITY_COST_TYPES)
+    finally:
+        m.timestep_weight = timestep_weight
+
+
+def window_state(m, t):
+    """ Return the state of a solved window in timestep t.
+
+    Args:
+        m: a solved model of one window
+        t: last committed timestep
+
+    Returns:
+        a dict of storage content, process throughput and online capacity
+        (dicts by storage or process tuple) in timestep t
+    """
+    return {
+        'e_sto_con': dict((s, m.e_sto_con[(t,) + s].value)
+                          for s in m.sto_tuples),
+        'tau_pro': dict((p, m.tau_pro[(t,) + p].value)
+                        for p in m.pro_tuples),
+        'cap_online': dict((p, m.cap_online[(t,) + p].value)
+                           for p in m.pro_partial_tuples)}
+
+
+def set_window_state(m, state, final):
+    """ Fix the initial state of a window and relax its final storage state.
+
+    Args:
+        m: model of one window
+        state: state of the previous window as returned by window_state, or
+            None for the first window (which keeps the initial storage state)
+        final: True for the last window, which keeps the final storage state
+
+    Returns:
+        Nothing
+    """
+    t0 = m.timesteps[0]
+    if state is not None:
+        for s in m.sto_tuples:
+            m.res_initial_and_final_storage_state[(t0,) + s].deactivate()
+            m.e_sto_con[(t0,) + s].fix(state['e_sto_con'][s])
+        for p in m.pro_tuples:
+            m.tau_pro[(t0,) + p].fix(state['tau_pro'][p])
+        for p in m.pro_partial_tuples:
+            m.cap_online[(t0,) + p].fix(state['cap_online'][p])
+    if not final:
+        for s in m.sto_tuples:
+            m.res_initial_and_final_storage_state[
+                (m.timesteps[-1],) + s].deactivate()
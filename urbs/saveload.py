@@ -3,7 +3,7 @@ from .pyomoio import get_entity, list_entities
 
 
 def create_result_cache(prob):
-    entity_types = ['set', 'par', 'var']
+    entity_types = ['set', 'par', 'var', 'expr']
     if hasattr(prob, 'dual'):
         entity_types.append('con')
 
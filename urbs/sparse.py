@@ -0,0 +1,1157 @@
+"""Sparse-matrix backend for the urbs linear program."""
+import math
+import numpy as np
+import pandas as pd
+import pyomo.core as pyomo
+from collections import OrderedDict
+from .model import create_model
+from .modelhelper import *
+from .saveload import ResultContainer
+
+# create_model options without a counterpart in create_sparse_model
+UNSUPPORTED_OPTIONS = ['mutable', 'var_bounds', 'reduced',
+                       'undirected_transmission', 'weights', 'period_length',
+                       'calendar', 'profile']
+
+
+class Block(object):
+    """ Variable or constraint family of a SparseModel.
+
+    A block covers one column (variable) or row (constraint) per element of
+    keys or, if times is given, per element of the product times x keys.
+    Positions are ordered time-major, i.e. offset + time * len(keys) + key.
+    """
+    def __init__(self, name, keys, labels, times, offset, doc,
+                 report_keys=None):
+        self.name = name
+        self.keys = [key if isinstance(key, tuple) else (key,)
+                     for key in keys]
+        self.report_keys = report_keys
+        self.labels = labels
+        self.times = None if times is None else np.asarray(list(times))
+        self.offset = offset
+        self.doc = doc
+        self.key_pos = dict((key, k) for k, key in enumerate(self.keys))
+        self.time_index = None if times is None else pd.Index(self.times)
+
+    @property
+    def size(self):
+        if self.times is None:
+            return len(self.keys)
+        return len(self.times) * len(self.keys)
+
+    def k(self, keys):
+        """ Key positions for a list of keys (tuples). """
+        return np.array([self.key_pos[key if isinstance(key, tuple)
+                                      else (key,)] for key in keys],
+                        dtype=int)
+
+    def grid(self, kpos, times=None):
+        """ Absolute positions for all combinations of times and kpos.
+
+        Args:
+            kpos: array of key positions
+            times: array of timesteps (default: all times of the block);
+                ignored for blocks without time dimension
+
+        Returns:
+            an array of shape (len(times), len(kpos)), or (1, len(kpos)) for
+            blocks without time dimension; -1 marks timesteps not in block
+        """
+        kpos = np.asarray(kpos, dtype=int)
+        if self.times is None:
+            return (self.offset + kpos)[np.newaxis, :]
+        if times is None:
+            tpos = np.arange(len(self.times))
+        else:
+            tpos = self.time_index.get_indexer(np.asarray(times))
+        pos = (self.offset + tpos[:, np.newaxis] * len(self.keys) +
+               kpos[np.newaxis, :])
+        pos[tpos < 0, :] = -1
+        return pos
+
+    def at(self, kpos, times=None):
+        """ Absolute positions for elementwise pairs of times and kpos. """
+        kpos = np.asarray(kpos, dtype=int)
+        if self.times is None:
+            return self.offset + kpos
+        tpos = self.time_index.get_indexer(np.asarray(times))
+        return np.where(tpos >= 0,
+                        self.offset + tpos * len(self.keys) + kpos, -1)
+
+    def index(self, keys=None):
+        """ pandas Index of the block (or of times x keys), named by its
+        labels. """
+        keys = self.keys if keys is None else keys
+        if not keys or (self.times is not None and not len(self.times)):
+            return None
+        levels = [list(level) for level in zip(*keys)]
+        if self.times is not None:
+            levels = ([np.repeat(self.times, len(keys))] +
+                      [np.tile(np.array(level, dtype=object),
+                               len(self.times)) for level in levels])
+        if len(levels) == 1:
+            return pd.Index(levels[0], name=self.labels[0])
+        return pd.MultiIndex.from_arrays(levels, names=self.labels)
+
+    def series(self, values):
+        """ pandas Series of the block values, like get_entity returns. """
+        if self.report_keys is not None:
+            index = self.index(self.report_keys)
+        else:
+            index = self.index()
+        if index is None:
+            return pd.Series(name=self.name)
+        series = pd.Series(values[self.offset:self.offset + self.size],
+                           index=self.index(), name=self.name)
+        if self.report_keys is not None:
+            series = series.reindex(index)
+        return series
+
+
+class SparseModel(object):
+    """ Linear program stored as sparse coefficient matrix.
+
+    Variables and constraints are added family-wise as Blocks; coefficients
+    are collected as COO triplets (row, column, value) and bounds as arrays.
+    """
+    def __init__(self, name='URBS'):
+        self.name = name
+        self.variables = OrderedDict()
+        self.constraints = OrderedDict()
+        self.n_cols = 0
+        self.n_rows = 0
+        self._col_lb = []
+        self._col_ub = []
+        self._row_lo = []
+        self._row_up = []
+        self._coo = []
+        self._obj = []
+        self.solution = None
+        self.duals = None
+        self.status = None
+
+    def add_variable(self, name, keys, labels, times=None, lb=0.0,
+                     ub=np.inf, doc='', report_keys=None):
+        """ Add a variable family lb <= columns <= ub.
+
+        If given, report_keys (a superset of keys) are the keys under which
+        the variable is reported in the result cache.
+        """
+        block = Block(name, keys, labels, times, self.n_cols, doc,
+                      report_keys)
+        self.variables[name] = block
+        self.n_cols += block.size
+        self._col_lb.append(np.broadcast_to(lb, (block.size,)))
+        self._col_ub.append(np.broadcast_to(ub, (block.size,)))
+        return block
+
+    def add_constraint(self, name, keys, labels, times=None, lo=-np.inf,
+                       up=np.inf, doc=''):
+        """ Add a constraint family lo <= rows <= up.
+
+        lo and up are scalars, arrays over keys or arrays of shape
+        (len(times), len(keys)).
+        """
+        block = Block(name, keys, labels, times, self.n_rows, doc)
+        self.constraints[name] = block
+        self.n_rows += block.size
+        shape = (1 if times is None else len(block.times), len(block.keys))
+        self._row_lo.append(np.broadcast_to(lo, shape).astype(float).ravel())
+        self._row_up.append(np.broadcast_to(up, shape).astype(float).ravel())
+        return block
+
+    def add_coefficients(self, rows, cols, values=1.0):
+        """ Add coefficients; entries with negative row or column are
+        dropped (e.g. references to timesteps outside a block). """
+        rows, cols, values = np.broadcast_arrays(rows, cols, values)
+        valid = (rows >= 0) & (cols >= 0)
+        if valid.any():
+            self._coo.append((rows[valid].astype(int),
+                              cols[valid].astype(int),
+                              values[valid].astype(float)))
+
+    def link(self, con, con_k, var, var_k, coef=1.0, shift=0, times=None):
+        """ Add coef * var[t + shift, var_k] to rows con[t, con_k].
+
+        For constraints without time dimension, the variable is summed over
+        times (default: all times of the variable).
+        """
+        rows = con.grid(con_k)
+        if var.times is None:
+            cols = var.grid(var_k)
+        elif con.times is not None:
+            cols = var.grid(var_k, con.times + shift)
+        else:
+            cols = var.grid(var_k, times)
+        self.add_coefficients(rows, cols, coef)
+
+    def add_objective(self, var, var_k, coef=1.0):
+        cols = var.grid(var_k).ravel()
+        self._obj.append((cols, np.broadcast_to(coef, cols.shape)))
+
+    def matrix(self):
+        """ Return (c, A, row_lo, row_up, col_lb, col_ub) with A as CSR. """
+        import scipy.sparse as sp
+
+        if self._coo:
+            rows, cols, values = (np.concatenate(a) for a in zip(*self._coo))
+        else:
+            rows = cols = np.empty(0, dtype=int)
+            values = np.empty(0)
+        A = sp.coo_matrix((values, (rows, cols)),
+                          shape=(self.n_rows, self.n_cols)).tocsr()
+        A.sum_duplicates()
+        c = np.zeros(self.n_cols)
+        for cols, coef in self._obj:
+            np.add.at(c, cols, coef)
+        return (c, A,
+                _concatenate(self._row_lo), _concatenate(self._row_up),
+                _concatenate(self._col_lb), _concatenate(self._col_ub))
+
+    def solve(self, **options):
+        """ Solve with SciPy's HiGHS interface (scipy.optimize.linprog).
+
+        Args:
+            options: passed to linprog as its options dict, e.g. presolve,
+                time_limit or disp
+
+        Returns:
+            the linprog OptimizeResult; the solution and constraint duals
+            are kept as attributes solution and duals
+        """
+        import scipy.sparse as sp
+        from scipy.optimize import linprog
+
+        c, A, lo, up, lb, ub = self.matrix()
+        eq = lo == up
+        upper = ~eq & np.isfinite(up)
+        lower = ~eq & np.isfinite(lo)
+        A_ub = sp.vstack([A[upper], -A[lower]]).tocsr()
+        b_ub = np.concatenate([up[upper], -lo[lower]])
+        result = linprog(c,
+                         A_ub=A_ub if A_ub.shape[0] else None,
+                         b_ub=b_ub if A_ub.shape[0] else None,
+                         A_eq=A[eq] if eq.any() else None,
+                         b_eq=lo[eq] if eq.any() else None,
+                         bounds=np.column_stack([lb, ub]),
+                         method='highs', options=options)
+        self.status = result.status
+        if result.x is not None:
+            self.solution = result.x
+            # duals are derivatives of the objective by the constraint
+            # bounds, i.e. same sign convention as Pyomo's dual suffix
+            self.duals = np.zeros(self.n_rows)
+            if eq.any():
+                self.duals[eq] = result.eqlin.marginals
+            if A_ub.shape[0]:
+                marginals = result.ineqlin.marginals
+                self.duals[upper] += marginals[:upper.sum()]
+                self.duals[lower] -= marginals[upper.sum():]
+        return result
+
+    def write_mps(self, filename):
+        """ Write the linear program to a (free format) MPS file.
+
+        Column and row names follow Pyomo's symbolic labels, e.g.
+        e_pro_in(1_Mid_PV_Solar).
+        """
+        c, A, lo, up, lb, ub = self.matrix()
+        col_names = _names(self.variables)
+        row_names = _names(self.constraints)
+        A = A.tocsc()
+
+        with open(filename, 'w') as f:
+            f.write('NAME {}\nROWS\n N obj\n'.format(self.name))
+            for name, l, u in zip(row_names, lo, up):
+                if l == u:
+                    f.write(' E {}\n'.format(name))
+                elif np.isfinite(u):
+                    f.write(' L {}\n'.format(name))
+                elif np.isfinite(l):
+                    f.write(' G {}\n'.format(name))
+                else:
+                    f.write(' N {}\n'.format(name))
+
+            f.write('COLUMNS\n')
+            for j, name in enumerate(col_names):
+                if c[j]:
+                    f.write(' {} obj {!r}\n'.format(name, float(c[j])))
+                for k in range(A.indptr[j], A.indptr[j + 1]):
+                    f.write(' {} {} {!r}\n'.format(
+                        name, row_names[A.indices[k]], float(A.data[k])))
+
+            f.write('RHS\n')
+            for name, l, u in zip(row_names, lo, up):
+                rhs = u if np.isfinite(u) else l
+                if np.isfinite(rhs) and rhs != 0:
+                    f.write(' rhs {} {!r}\n'.format(name, float(rhs)))
+
+            f.write('RANGES\n')
+            for name, l, u in zip(row_names, lo, up):
+                if l != u and np.isfinite(l) and np.isfinite(u):
+                    f.write(' rng {} {!r}\n'.format(name, float(u - l)))
+
+            f.write('BOUNDS\n')
+            for name, l, u in zip(col_names, lb, ub):
+                if not np.isfinite(l) and not np.isfinite(u):
+                    f.write(' FR bnd {}\n'.format(name))
+                    continue
+                if l != 0:
+                    if np.isfinite(l):
+                        f.write(' LO bnd {} {!r}\n'.format(name, float(l)))
+                    else:
+                        f.write(' MI bnd {}\n'.format(name))
+                if np.isfinite(u):
+                    f.write(' UP bnd {} {!r}\n'.format(name, float(u)))
+            f.write('ENDATA\n')
+
+    def load_solution(self, solution, duals=None):
+        """ Set the solution (and duals) from an external solver, ordered
+        like the columns (rows) of matrix(). """
+        self.solution = np.asarray(solution, dtype=float)
+        if duals is not None:
+            self.duals = np.asarray(duals, dtype=float)
+
+    def result(self):
+        """ Return a ResultContainer with input data and result cache.
+
+        The result cache holds the same entities as create_result_cache
+        creates for a Pyomo model: sets, parameters, variables and, if the
+        model was created with dual=True, constraint duals.
+        """
+        if self.solution is None:
+            raise ValueError('SparseModel has no solution yet.')
+
+        result = OrderedDict()
+        for name, (index, labels) in self.sets.items():
+            result[name] = _set_series(name, index, labels)
+        for name, value in self.params.items():
+            result[name] = pd.Series([value], index=pd.Index([None],
+                                                             name='None'),
+                                     name=name)
+        for name, block in self.variables.items():
+            result[name] = block.series(self.solution)
+        if self.dual and self.duals is not None:
+            for name, block in self.constraints.items():
+                result[name] = block.series(self.duals)
+        return ResultContainer(self._data, result)
+
+
+def _concatenate(arrays):
+    if not arrays:
+        return np.empty(0)
+    return np.concatenate([np.asarray(a, dtype=float) for a in arrays])
+
+
+def _names(blocks):
+    names = []
+    for name, block in blocks.items():
+        if block.size == 0:
+            continue
+        index = block.index()
+        for idx in index:
+            if not isinstance(idx, tuple):
+                idx = (idx,)
+            label = '_'.join(str(i) for i in idx)
+            names.append('{}({})'.format(name, label).replace(' ', '_'))
+    return names
+
+
+def _set_series(name, elements, labels):
+    # mimic get_entity for sets: unconstrained sets are indexed by their own
+    # name and the Series name gets an underscore appended, e.g. 't_' for 't'
+    if not labels:
+        labels = [name]
+        name = name + '_'
+    if not elements:
+        return pd.Series(name=name)
+    if len(labels) == 1:
+        index = pd.Index(list(elements), name=labels[0])
+    else:
+        index = pd.MultiIndex.from_tuples(list(elements), names=labels)
+    return pd.Series(1, index=index, name=name)
+
+
+def create_sparse_model(data, timesteps=None, dt=None, dual=False,
+                        dsm_formulation=None, **kwargs):
+    """Create a SparseModel of the urbs linear program from input data.
+
+    Assembles the same variables and constraints as create_model, without
+    building a Pyomo model.
+
+    Args:
+        data: a dict of DataFrames as returned by read_excel
+        timesteps: optional list of timesteps, default: demand timeseries
+        dt: timestep duration in hours; durations per timestep (see
+            create_model) must all be equal; default: optional Demand
+            column 'dt', else 1
+        dual: set True to include constraint duals in the result cache
+        dsm_formulation: 'pairwise' or 'cumulative', see create_model
+        **kwargs: other create_model options (UNSUPPORTED_OPTIONS) are
+            rejected unless they are None or False
+
+    Returns:
+        a SparseModel; solve it with its method solve (or write_mps) and
+        read the results from the ResultContainer returned by result()
+    """
+    unknown = [name for name in kwargs if name not in UNSUPPORTED_OPTIONS]
+    if unknown:
+        raise TypeError("create_sparse_model got unexpected keyword "
+                        "arguments {}".format(', '.join(unknown)))
+    unsupported = [name for name in UNSUPPORTED_OPTIONS
+                   if kwargs.get(name) is not None and
+                   kwargs.get(name) is not False]
+    if unsupported:
+        raise ValueError("create_sparse_model does not support {}; use "
+                         "create_model".format(', '.join(unsupported)))
+
+    m = SparseModel()
+    m._data = data
+    m.dual = dual
+
+    if not timesteps:
+        timesteps = data['demand'].index.tolist()
+    timesteps = list(timesteps)
+    if dt is None:
+        dt = data.get('dt', 1)
+    durations = set(timestep_durations(timesteps[1:], dt).values())
+    if len(durations) > 1:
+        raise ValueError("SparseModel requires uniform timestep durations; "
+                         "use create_model for variable durations")
+    dt = durations.pop()
+
+    # Preparations
+    # ============
+    site = data['site']
+    commodity = data['commodity']
+    process = data['process']
+    transmission = data['transmission']
+    storage = data['storage']
+    m.dsm = data['dsm']
+    m.dsm_formulation = get_dsm_formulation(m.dsm, dsm_formulation)
+
+    r_in = data['process_commodity'].xs('In', level='Direction')['ratio']
+    r_out = data['process_commodity'].xs('Out', level='Direction')['ratio']
+    r_in_min_fraction = data['process_commodity'].xs('In', level='Direction')
+    r_in_min_fraction = r_in_min_fraction['ratio-min']
+    r_in_min_fraction = r_in_min_fraction[r_in_min_fraction > 0]
+
+    m.site_dict = site.to_dict()
+    m.commodity_dict = commodity.to_dict()
+    m.process_dict = process.to_dict()
+    m.transmission_dict = transmission.to_dict()
+    m.storage_dict = storage.to_dict()
+    m.dsm_dict = m.dsm.to_dict()
+    r_in_dict = r_in.to_dict()
+    r_out_dict = r_out.to_dict()
+    r_in_min_fraction_dict = r_in_min_fraction.to_dict()
+
+    demand_ts = timeseries_matrix(data['demand'])
+    supim_ts = timeseries_matrix(data['supim'])
+    m.buy_sell_price_ts = timeseries_matrix(data['buy_sell_price'])
+
+    # Sets
+    # ====
+    t = np.array(timesteps)
+    m.tm = tm = t[1:]
+    t_init_final = sorted(set([timesteps[0], timesteps[-1]]))
+    cost_types = ['Invest', 'Fixed', 'Variable', 'Fuel', 'Revenue',
+                  'Purchase', 'Startup', 'Environmental']
+
+    com_tuples = list(commodity.index)
+    pro_tuples = list(process.index)
+    tra_tuples = list(transmission.index)
+    sto_tuples = list(storage.index)
+    dsm_site_tuples = list(m.dsm.index)
+
+    m.pro_input_tuples = [(sit, pro, com)
+                          for (sit, pro) in pro_tuples
+                          for (p, com) in r_in.index if p == pro]
+    m.pro_output_tuples = [(sit, pro, com)
+                           for (sit, pro) in pro_tuples
+                           for (p, com) in r_out.index if p == pro]
+    pro_maxgrad_tuples = [(sit, pro) for (sit, pro) in pro_tuples
+                          if m.process_dict['max-grad'][sit, pro] < 1.0 / dt]
+    pro_partial_tuples = list(OrderedDict.fromkeys(
+        (sit, pro) for (sit, pro) in pro_tuples
+        for (p, _) in r_in_min_fraction.index if p == pro))
+    pro_partial_input_tuples = [(sit, pro, com)
+                                for (sit, pro) in pro_partial_tuples
+                                for (p, com) in r_in_min_fraction.index
+                                if p == pro]
+
+    com_supim = commodity_subset(com_tuples, 'SupIm')
+    com_stock = commodity_subset(com_tuples, 'Stock')
+    m.com_sell = commodity_subset(com_tuples, 'Sell')
+    com_buy = commodity_subset(com_tuples, 'Buy')
+    com_demand = commodity_subset(com_tuples, 'Demand')
+    com_env = commodity_subset(com_tuples, 'Env')
+
+    com_vertex_tuples = [c for c in com_tuples
+                         if c[1] not in com_env and c[1] not in com_supim]
+    com_stock_tuples = [c for c in com_tuples if c[1] in com_stock]
+    com_sell_tuples = [c for c in com_tuples if c[1] in m.com_sell]
+    com_buy_tuples = [c for c in com_tuples if c[1] in com_buy]
+    com_env_tuples = [c for c in com_tuples if c[1] in com_env]
+    pro_supim_input_tuples = [c for c in m.pro_input_tuples
+                              if c[2] in com_supim]
+    m.pro_buy_input_tuples = [c for c in m.pro_input_tuples
+                              if c[2] in com_buy]
+    m.sell_buy_pairs = sell_buy_pairs(m)
+    com_prices, _, price_cols = com_price_matrix(
+        m, com_sell_tuples + com_buy_tuples)
+
+    # sets and parameters reported in the result cache, with their labels
+    m.sets = OrderedDict([
+        ('t', (timesteps, [])),
+        ('tm', (list(tm), ['t'])),
+        ('cost_type', (cost_types, [])),
+        ('com_tuples', (com_tuples, ['sit', 'com', 'com_type'])),
+        ('pro_tuples', (pro_tuples, ['sit', 'pro'])),
+        ('tra_tuples', (tra_tuples, ['sit', 'sit_', 'tra', 'com'])),
+        ('sto_tuples', (sto_tuples, ['sit', 'sto', 'com'])),
+        ('dsm_site_tuples', (dsm_site_tuples, ['sit', 'com']))])
+    weight = float(8760) / (len(tm) * dt)
+    m.params = OrderedDict([('weight', weight), ('dt', dt)])
+
+    # annuity factors, computed without modifying the input DataFrames
+    def annuity(df, keys):
+        af = annuity_factor(df['depreciation'], df['wacc']).to_dict()
+        return np.array([af[key] for key in keys])
+
+    def values(table, attribute, keys):
+        return np.array([table[attribute][key] for key in keys], dtype=float)
+
+    # Variables
+    # =========
+    # e_co_* and e_pro_* are reported over com_tuples and pro_tuples x com
+    pro_com_tuples = [(sit, pro, com)
+                      for (sit, pro) in pro_tuples
+                      for com in commodity.index.get_level_values(
+                          'Commodity').unique()]
+    com_labels = ['t', 'sit', 'com', 'com_type']
+    pro_labels = ['t', 'sit', 'pro', 'com']
+    tra_labels = ['t', 'sit', 'sit_', 'tra', 'com']
+    sto_labels = ['t', 'sit', 'sto', 'com']
+
+    costs = m.add_variable('costs', cost_types, ['cost_type'],
+                           lb=-np.inf, doc='Costs by type (EUR/a)')
+    e_co_stock = m.add_variable(
+        'e_co_stock', com_stock_tuples, com_labels, tm,
+        report_keys=com_tuples,
+        doc='Use of stock commodity source (MW) per timestep')
+    e_co_sell = m.add_variable(
+        'e_co_sell', com_sell_tuples, com_labels, tm,
+        report_keys=com_tuples,
+        doc='Use of sell commodity source (MW) per timestep')
+    e_co_buy = m.add_variable(
+        'e_co_buy', com_buy_tuples, com_labels, tm,
+        report_keys=com_tuples,
+        doc='Use of buy commodity source (MW) per timestep')
+
+    cap_pro = m.add_variable('cap_pro', pro_tuples, ['sit', 'pro'],
+                             doc='Total process capacity (MW)')
+    cap_pro_new = m.add_variable('cap_pro_new', pro_tuples, ['sit', 'pro'],
+                                 doc='New process capacity (MW)')
+    tau_pro = m.add_variable('tau_pro', pro_tuples, ['t', 'sit', 'pro'], t,
+                             doc='Power flow (MW) through process')
+    e_pro_in = m.add_variable(
+        'e_pro_in', m.pro_input_tuples, pro_labels, tm,
+        report_keys=pro_com_tuples,
+        doc='Power flow of commodity into process (MW) per timestep')
+    e_pro_out = m.add_variable(
+        'e_pro_out', m.pro_output_tuples, pro_labels, tm,
+        report_keys=pro_com_tuples,
+        doc='Power flow out of process (MW) per timestep')
+    cap_online = m.add_variable(
+        'cap_online', pro_partial_tuples, ['t', 'sit', 'pro'], t,
+        doc='Online capacity (MW) of process per timestep')
+    startup_pro = m.add_variable(
+        'startup_pro', pro_partial_tuples, ['t', 'sit', 'pro'], tm,
+        doc='Started capacity (MW) of process per timestep')
+
+    cap_tra = m.add_variable('cap_tra', tra_tuples, tra_labels[1:],
+                             doc='Total transmission capacity (MW)')
+    cap_tra_new = m.add_variable('cap_tra_new', tra_tuples, tra_labels[1:],
+                                 doc='New transmission capacity (MW)')
+    e_tra_in = m.add_variable(
+        'e_tra_in', tra_tuples, tra_labels, tm,
+        doc='Power flow into transmission line (MW) per timestep')
+    e_tra_out = m.add_variable(
+        'e_tra_out', tra_tuples, tra_labels, tm,
+        doc='Power flow out of transmission line (MW) per timestep')
+
+    cap_sto_c = m.add_variable('cap_sto_c', sto_tuples, sto_labels[1:],
+                               doc='Total storage size (MWh)')
+    cap_sto_c_new = m.add_variable('cap_sto_c_new', sto_tuples,
+                                   sto_labels[1:],
+                                   doc='New storage size (MWh)')
+    cap_sto_p = m.add_variable('cap_sto_p', sto_tuples, sto_labels[1:],
+                               doc='Total storage power (MW)')
+    cap_sto_p_new = m.add_variable('cap_sto_p_new', sto_tuples,
+                                   sto_labels[1:],
+                                   doc='New  storage power (MW)')
+    e_sto_in = m.add_variable('e_sto_in', sto_tuples, sto_labels, tm,
+                              doc='Power flow into storage (MW) per timestep')
+    e_sto_out = m.add_variable(
+        'e_sto_out', sto_tuples, sto_labels, tm,
+        doc='Power flow out of storage (MW) per timestep')
+    e_sto_con = m.add_variable(
+        'e_sto_con', sto_tuples, sto_labels, t,
+        doc='Energy content of storage (MWh) in timestep')
+
+    dsm_up = m.add_variable('dsm_up', dsm_site_tuples, ['t', 'sit', 'com'],
+                            tm, doc='DSM upshift')
+    if m.dsm_formulation == 'cumulative':
+        dsm_down = m.add_variable('dsm_down', dsm_site_tuples,
+                                  ['t', 'sit', 'com'], tm,
+                                  doc='DSM downshift')
+        dsm_up_cum = m.add_variable(
+            'dsm_up_cum', dsm_site_tuples, ['t', 'sit', 'com'], tm,
+            doc='Cumulative DSM upshift (times efficiency) until timestep')
+        dsm_down_cum = m.add_variable(
+            'dsm_down_cum', dsm_site_tuples, ['t', 'sit', 'com'], tm,
+            doc='Cumulative DSM downshift until timestep')
+    else:
+        dsm_down_tuples = dsm_down_time_tuples(tm, dsm_site_tuples, m)
+        dsm_down = m.add_variable('dsm_down', dsm_down_tuples,
+                                  ['t', 't_', 'sit', 'com'],
+                                  doc='DSM downshift')
+
+    # commodity balance incidence, like commodity_incidence: flows entering
+    # each (site, commodity) balance as (variable block, key, sign)
+    incidence = {}
+    for k, (sit, pro, com) in enumerate(m.pro_input_tuples):
+        incidence.setdefault((sit, com), []).append((e_pro_in, k, 1))
+    for k, (sit, pro, com) in enumerate(m.pro_output_tuples):
+        incidence.setdefault((sit, com), []).append((e_pro_out, k, -1))
+    for k, (sin, sout, tra, com) in enumerate(tra_tuples):
+        incidence.setdefault((sin, com), []).append((e_tra_in, k, 1))
+        incidence.setdefault((sout, com), []).append((e_tra_out, k, -1))
+    for k, (sit, sto, com) in enumerate(sto_tuples):
+        incidence.setdefault((sit, com), []).append((e_sto_in, k, 1))
+        incidence.setdefault((sit, com), []).append((e_sto_out, k, -1))
+
+    def add_balance(con, entries, times=None):
+        # add factor * commodity_balance(sit, com) to row con_k for all
+        # (con_k, (sit, com), factor) entries
+        terms = OrderedDict()
+        for con_k, sit_com, factor in entries:
+            for var, var_k, sign in incidence.get(sit_com, ()):
+                terms.setdefault(var.name, (var, [], [], []))
+                terms[var.name][1].append(con_k)
+                terms[var.name][2].append(var_k)
+                terms[var.name][3].append(sign * factor)
+        for var, con_k, var_k, coef in terms.values():
+            m.link(con, con_k, var, var_k, np.array(coef), times=times)
+
+    def downshift_terms(con, con_k, factor=1.0):
+        # add factor * total DSM downshift (dsm_downshift) to rows
+        # con[tm, con_k] of a constraint over tm x dsm_site_tuples
+        if m.dsm_formulation == 'cumulative':
+            m.link(con, con_k, dsm_down, con_k, factor)
+        elif dsm_down.size:
+            d = con.k([key[2:] for key in dsm_down.keys])
+            tt = np.array([key[1] for key in dsm_down.keys])
+            m.add_coefficients(con.at(np.asarray(con_k)[d], tt),
+                               dsm_down.at(np.arange(dsm_down.size)),
+                               factor)
+
+    # Equations
+    # =========
+    # rows are written as lhs - rhs of the corresponding create_model rule,
+    # constant terms are moved to the bounds
+
+    # commodity
+    vertex = np.arange(len(com_vertex_tuples))
+    demand = np.zeros((len(tm), len(com_vertex_tuples)))
+    values_d, rows_d, cols_d = demand_ts
+    for k, (sit, com, com_type) in enumerate(com_vertex_tuples):
+        if com in com_demand and (sit, com) in cols_d:
+            for i, step in enumerate(tm):
+                if step in rows_d:
+                    demand[i, k] = values_d[rows_d[step], cols_d[sit, com]]
+    res_vertex = m.add_constraint(
+        'res_vertex', com_vertex_tuples, com_labels, tm, demand, demand,
+        doc='storage + transmission + process + source + buy - sell == demand')
+    add_balance(res_vertex, [(k, (sit, com), -1)
+                             for k, (sit, com, _) in
+                             enumerate(com_vertex_tuples)])
+    for var, coef in [(e_co_stock, 1), (e_co_sell, -1), (e_co_buy, 1)]:
+        keys = [key for key in com_vertex_tuples if key in var.key_pos]
+        m.link(res_vertex, res_vertex.k(keys), var, var.k(keys), coef)
+    keys = [key for key in com_vertex_tuples if key[:2] in dsm_up.key_pos]
+    if keys:
+        con_k = res_vertex.k(keys)
+        dsm_k = dsm_up.k([key[:2] for key in keys])
+        m.link(res_vertex, con_k, dsm_up, dsm_k, -1)
+        # downshift: map dsm_site positions to vertex rows
+        vertex_of = np.full(len(dsm_site_tuples), -1)
+        vertex_of[dsm_k] = con_k
+        if m.dsm_formulation == 'cumulative':
+            m.link(res_vertex, con_k, dsm_down, dsm_k, 1)
+        elif dsm_down.size:
+            d = dsm_up.k([key[2:] for key in dsm_down.keys])
+            tt = np.array([key[1] for key in dsm_down.keys])
+            rows = np.where(vertex_of[d] >= 0,
+                            res_vertex.at(vertex_of[d], tt), -1)
+            m.add_coefficients(rows, dsm_down.at(np.arange(dsm_down.size)))
+
+    for name, var, tuples, step_doc, total_doc in [
+            ('stock', e_co_stock, com_stock_tuples,
+             'stock commodity input per step <= commodity.maxperstep',
+             'total stock commodity input <= commodity.max'),
+            ('sell', e_co_sell, com_sell_tuples,
+             'sell commodity output per step <= commodity.maxperstep',
+             'total sell commodity output <= commodity.max'),
+            ('buy', e_co_buy, com_buy_tuples,
+             'buy commodity output per step <= commodity.maxperstep',
+             'total buy commodity output <= commodity.max')]:
+        k = np.arange(len(tuples))
+        con = m.add_constraint(
+            'res_{}_step'.format(name), tuples, com_labels, tm,
+            up=values(m.commodity_dict, 'maxperstep', tuples),
+            doc=step_doc)
+        m.link(con, k, var, k)
+        con = m.add_constraint(
+            'res_{}_total'.format(name), tuples, com_labels[1:],
+            up=values(m.commodity_dict, 'max', tuples), doc=total_doc)
+        m.link(con, k, var, k, dt * weight)
+
+    res_env_step = m.add_constraint(
+        'res_env_step', com_env_tuples, com_labels, tm,
+        up=values(m.commodity_dict, 'maxperstep', com_env_tuples),
+        doc='environmental output per step <= commodity.maxperstep')
+    add_balance(res_env_step, [(k, (sit, com), -1)
+                               for k, (sit, com, _) in
+                               enumerate(com_env_tuples)])
+    res_env_total = m.add_constraint(
+        'res_env_total', com_env_tuples, com_labels[1:],
+        up=values(m.commodity_dict, 'max', com_env_tuples),
+        doc='total environmental commodity output <= commodity.max')
+    add_balance(res_env_total, [(k, (sit, com), -dt * weight)
+                                for k, (sit, com, _) in
+                                enumerate(com_env_tuples)])
+
+    # process
+    pro = np.arange(len(pro_tuples))
+    inst_cap = values(m.process_dict, 'inst-cap', pro_tuples)
+    con = m.add_constraint(
+        'def_process_capacity', pro_tuples, ['sit', 'pro'],
+        lo=inst_cap, up=inst_cap,
+        doc='total process capacity = inst-cap + new capacity')
+    m.link(con, pro, cap_pro, pro, 1)
+    m.link(con, pro, cap_pro_new, pro, -1)
+
+    partial_input = set(pro_partial_input_tuples)
+    tuples = [c for c in m.pro_input_tuples if c not in partial_input]
+    con = m.add_constraint(
+        'def_process_input', tuples, pro_labels, tm, 0, 0,
+        doc='process input = process throughput * input ratio')
+    k = np.arange(len(tuples))
+    m.link(con, k, e_pro_in, e_pro_in.k(tuples), 1)
+    m.link(con, k, tau_pro, tau_pro.k([c[:2] for c in tuples]),
+           -np.array([r_in_dict[c[1:]] for c in tuples]))
+
+    tuples = m.pro_output_tuples
+    con = m.add_constraint(
+        'def_process_output', tuples, pro_labels, tm, 0, 0,
+        doc='process output = process throughput * output ratio')
+    k = np.arange(len(tuples))
+    m.link(con, k, e_pro_out, k, 1)
+    m.link(con, k, tau_pro, tau_pro.k([c[:2] for c in tuples]),
+           -np.array([r_out_dict[c[1:]] for c in tuples]))
+
+    tuples = pro_supim_input_tuples
+    con = m.add_constraint(
+        'def_intermittent_supply', tuples, pro_labels, tm, up=0,
+        doc='process output = process capacity * supim timeseries')
+    k = np.arange(len(tuples))
+    supim = np.zeros((len(tm), len(tuples)))
+    values_s, rows_s, cols_s = supim_ts
+    for j, (sit, p, com) in enumerate(tuples):
+        supim[:, j] = values_s[[rows_s[step] for step in tm],
+                               cols_s[sit, com]]
+    m.link(con, k, e_pro_in, e_pro_in.k(tuples), 1)
+    m.link(con, k, cap_pro, cap_pro.k([c[:2] for c in tuples]), -supim)
+
+    con = m.add_constraint(
+        'res_process_throughput_by_capacity', pro_tuples,
+        ['t', 'sit', 'pro'], tm, up=0,
+        doc='process throughput <= total process capacity')
+    m.link(con, pro, tau_pro, pro, 1)
+    m.link(con, pro, cap_pro, pro, -1)
+
+    tuples = pro_maxgrad_tuples
+    k = np.arange(len(tuples))
+    max_grad = values(m.process_dict, 'max-grad', tuples) * dt
+    for name, sense, doc in [
+            ('lower', -1,
+             'throughput may not decrease faster than maximal gradient'),
+            ('upper', 1,
+             'throughput may not increase faster than maximal gradient')]:
+        con = m.add_constraint(
+            'res_process_maxgrad_' + name, tuples, ['t', 'sit', 'pro'], tm,
+            lo=0 if sense > 0 else -np.inf, up=0 if sense < 0 else np.inf,
+            doc=doc)
+        m.link(con, k, tau_pro, tau_pro.k(tuples), 1, shift=-1)
+        m.link(con, k, cap_pro, cap_pro.k(tuples), sense * max_grad)
+        m.link(con, k, tau_pro, tau_pro.k(tuples), -1)
+
+    con = m.add_constraint(
+        'res_process_capacity', pro_tuples, ['sit', 'pro'],
+        lo=values(m.process_dict, 'cap-lo', pro_tuples),
+        up=values(m.process_dict, 'cap-up', pro_tuples),
+        doc='process.cap-lo <= total process capacity <= process.cap-up')
+    m.link(con, pro, cap_pro, pro, 1)
+
+    area_sites = [sit for sit in site.index
+                  if m.site_dict['area'][sit] >= 0 and
+                  sum(m.process_dict['area-per-cap'][sit, p]
+                      for (s, p) in pro_tuples if s == sit and
+                      m.process_dict['area-per-cap'][sit, p] >= 0) > 0]
+    con = m.add_constraint(
+        'res_area', area_sites, ['sit'],
+        up=values(m.site_dict, 'area', area_sites),
+        doc='used process area <= total process area')
+    tuples = [(sit, p) for (sit, p) in pro_tuples if sit in area_sites and
+              m.process_dict['area-per-cap'][sit, p] >= 0]
+    m.link(con, con.k([c[0] for c in tuples]), cap_pro, cap_pro.k(tuples),
+           values(m.process_dict, 'area-per-cap', tuples))
+
+    tuples = [c for c in m.pro_buy_input_tuples
+              if c[1] in m.sell_buy_pairs]
+    con = m.add_constraint(
+        'res_sell_buy_symmetry', tuples, ['sit', 'pro', 'com'], lo=0, up=0,
+        doc='power connection capacity must be symmetric in both directions')
+    k = np.arange(len(tuples))
+    m.link(con, k, cap_pro, cap_pro.k([c[:2] for c in tuples]), 1)
+    m.link(con, k, cap_pro,
+           cap_pro.k([(c[0], m.sell_buy_pairs[c[1]]) for c in tuples]), -1)
+
+    partial = np.arange(len(pro_partial_tuples))
+    cap_pro_k = cap_pro.k(pro_partial_tuples)
+    tau_pro_k = tau_pro.k(pro_partial_tuples)
+    con = m.add_constraint(
+        'res_throughput_by_online_capacity_min', pro_partial_tuples,
+        ['t', 'sit', 'pro'], tm, lo=0,
+        doc='cap_online * min-fraction <= tau_pro')
+    m.link(con, partial, tau_pro, tau_pro_k, 1)
+    m.link(con, partial, cap_online, partial,
+           -values(m.process_dict, 'min-fraction', pro_partial_tuples))
+    con = m.add_constraint(
+        'res_throughput_by_online_capacity_max', pro_partial_tuples,
+        ['t', 'sit', 'pro'], tm, up=0, doc='tau_pro <= cap_online')
+    m.link(con, partial, tau_pro, tau_pro_k, 1)
+    m.link(con, partial, cap_online, partial, -1)
+
+    tuples = pro_partial_input_tuples
+    R = np.array([r_in_dict[c[1:]] for c in tuples])
+    r = np.array([r_in_min_fraction_dict[c[1:]] for c in tuples])
+    min_fraction = values(m.process_dict, 'min-fraction',
+                          [c[:2] for c in tuples])
+    con = m.add_constraint(
+        'def_partial_process_input', tuples, pro_labels, tm, 0, 0,
+        doc='e_pro_in = '
+            ' cap_online * min_fraction * (r - R) / (1 - min_fraction)'
+            ' + tau_pro * (R - min_fraction * r) / (1 - min_fraction)')
+    k = np.arange(len(tuples))
+    m.link(con, k, e_pro_in, e_pro_in.k(tuples), 1)
+    m.link(con, k, cap_online, cap_online.k([c[:2] for c in tuples]),
+           -min_fraction * (r - R) / (1 - min_fraction))
+    m.link(con, k, tau_pro, tau_pro.k([c[:2] for c in tuples]),
+           -(R - min_fraction * r) / (1 - min_fraction))
+
+    con = m.add_constraint(
+        'res_cap_online_by_cap_pro', pro_partial_tuples,
+        ['t', 'sit', 'pro'], tm, up=0,
+        doc='online capacity <= process capacity')
+    m.link(con, partial, cap_online, partial, 1)
+    m.link(con, partial, cap_pro, cap_pro_k, -1)
+    con = m.add_constraint(
+        'def_startup_capacity', pro_partial_tuples, ['t', 'sit', 'pro'], tm,
+        lo=0, doc='startup_capacity[t] >= cap_online[t] - cap_online[t-1]')
+    m.link(con, partial, startup_pro, partial, 1)
+    m.link(con, partial, cap_online, partial, -1)
+    m.link(con, partial, cap_online, partial, 1, shift=-1)
+
+    # transmission
+    tra = np.arange(len(tra_tuples))
+    inst_cap = values(m.transmission_dict, 'inst-cap', tra_tuples)
+    con = m.add_constraint(
+        'def_transmission_capacity', tra_tuples, tra_labels[1:],
+        lo=inst_cap, up=inst_cap,
+        doc='total transmission capacity = inst-cap + new capacity')
+    m.link(con, tra, cap_tra, tra, 1)
+    m.link(con, tra, cap_tra_new, tra, -1)
+    con = m.add_constraint(
+        'def_transmission_output', tra_tuples, tra_labels, tm, 0, 0,
+        doc='transmission output = transmission input * efficiency')
+    m.link(con, tra, e_tra_out, tra, 1)
+    m.link(con, tra, e_tra_in, tra,
+           -values(m.transmission_dict, 'eff', tra_tuples))
+    con = m.add_constraint(
+        'res_transmission_input_by_capacity', tra_tuples, tra_labels, tm,
+        up=0, doc='transmission input <= total transmission capacity')
+    m.link(con, tra, e_tra_in, tra, 1)
+    m.link(con, tra, cap_tra, tra, -1)
+    con = m.add_constraint(
+        'res_transmission_capacity', tra_tuples, tra_labels[1:],
+        lo=values(m.transmission_dict, 'cap-lo', tra_tuples),
+        up=values(m.transmission_dict, 'cap-up', tra_tuples),
+        doc='transmission.cap-lo <= total transmission capacity <= '
+            'transmission.cap-up')
+    m.link(con, tra, cap_tra, tra, 1)
+    con = m.add_constraint(
+        'res_transmission_symmetry', tra_tuples, tra_labels[1:], lo=0, up=0,
+        doc='total transmission capacity must be symmetric in both directions')
+    m.link(con, tra, cap_tra, tra, 1)
+    m.link(con, tra, cap_tra,
+           cap_tra.k([(sout, sin, tr, com)
+                      for (sin, sout, tr, com) in tra_tuples]), -1)
+
+    # storage
+    sto = np.arange(len(sto_tuples))
+    con = m.add_constraint(
+        'def_storage_state', sto_tuples, sto_labels, tm, 0, 0,
+        doc='storage[t] = storage[t-1] + input - output')
+    m.link(con, sto, e_sto_con, sto, 1)
+    m.link(con, sto, e_sto_con, sto, -1, shift=-1)
+    m.link(con, sto, e_sto_in, sto,
+           -values(m.storage_dict, 'eff-in', sto_tuples) * dt)
+    m.link(con, sto, e_sto_out, sto,
+           1 / values(m.storage_dict, 'eff-out', sto_tuples) * dt)
+    for name, cap, cap_new, inst, doc in [
+            ('power', cap_sto_p, cap_sto_p_new, 'inst-cap-p',
+             'storage power = inst-cap + new power'),
+            ('capacity', cap_sto_c, cap_sto_c_new, 'inst-cap-c',
+             'storage capacity = inst-cap + new capacity')]:
+        inst_cap = values(m.storage_dict, inst, sto_tuples)
+        con = m.add_constraint('def_storage_' + name, sto_tuples,
+                               sto_labels[1:], lo=inst_cap, up=inst_cap,
+                               doc=doc)
+        m.link(con, sto, cap, sto, 1)
+        m.link(con, sto, cap_new, sto, -1)
+    for name, var, cap, times, doc in [
+            ('input_by_power', e_sto_in, cap_sto_p, tm,
+             'storage input <= storage power'),
+            ('output_by_power', e_sto_out, cap_sto_p, tm,
+             'storage output <= storage power'),
+            ('state_by_capacity', e_sto_con, cap_sto_c, t,
+             'storage content <= storage capacity')]:
+        con = m.add_constraint('res_storage_' + name, sto_tuples,
+                               sto_labels, times, up=0, doc=doc)
+        m.link(con, sto, var, sto, 1)
+        m.link(con, sto, cap, sto, -1)
+    for name, cap, lo, up, doc in [
+            ('power', cap_sto_p, 'cap-lo-p', 'cap-up-p',
+             'storage.cap-lo-p <= storage power <= storage.cap-up-p'),
+            ('capacity', cap_sto_c, 'cap-lo-c', 'cap-up-c',
+             'storage.cap-lo-c <= storage capacity <= storage.cap-up-c')]:
+        con = m.add_constraint('res_storage_' + name, sto_tuples,
+                               sto_labels[1:],
+                               lo=values(m.storage_dict, lo, sto_tuples),
+                               up=values(m.storage_dict, up, sto_tuples),
+                               doc=doc)
+        m.link(con, sto, cap, sto, 1)
+    final_up = np.array([[0 if step == timesteps[0] else np.inf]
+                         for step in t_init_final])
+    con = m.add_constraint(
+        'res_initial_and_final_storage_state', sto_tuples, sto_labels,
+        t_init_final, lo=0, up=final_up,
+        doc='storage content initial == and final >= storage.init * capacity')
+    m.link(con, sto, e_sto_con, sto, 1)
+    m.link(con, sto, cap_sto_c, sto,
+           -values(m.storage_dict, 'init', sto_tuples))
+
+    # costs
+    def_costs = m.add_constraint('def_costs', cost_types, ['cost_type'],
+                                 lo=0, up=0,
+                                 doc='main cost function by cost type')
+    m.link(def_costs, np.arange(len(cost_types)), costs,
+           np.arange(len(cost_types)), 1)
+
+    def cost(cost_type, var, coef, times=None):
+        # add costs[cost_type] == ... + sum(var * coef) term
+        k = np.arange(len(var.keys))
+        m.link(def_costs, np.full(len(k), cost_types.index(cost_type)),
+               var, k, -np.asarray(coef), times=times)
+
+    cost('Invest', cap_pro_new,
+         values(m.process_dict, 'inv-cost', pro_tuples) *
+         annuity(process, pro_tuples))
+    cost('Invest', cap_tra_new,
+         values(m.transmission_dict, 'inv-cost', tra_tuples) *
+         annuity(transmission, tra_tuples))
+    cost('Invest', cap_sto_p_new,
+         values(m.storage_dict, 'inv-cost-p', sto_tuples) *
+         annuity(storage, sto_tuples))
+    cost('Invest', cap_sto_c_new,
+         values(m.storage_dict, 'inv-cost-c', sto_tuples) *
+         annuity(storage, sto_tuples))
+    cost('Fixed', cap_pro, values(m.process_dict, 'fix-cost', pro_tuples))
+    cost('Fixed', cap_tra,
+         values(m.transmission_dict, 'fix-cost', tra_tuples))
+    cost('Fixed', cap_sto_p,
+         values(m.storage_dict, 'fix-cost-p', sto_tuples))
+    cost('Fixed', cap_sto_c,
+         values(m.storage_dict, 'fix-cost-c', sto_tuples))
+    cost('Variable', tau_pro,
+         values(m.process_dict, 'var-cost', pro_tuples) * dt * weight, tm)
+    cost('Variable', e_tra_in,
+         values(m.transmission_dict, 'var-cost', tra_tuples) * dt * weight)
+    cost('Variable', e_sto_con,
+         values(m.storage_dict, 'var-cost-c', sto_tuples) * weight, tm)
+    for var in [e_sto_in, e_sto_out]:
+        cost('Variable', var,
+             values(m.storage_dict, 'var-cost-p', sto_tuples) * dt * weight)
+    cost('Fuel', e_co_stock,
+         values(m.commodity_dict, 'price', com_stock_tuples) * dt * weight)
+    cost('Revenue', e_co_sell,
+         -com_prices[:, [price_cols[c] for c in com_sell_tuples]] *
+         dt * weight)
+    cost('Purchase', e_co_buy,
+         com_prices[:, [price_cols[c] for c in com_buy_tuples]] *
+         dt * weight)
+    cost('Startup', startup_pro,
+         values(m.process_dict, 'startup-cost', pro_partial_tuples) *
+         dt * weight)
+    add_balance(def_costs,
+                [(cost_types.index('Environmental'), (sit, com),
+                  m.commodity_dict['price'][sit, com, com_type] * dt * weight)
+                 for (sit, com, com_type) in com_env_tuples],
+                times=tm)
+    m.add_objective(costs, np.arange(len(cost_types)))
+
+    # demand side management
+    dsm = np.arange(len(dsm_site_tuples))
+    dsm_labels = ['t', 'sit', 'com']
+    if m.dsm_formulation == 'cumulative':
+        con = m.add_constraint(
+            'def_dsm_up_cumulative', dsm_site_tuples, dsm_labels, tm, 0, 0,
+            doc='DSMupcum[t] == DSMupcum[t-1] + DSMup[t] * efficiency n')
+        m.link(con, dsm, dsm_up_cum, dsm, 1)
+        m.link(con, dsm, dsm_up_cum, dsm, -1, shift=-1)
+        m.link(con, dsm, dsm_up, dsm,
+               -values(m.dsm_dict, 'eff', dsm_site_tuples))
+        con = m.add_constraint(
+            'def_dsm_down_cumulative', dsm_site_tuples, dsm_labels, tm, 0, 0,
+            doc='DSMdocum[t] == DSMdocum[t-1] + DSMdo[t]')
+        m.link(con, dsm, dsm_down_cum, dsm, 1)
+        m.link(con, dsm, dsm_down_cum, dsm, -1, shift=-1)
+        m.link(con, dsm, dsm_down, dsm, -1)
+
+        delayed = [(step, sit, com) for (sit, com) in dsm_site_tuples
+                   for step in tm
+                   if step - m.dsm_dict['delay'][sit, com] >= tm[0]]
+        d = dsm_up.k([key[1:] for key in delayed])
+        steps = np.array([key[0] for key in delayed])
+        delay = values(m.dsm_dict, 'delay', [key[1:] for key in delayed])
+        for name, later, earlier, doc in [
+                ('up', dsm_down_cum, dsm_up_cum,
+                 'DSMdocum[t] >= DSMupcum[t - delay]'),
+                ('down', dsm_up_cum, dsm_down_cum,
+                 'DSMupcum[t] >= DSMdocum[t - delay]')]:
+            con = m.add_constraint('res_dsm_delay_' + name, delayed,
+                                   dsm_labels, lo=0, doc=doc)
+            k = np.arange(len(delayed))
+            m.add_coefficients(con.at(k), later.at(d, steps), 1)
+            m.add_coefficients(con.at(k), earlier.at(d, steps - delay), -1)
+
+        con = m.add_constraint(
+            'res_dsm_balance', dsm_site_tuples, ['sit', 'com'], lo=0, up=0,
+            doc='DSMupcum[last] == DSMdocum[last]')
+        m.link(con, dsm, dsm_up_cum, dsm, 1, times=tm[-1:])
+        m.link(con, dsm, dsm_down_cum, dsm, -1, times=tm[-1:])
+    else:
+        con = m.add_constraint(
+            'def_dsm_variables', dsm_site_tuples, dsm_labels, tm, 0, 0,
+            doc='DSMup * efficiency factor n == DSMdo')
+        if dsm_down.size:
+            d = con.k([key[2:] for key in dsm_down.keys])
+            steps = np.array([key[0] for key in dsm_down.keys])
+            m.add_coefficients(con.at(d, steps),
+                               dsm_down.at(np.arange(dsm_down.size)), 1)
+        m.link(con, dsm, dsm_up, dsm,
+               -values(m.dsm_dict, 'eff', dsm_site_tuples))
+
+    cap_max_up = values(m.dsm_dict, 'cap-max-up', dsm_site_tuples)
+    cap_max_do = values(m.dsm_dict, 'cap-max-do', dsm_site_tuples)
+    con = m.add_constraint(
+        'res_dsm_upward', dsm_site_tuples, dsm_labels, tm,
+        up=cap_max_up.astype(int),
+        doc='DSMup <= Cup (threshold capacity of DSMup)')
+    m.link(con, dsm, dsm_up, dsm, 1)
+    con = m.add_constraint(
+        'res_dsm_downward', dsm_site_tuples, dsm_labels, tm, up=cap_max_do,
+        doc='DSMdo <= Cdo (threshold capacity of DSMdo)')
+    downshift_terms(con, dsm)
+    con = m.add_constraint(
+        'res_dsm_maximum', dsm_site_tuples, dsm_labels, tm,
+        up=np.maximum(cap_max_up, cap_max_do),
+        doc='DSMup + DSMdo <= max(Cup,Cdo)')
+    m.link(con, dsm, dsm_up, dsm, 1)
+    downshift_terms(con, dsm)
+    con = m.add_constraint(
+        'res_dsm_recovery', dsm_site_tuples, dsm_labels, tm,
+        up=cap_max_up * values(m.dsm_dict, 'delay', dsm_site_tuples),
+        doc='DSMup(t, t + recovery time R) <= Cup * delay time L')
+    for k, (sit, com) in enumerate(dsm_site_tuples):
+        for shift in range(int(m.dsm_dict['recov'][sit, com])):
+            m.link(con, [k], dsm_up, [k], 1, shift=shift)
+
+    # possibly: add hack features
+    if 'hacks' in data:
+        try:
+            global_co2_limit = data['hacks'].loc['Global CO2 limit', 'Value']
+        except KeyError:
+            global_co2_limit = float('inf')
+        if not math.isinf(global_co2_limit):
+            con = m.add_constraint(
+                'res_global_co2_limit', [None], ['None'],
+                up=global_co2_limit,
+                doc='total co2 commodity output <= hacks.Glocal CO2 limit')
+            add_balance(con, [(0, (sit, 'CO2'), -dt * weight)
+                              for sit in site.index], times=tm)
+    return m
+
+
+def compare_backends(data, timesteps, solver, rtol=1e-6, **kwargs):
+    """ Solve an instance with create_model and create_sparse_model and
+    check that both backends reach the same objective value.
+
+    Meant for small instances (e.g. a few days of timesteps), as a check of
+    the sparse formulation after changes to either backend.
+
+    Args:
+        data: input data dict as returned by read_excel
+        timesteps: list of timesteps
+        solver: a Pyomo solver object for the Pyomo model
+        rtol: relative tolerance of the objective values
+        **kwargs: options for both backends, e.g. dt or dsm_formulation
+
+    Returns:
+        a (pyomo_objective, sparse_objective) tuple
+
+    Raises:
+        RuntimeError: if a backend does not solve to optimality or the
+            objective values differ by more than rtol
+    """
+    prob = create_model(data, timesteps, **kwargs)
+    check_optimal(solver.solve(prob), 'Pyomo model')
+    pyomo_objective = pyomo.value(prob.obj)
+
+    sparse = create_sparse_model(data, timesteps, **kwargs)
+    solution = sparse.solve()
+    if solution.status != 0:
+        raise RuntimeError("Sparse model not solved to optimality: "
+                           "{}".format(solution.message))
+    sparse_objective = solution.fun
+
+    if (abs(pyomo_objective - sparse_objective) >
+            rtol * max(abs(pyomo_objective), abs(sparse_objective))):
+        raise RuntimeError("Objective of the Pyomo model ({}) and the sparse "
+                           "model ({}) differ".format(pyomo_objective,
+                                                      sparse_objective))
+    return pyomo_objective, sparse_objective